@@ -16,11 +16,15 @@ for vendor_path in glob.glob(os.path.join(_BASE_PATH, 'vendor', '*')):
 
 from plasma.controller.base_controller import BaseController
 from plasma.controller.osc_controller import OSCController
+from plasma.engine.process_engine import ProcessEngine
 from plasma.interrupter.simple_interrupter import SimpleInterrupter
-from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.modulator.modulation_matrix import ModulationMatrix
+from plasma.modulator.wavetable_modulator import WavetableModulator
 from plasma.pwm.mock_pwm import MockPWM
+from plasma.pwm.quantization import HardwarePWMQuantizer
 from plasma.utils.runtime import (
-    cpu_serial, parse_bind_host, set_up_logging)
+    cpu_serial, parse_bind_host, parse_cpu_list, set_up_logging,
+    set_up_timing_thread)
 try:
     from plasma.pwm.pi_pwm import PiHardwarePWM
 except ImportError as e:
@@ -62,33 +66,137 @@ def configure_controller(config_file: str=_DEFAULT_CONFIG) \
     if not host:
         host = None
 
-    if config.getboolean(section, "mock"):
-        pwm = MockPWM()
+    # write_behind_frequency is optional; older configs write through.
+    if config.has_option(section, "write_behind_frequency"):
+        write_behind_frequency = config.getfloat(
+            section, "write_behind_frequency")
     else:
-        pwm = PiHardwarePWM(pin, host)
+        write_behind_frequency = 0.0
+
+    # pwm_clock is optional; without it the output is not modelled.
+    pwm_clock = None
+    if config.has_option(section, "pwm_clock"):
+        pwm_clock = config.getint(section, "pwm_clock") or None
+
+    # The realtime options are optional; older configs leave the timing
+    # thread to the default scheduler.
+    realtime_cpus = None
+    if config.has_option(section, "realtime_cpus"):
+        realtime_cpus = parse_cpu_list(config.get(section, "realtime_cpus"))
+    realtime_policy = 'other'
+    if config.has_option(section, "realtime_policy"):
+        realtime_policy = config.get(section, "realtime_policy")
+    realtime_priority = 50
+    if config.has_option(section, "realtime_priority"):
+        realtime_priority = config.getint(section, "realtime_priority")
 
-    pwm.frequency = config.getfloat(section, "center_frequency")
-    pwm.duty_cycle = config.getfloat(section, "duty_cycle")
+    if config.getboolean(section, "mock"):
+        pwm_factory, pwm_args, pwm_kwargs = MockPWM, (), {}
+    else:
+        pwm_factory, pwm_args = PiHardwarePWM, (pin, host)
+        pwm_kwargs = {'write_behind_frequency': write_behind_frequency,
+                      'pwm_clock': pwm_clock}
 
+    center_frequency = config.getfloat(section, "center_frequency")
     interrupter_frequency = 100.0
     interrupter_duty_cycle = 1.0
-    interrupter = SimpleInterrupter(pwm,
-                                    interrupter_frequency,
-                                    interrupter_duty_cycle)
-
     modulator_frequency = 0.0
     modulator_spread = 1.0
-    modulator = CallbackModulator(
-        lambda f: pwm.set_frequency(f),
-        frequency=modulator_frequency,
-        spread=modulator_spread,
-        center=pwm.frequency,
-        update_frequency=40,
-    )
+    # waveform is optional; older configs modulate with a sine.
+    waveform = 'sine'
+    if config.has_option(section, "waveform"):
+        waveform = config.get(section, "waveform")
+    # The dead band defaults to one hardware step when that is modelled
+    dead_band = 0.0
+    if pwm_clock:
+        dead_band = HardwarePWMQuantizer(pwm_clock).resolution
+    if (config.has_option(section, "modulator_dead_band")
+            and config.get(section, "modulator_dead_band")):
+        dead_band = config.getfloat(section, "modulator_dead_band")
+    keepalive = 1.0
+    if config.has_option(section, "modulator_keepalive"):
+        keepalive = config.getfloat(section, "modulator_keepalive")
+    # modulator_render_ahead is optional; older configs compute FM values
+    # when they are due.
+    render_ahead = 0.0
+    if config.has_option(section, "modulator_render_ahead"):
+        render_ahead = config.getfloat(section, "modulator_render_ahead")
+
+    # engine_process is optional; older configs time everything here.
+    if (config.has_option(section, "engine_process")
+            and config.getboolean(section, "engine_process")):
+        # The engine closes itself when this process exits
+        engine = ProcessEngine(
+            pwm_factory, pwm_args, pwm_kwargs,
+            interrupter_frequency=interrupter_frequency,
+            interrupter_duty_cycle=interrupter_duty_cycle,
+            modulator_frequency=modulator_frequency,
+            modulator_spread=modulator_spread,
+            modulator_center=center_frequency,
+            modulator_waveform=waveform,
+            modulator_dead_band=dead_band,
+            modulator_keepalive=keepalive,
+            modulator_render_ahead=render_ahead,
+            realtime_cpus=realtime_cpus,
+            realtime_policy=realtime_policy,
+            realtime_priority=realtime_priority)
+        pwm = engine.pwm
+        interrupter = engine.interrupter
+        modulator = engine.modulator
+        # The engine has no modulation matrix
+        matrix = None
+    else:
+        set_up_timing_thread(
+            realtime_cpus, realtime_policy, realtime_priority)
+        pwm = pwm_factory(*pwm_args, **pwm_kwargs)
+        interrupter = SimpleInterrupter(pwm,
+                                        interrupter_frequency,
+                                        interrupter_duty_cycle)
+        modulator = WavetableModulator(
+            pwm.set_frequency_deferred,
+            frequency=modulator_frequency,
+            spread=modulator_spread,
+            center=center_frequency,
+            update_frequency=40,
+            waveform=waveform,
+            dead_band=dead_band,
+            keepalive=keepalive,
+            render_ahead=render_ahead,
+        )
+        matrix = ModulationMatrix(pwm, interrupter)
+
+    pwm.frequency = center_frequency
+    pwm.duty_cycle = config.getfloat(section, "duty_cycle")
 
     fine_spread = config.getfloat(section, "frequency_spread")
     osc_bind = config.get(section, "osc_bind")
     osc_roots = config.get(section, "osc_roots")
+    # osc_server and its settings are optional; older configs handle each
+    # datagram on a new thread.
+    osc_server = 'threading'
+    if config.has_option(section, "osc_server"):
+        osc_server = config.get(section, "osc_server")
+    osc_workers = 0
+    if config.has_option(section, "osc_workers"):
+        osc_workers = config.getint(section, "osc_workers")
+    osc_receive_buffer = None
+    if (config.has_option(section, "osc_receive_buffer")
+            and config.get(section, "osc_receive_buffer")):
+        osc_receive_buffer = config.getint(section, "osc_receive_buffer")
+    osc_late_tolerance = None
+    if (config.has_option(section, "osc_late_tolerance")
+            and config.get(section, "osc_late_tolerance")):
+        osc_late_tolerance = config.getfloat(section, "osc_late_tolerance")
+    # osc_file_directory is optional; older configs allow only built-in
+    # waveforms over OSC.
+    osc_file_directory = None
+    if config.has_option(section, "osc_file_directory"):
+        osc_file_directory = config.get(section, "osc_file_directory") or None
+    # osc_apply_frequency is optional; older configs apply each message as
+    # it arrives.
+    osc_apply_frequency = 0.0
+    if config.has_option(section, "osc_apply_frequency"):
+        osc_apply_frequency = config.getfloat(section, "osc_apply_frequency")
     host, port = parse_bind_host(osc_bind)
     controller = OSCController(
         host,
@@ -98,6 +206,13 @@ def configure_controller(config_file: str=_DEFAULT_CONFIG) \
         fine_spread=fine_spread,
         address_roots=osc_roots.split(','),
         immediate_on=True,
+        modulation_matrix=matrix,
+        server_type=osc_server,
+        workers=osc_workers,
+        receive_buffer_size=osc_receive_buffer,
+        apply_frequency=osc_apply_frequency,
+        late_tolerance=osc_late_tolerance,
+        file_directory=osc_file_directory,
     )
     return controller
 
@@ -283,6 +283,9 @@ custom_2                  User custom function 2
 
 Utility
 
+batch                     Send many commands in one socket write
+check_deferred            Collect errors from unacknowledged commands
+
 get_current_tick          Get current tick (microseconds)
 
 get_hardware_revision     Get hardware revision
@@ -393,6 +396,15 @@ EVENT_BSC = 31
 
 _SOCK_CMD_LEN = 16
 
+# Unacknowledged commands allowed before their replies are read
+_MAX_DEFERRED = 32
+
+# Precompiled wire formats
+_CMD = struct.Struct('IIII')     # cmd, p1, p2, p3 (extension length)
+_CMD_U32 = struct.Struct('IIIII') # as _CMD plus a single 32 bit extension
+_RES = struct.Struct('12xI')     # status or value in the last word
+_REPORT = struct.Struct('HHII')  # seq, flags, tick, level
+
 # pigpio command numbers
 
 _PI_CMD_MODES= 0
@@ -542,6 +554,22 @@ _PI_CMD_EVT  =116
 
 _PI_CMD_PROCU=117
 
+# Commands whose reply is only a status, so they may be batched
+
+_BATCHABLE = frozenset((
+   _PI_CMD_MODES, _PI_CMD_PUD, _PI_CMD_WRITE, _PI_CMD_PWM, _PI_CMD_SERVO,
+   _PI_CMD_WDOG, _PI_CMD_BC1, _PI_CMD_BC2, _PI_CMD_BS1, _PI_CMD_BS2,
+   _PI_CMD_NB, _PI_CMD_NC, _PI_CMD_TRIG, _PI_CMD_HC, _PI_CMD_HP,
+   _PI_CMD_FG, _PI_CMD_FN, _PI_CMD_PADS, _PI_CMD_EVT,
+   _PI_CMD_WVCLR, _PI_CMD_WVNEW, _PI_CMD_WVDEL, _PI_CMD_WVHLT,
+   _PI_CMD_WVCHA,
+   _PI_CMD_PROCR, _PI_CMD_PROCU, _PI_CMD_PROCS, _PI_CMD_PROCD,
+   _PI_CMD_I2CC, _PI_CMD_I2CWQ, _PI_CMD_I2CWS, _PI_CMD_I2CWB,
+   _PI_CMD_I2CWW, _PI_CMD_I2CWK, _PI_CMD_I2CWI, _PI_CMD_I2CWD,
+   _PI_CMD_SPIC, _PI_CMD_SERC, _PI_CMD_SERWB, _PI_CMD_SERW,
+   _PI_CMD_SLRO, _PI_CMD_SLRC, _PI_CMD_SLRI, _PI_CMD_FC, _PI_CMD_FW,
+))
+
 # pigpio error numbers
 
 _PI_INIT_FAILED     =-1
@@ -859,13 +887,35 @@ _except_3 = """
 Can't create callback thread.
 Perhaps too many simultaneous pigpio connections."""
 
+class _thread_batch(threading.local):
+   """
+   The batch, if any, open on the current thread.
+   """
+   batch = None
+
 class _socklock:
    """
    A class to store socket and lock.
+
+   Commands sent by a batch with wait=False are remembered in
+   pending until their replies are read, and any errors found
+   in those replies are kept in deferred.
+
+   The buffers are reused by every command sent while holding
+   the lock, so a command does not allocate.
    """
    def __init__(self):
       self.s = None
       self.l = threading.Lock()
+      self.t = _thread_batch()
+      self.pending = []
+      self.deferred = []
+      self.cmd = bytearray(_CMD_U32.size)
+      self.cmd16 = memoryview(self.cmd)[:_CMD.size]
+      self.ext = bytearray(256)
+      self.extv = memoryview(self.ext)
+      self.rx = bytearray(_SOCK_CMD_LEN * _MAX_DEFERRED)
+      self.rxv = memoryview(self.rx)
 
 class error(Exception):
    """pigpio module exception"""
@@ -975,6 +1025,86 @@ def _u2i(uint32):
          raise error(error_text(v))
    return v
 
+def _recv_into(s, view, count, got=0):
+   """
+   Fills the first count bytes of a memoryview from a socket,
+   of which got bytes have already been read.
+   """
+   if not got:
+      got = s.recv_into(view, count)
+   while got < count:
+      n = s.recv_into(view[got:], count - got)
+      if not n:
+         raise error("pigpio connection closed")
+      got += n
+
+def _recv_reply_nolock(sl):
+   """
+   Reads one command reply into sl.rx and returns its result.
+   The caller must hold sl.l.
+   """
+   got = sl.s.recv_into(sl.rxv, _SOCK_CMD_LEN)
+   if got < _SOCK_CMD_LEN:
+      _recv_into(sl.s, sl.rxv, _SOCK_CMD_LEN, got)
+   return _RES.unpack_from(sl.rx)[0]
+
+def _recv_replies_nolock(sl, count):
+   """
+   Reads count command replies into sl.rx, growing it if needed,
+   and returns a buffer holding them.  The caller must hold sl.l.
+   """
+   size = count * _SOCK_CMD_LEN
+   if size > len(sl.rx):
+      sl.rxv.release()
+      sl.rx = bytearray(size)
+      sl.rxv = memoryview(sl.rx)
+   _recv_into(sl.s, sl.rxv, size)
+   return sl.rx
+
+def _drain_nolock(sl):
+   """
+   Reads the replies to commands sent without waiting.  Any
+   errors are appended to sl.deferred.  The caller must hold sl.l.
+   """
+   if sl.pending:
+      pending = sl.pending
+      sl.pending = []
+      replies = _recv_replies_nolock(sl, len(pending))
+      for i, c in enumerate(pending):
+         res = u2i(_RES.unpack_from(replies, i*_SOCK_CMD_LEN)[0])
+         if res < 0:
+            sl.deferred.append(c + (res,))
+
+def _not_batched(sl):
+   """
+   Raises an error for commands which return data as they
+   can't be queued in a batch.
+   """
+   if sl.t.batch is not None:
+      raise error("command returns data and can't be batched")
+
+def _ext_size(extents):
+   """
+   Returns the packed length of an extended command.
+   """
+   size = _CMD.size
+   for x in extents:
+      size += len(x)
+   return size
+
+def _pack_ext(buf, cmd, p1, p2, p3, extents):
+   """
+   Packs an extended command into the start of a writable buffer
+   at least _ext_size(extents) long.
+   """
+   _CMD.pack_into(buf, 0, cmd, p1, p2, p3)
+   offset = _CMD.size
+   for x in extents:
+      if type(x) == type(""):
+         x = _b(x)
+      buf[offset:offset + len(x)] = x
+      offset += len(x)
+
 def _pigpio_command(sl, cmd, p1, p2):
    """
    Runs a pigpio socket command.
@@ -984,11 +1114,16 @@ def _pigpio_command(sl, cmd, p1, p2):
     p1:= command parameter 1 (if applicable).
     p2:= command parameter 2 (if applicable).
    """
-   res = PI_CMD_INTERRUPTED
+   b = sl.t.batch
+   if b is not None:
+      b._queue(cmd, p1, p2, _CMD.pack(cmd, p1, p2, 0))
+      return 0
    with sl.l:
-      sl.s.send(struct.pack('IIII', cmd, p1, p2, 0))
-      dummy, res = struct.unpack('12sI', sl.s.recv(_SOCK_CMD_LEN))
-   return res
+      _CMD.pack_into(sl.cmd, 0, cmd, p1, p2, 0)
+      sl.s.sendall(sl.cmd16)
+      if sl.pending:
+         _drain_nolock(sl)
+      return _recv_reply_nolock(sl)
 
 def _pigpio_command_nolock(sl, cmd, p1, p2):
    """
@@ -999,10 +1134,33 @@ def _pigpio_command_nolock(sl, cmd, p1, p2):
     p1:= command parameter 1 (if applicable).
     p2:= command parameter 2 (if applicable).
    """
-   res = PI_CMD_INTERRUPTED
-   sl.s.send(struct.pack('IIII', cmd, p1, p2, 0))
-   dummy, res = struct.unpack('12sI', sl.s.recv(_SOCK_CMD_LEN))
-   return res
+   _not_batched(sl)
+   _CMD.pack_into(sl.cmd, 0, cmd, p1, p2, 0)
+   sl.s.sendall(sl.cmd16)
+   _drain_nolock(sl)
+   return _recv_reply_nolock(sl)
+
+def _pigpio_command_u32(sl, cmd, p1, p2, value):
+   """
+   Runs an extended pigpio socket command whose extension is a
+   single unsigned 32 bit value.
+
+      sl:= command socket and lock.
+     cmd:= the command to be executed.
+      p1:= command parameter 1 (if applicable).
+      p2:= command parameter 2 (if applicable).
+   value:= the extension.
+   """
+   b = sl.t.batch
+   if b is not None:
+      b._queue(cmd, p1, p2, _CMD_U32.pack(cmd, p1, p2, 4, value))
+      return 0
+   with sl.l:
+      _CMD_U32.pack_into(sl.cmd, 0, cmd, p1, p2, 4, value)
+      sl.s.sendall(sl.cmd)
+      if sl.pending:
+         _drain_nolock(sl)
+      return _recv_reply_nolock(sl)
 
 def _pigpio_command_ext(sl, cmd, p1, p2, p3, extents):
    """
@@ -1015,17 +1173,14 @@ def _pigpio_command_ext(sl, cmd, p1, p2, p3, extents):
         p3:= total size in bytes of following extents
    extents:= additional data blocks
    """
-   ext = bytearray(struct.pack('IIII', cmd, p1, p2, p3))
-   for x in extents:
-      if type(x) == type(""):
-         ext.extend(_b(x))
-      else:
-         ext.extend(x)
-   res = PI_CMD_INTERRUPTED
+   b = sl.t.batch
+   if b is not None:
+      ext = bytearray(_ext_size(extents))
+      _pack_ext(ext, cmd, p1, p2, p3, extents)
+      b._queue(cmd, p1, p2, ext)
+      return 0
    with sl.l:
-      sl.s.sendall(ext)
-      dummy, res = struct.unpack('12sI', sl.s.recv(_SOCK_CMD_LEN))
-   return res
+      return _pigpio_command_ext_nolock(sl, cmd, p1, p2, p3, extents)
 
 def _pigpio_command_ext_nolock(sl, cmd, p1, p2, p3, extents):
    """
@@ -1038,16 +1193,82 @@ def _pigpio_command_ext_nolock(sl, cmd, p1, p2, p3, extents):
         p3:= total size in bytes of following extents
    extents:= additional data blocks
    """
-   res = PI_CMD_INTERRUPTED
-   ext = bytearray(struct.pack('IIII', cmd, p1, p2, p3))
-   for x in extents:
-      if type(x) == type(""):
-         ext.extend(_b(x))
-      else:
-         ext.extend(x)
-   sl.s.sendall(ext)
-   dummy, res = struct.unpack('12sI', sl.s.recv(_SOCK_CMD_LEN))
-   return res
+   _not_batched(sl)
+   size = _ext_size(extents)
+   if size > len(sl.ext):
+      sl.extv.release()
+      sl.ext = bytearray(size)
+      sl.extv = memoryview(sl.ext)
+   _pack_ext(sl.extv, cmd, p1, p2, p3, extents)
+   sl.s.sendall(sl.extv[:size])
+   _drain_nolock(sl)
+   return _recv_reply_nolock(sl)
+
+class _batch:
+   """
+   Queues the commands issued by one thread and sends them
+   to the daemon in a single write.
+   """
+
+   def __init__(self, sl, wait=True):
+      """
+      Initialises a batch.
+
+        sl:= command socket and lock.
+      wait:= True to read all the replies when the batch is sent,
+             False to leave them to be read later.
+      """
+      self._sl = sl
+      self._wait = wait
+      self._cmds = []
+      self._data = []
+      self.results = []
+      self.errors = []
+
+   def _queue(self, cmd, p1, p2, data):
+      """
+      Adds a packed command to the batch.  Commands which return
+      data are refused as their result would only be known later.
+      """
+      if cmd not in _BATCHABLE:
+         raise error("command {} returns data and can't be batched".format(
+            cmd))
+      self._cmds.append((cmd, p1, p2))
+      self._data.append(bytes(data))
+
+   def __enter__(self):
+      if self._sl.t.batch is not None:
+         raise error("batches can't be nested")
+      self._sl.t.batch = self
+      return self
+
+   def __exit__(self, exc_type, exc_value, traceback):
+      self._sl.t.batch = None
+      # Queued commands have already returned to their callers, so
+      # they are sent even if the context exits with an exception.
+      if not self._cmds:
+         return False
+      sl = self._sl
+      with sl.l:
+         sl.s.sendall(b''.join(self._data))
+         if self._wait:
+            _drain_nolock(sl)
+            replies = bytes(_recv_replies_nolock(sl, len(self._cmds)))
+         else:
+            sl.pending.extend(self._cmds)
+            if len(sl.pending) >= _MAX_DEFERRED:
+               _drain_nolock(sl)
+      if self._wait:
+         for i, c in enumerate(self._cmds):
+            res = u2i(_RES.unpack_from(replies, i*_SOCK_CMD_LEN)[0])
+            self.results.append(res)
+            if res < 0:
+               self.errors.append(c + (res,))
+         if self.errors and exceptions and exc_type is None:
+            raise error("{} of {} batched commands failed, first: {}".format(
+               len(self.errors), len(self._cmds),
+               error_text(self.errors[0][3])))
+      return False
 
 class _event_ADT:
    """
@@ -1161,9 +1382,8 @@ class _callback_thread(threading.Thread):
          offset = 0
 
          while self.go and (len(buf) - offset) >= MSG_SIZ:
-            msgbuf = buf[offset:offset + MSG_SIZ]
+            seq, flags, tick, level = _REPORT.unpack_from(buf, offset)
             offset += MSG_SIZ
-            seq, flags, tick, level = (struct.unpack('HHII', msgbuf))
 
             if flags == 0:
                changed = level ^ lastLevel
@@ -2003,10 +2223,76 @@ class pi():
       # I p3 4
       ## extension ##
       # I PWMdutycycle
-      extents = [struct.pack("I", PWMduty)]
-      return _u2i(_pigpio_command_ext(
-         self.sl, _PI_CMD_HP, gpio, PWMfreq, 4, extents))
+      return _u2i(_pigpio_command_u32(
+         self.sl, _PI_CMD_HP, gpio, PWMfreq, PWMduty))
+
+
+   def batch(self, wait=True):
+      """
+      Returns a context which queues the commands issued on this
+      Pi by the calling thread and sends them to the daemon in a
+      single write when the context exits.
+
+      wait:= True (default) to read all the replies on exit,
+             False to send without waiting for the replies.
+
+      Only commands which return a status may be batched, others
+      raise an error.  Queued commands return 0, and are sent even
+      if the context exits with an exception; the real status of
+      each is available from the results list of the batch once
+      the context has exited.
+      Failed commands are listed in errors as (cmd, p1, p2, status)
+      tuples and, if exceptions are enabled, an exception is raised
+      after all the replies have been read.
+
+      With wait=False the replies are read by the next command or
+      by [*check_deferred*], so errors are reported late.  Use this
+      for frequent, non-critical updates.
 
+      Commands issued by other threads are not affected.
+
+      ...
+      with pi.batch() as b:
+         pi.hardware_PWM(18, 30000, 500000)
+         pi.hardware_PWM(13, 31000, 500000)
+      print(b.results)
+
+      with pi.batch(wait=False):
+         pi.hardware_PWM(18, 30100, 500000)
+      ...
+      """
+      return _batch(self.sl, wait)
+
+   def in_batch(self):
+      """
+      Returns True if the calling thread has a batch open on
+      this Pi.
+
+      For code that may be called within a batch, and otherwise
+      opens one of its own, as batches can't be nested.
+      """
+      return self.sl.t.batch is not None
+
+   def check_deferred(self, drain=True):
+      """
+      Returns the errors reported for commands sent by a batch
+      with wait=False since the last call, as a list of
+      (cmd, p1, p2, status) tuples.
+
+      drain:= True (default) to first read all outstanding
+              replies, False to only report replies already read.
+
+      ...
+      for cmd, p1, p2, status in pi.check_deferred():
+         print(pigpio.error_text(status))
+      ...
+      """
+      with self.sl.l:
+         if drain:
+            _drain_nolock(self.sl)
+         errors = self.sl.deferred
+         self.sl.deferred = []
+      return errors
 
    def get_current_tick(self):
       """
@@ -76,6 +76,11 @@ following OSC:
         Set the PWM FM frequency in Hz. Use of this endpoint starts the FM
         modulation.
 
+    /pwm/fm/waveform <string>
+        Set the FM waveform: sine, triangle, saw, square, random, or the
+        name of a table file in the controller's file directory, if it has
+        one. Ignored, with a warning, by modulators with a fixed waveform.
+
     /pwm/interrupter/start
         Start the interrupter.
 
@@ -93,16 +98,74 @@ following OSC:
     /pwm/interrupter/duty-cycle <float>
         Interrupter duty cycle in Hz. Set duty cycle to 1 for no interruption.
 
+If the controller has a modulation matrix:
+
+    /pwm/matrix/start
+        Start applying the matrix.
+
+    /pwm/matrix/stop
+        Stop the matrix, putting the modulated settings back.
+
+    /pwm/matrix/lfo <name> <float> [<string>]
+        Add or replace an LFO source of the given frequency in Hz, with a
+        waveform as for /pwm/fm/waveform (default: sine).
+
+    /pwm/matrix/envelope <name> <attack> <decay> <sustain> <release>
+        Add or replace an envelope source. Times are in seconds, and the
+        sustain level is in [0, 1].
+
+    /pwm/matrix/gate <name> <value>
+        Open (truthy) or close (falsey) the gate of an envelope source.
+
+    /pwm/matrix/score <name> <string>
+        Add or replace a source playing a score file in the controller's
+        file directory.
+
+    /pwm/matrix/remove <name>
+        Remove a source and its routes.
+
+    /pwm/matrix/route <source> <target> <float> [<mode>]
+        Route a source, scaled by the amount, to a target: pwm-frequency,
+        pwm-duty-cycle, interrupter-frequency or interrupter-duty-cycle.
+        The mode is "add" (default) or "multiply", which scales the
+        target by (1 + amount * source).
+
+    /pwm/matrix/unroute <source> <target>
+        Remove a route.
+
+    /pwm/matrix/clear
+        Remove all sources and routes.
+
 """
+import asyncio
+import functools
 import logging
-from typing import Iterable, Callable, Any
+import os
+from typing import Any, Callable, Dict, Iterable, Union
 
 from pythonosc import osc_server
 from pythonosc.dispatcher import Dispatcher
 
 from plasma.controller.base_controller import BaseController
+from plasma.controller.osc_dispatcher import CompiledDispatcher
+from plasma.controller.osc_mailbox import Mailbox
+from plasma.controller.osc_server import BatchedOSCUDPServer
 from plasma.interrupter.base_interrupter import BaseInterrupter
-from plasma.modulator.base_modulator import BaseModulator
+from plasma.modulator.base_modulator import BaseModulator, ModulatorException
+from plasma.modulator.wavetable_modulator import WAVEFORMS
+from plasma.modulator.modulation_matrix import (
+    Envelope, LFO, ModulationMatrix, ScoreLane)
+from plasma.player.score import Score, ScoreError
+
+
+SERVER_TYPES = ('threading', 'batched')
+
+# Addresses, under each root, for which only the newest message matters
+CONTINUOUS_CONTROLS = (
+    'center-frequency', 'fine/spread', 'fine/value', 'duty-cycle',
+    'fm/spread', 'fm/frequency',
+    'interrupter/frequency', 'interrupter/duty-cycle',
+)
 
 
 def _toggle_callback(
@@ -120,6 +183,21 @@ def _toggle_callback(
     return toggle_callback
 
 
+def _matrix_callback(method: Callable) -> Callable:
+    """Log, rather than raise, invalid matrix commands"""
+
+    @functools.wraps(method)
+    def matrix_callback(self, osc_path: str, *args) -> None:
+        self.logger.debug("%s %s", osc_path, args)
+        try:
+            method(self, *args)
+        except (ModulatorException, ScoreError, OSError, TypeError,
+                ValueError) as e:
+            self.logger.warning("Ignoring %s %s: %s", osc_path, args, e)
+
+    return matrix_callback
+
+
 class OSCController(BaseController):
 
     """Set up OSC controls for the RPi
@@ -138,6 +216,14 @@ class OSCController(BaseController):
                  interrupter: BaseInterrupter, fine_spread: float = 0.0,
                  address_roots: Iterable[str] = ('pwm',),
                  immediate_on: bool=False,
+                 loop: asyncio.AbstractEventLoop=None,
+                 modulation_matrix: ModulationMatrix=None,
+                 server_type: str='threading',
+                 workers: int=0,
+                 receive_buffer_size: int=None,
+                 apply_frequency: float=0.0,
+                 late_tolerance: float=None,
+                 file_directory: str=None,
     ):
         """
         :param osc_host: The hostname for the OSC server to listen on
@@ -149,6 +235,26 @@ class OSCController(BaseController):
             Leading and trailing slashes have no effect, but multiple parts
             are allowed, e.g., `pwm/channel-01`.
         :param immediate_on: Turn on the PWM upon initialization (default: False)
+        :param loop: If given, serve OSC from this asyncio event loop instead
+            of a thread per datagram, e.g., for `AsyncPiHardwarePWM`.
+        :param modulation_matrix: If given, controlled with the `matrix`
+            addresses
+        :param server_type: One of `SERVER_TYPES`: "threading" handles each
+            datagram on a new thread, "batched" uses a
+            `BatchedOSCUDPServer`. Ignored with `loop`.
+        :param workers: For the batched server, handler threads; 0 handles
+            datagrams on the receive thread
+        :param receive_buffer_size: For the batched server, the `SO_RCVBUF`
+            in bytes (default: the system default)
+        :param late_tolerance: For the batched server, which dispatches
+            bundles at their time tags, drop messages received more than
+            this many seconds late (default: never)
+        :param apply_frequency: If > 0, messages wait in a `Mailbox`
+            applied this many times a second, where continuous controls
+            keep only their newest value. Not supported with `loop`.
+        :param file_directory: The directory of the table and score files
+            that OSC messages may name; None allows only the built-in
+            waveforms, and no scores
         """
         self.logger = logging.getLogger(__name__)
         self.logger.debug("%s", locals())
@@ -168,6 +274,26 @@ class OSCController(BaseController):
         self._pwm.duty_cycle = self._pwm.duty_cycle
 
         self._immediate_on = immediate_on
+        self._loop = loop
+        self._matrix = modulation_matrix
+
+        if server_type not in SERVER_TYPES:
+            raise ValueError("Unknown OSC server type {!r}; expected one of "
+                             "{}".format(server_type, SERVER_TYPES))
+        self._server_type = server_type
+        self._workers = workers
+        self._receive_buffer_size = receive_buffer_size
+        self._late_tolerance = late_tolerance
+        self._server = None
+        self._file_directory = (os.path.realpath(file_directory)
+                                if file_directory else None)
+
+        self._mailbox = None
+        if apply_frequency:
+            if loop is not None:
+                raise ValueError("The mailbox can't apply messages on the "
+                                 "event loop")
+            self._mailbox = Mailbox(apply_frequency, self._pwm.deferred)
 
     def _set_pwm_frequency_with_fine_control(self) -> None:
         self._pwm.frequency = (self._pwm_center_frequency +
@@ -191,6 +317,7 @@ class OSCController(BaseController):
         """
         self.logger.debug("%s", locals())
         del osc_path  # unused
+        self._stop_matrix()
         self._pwm_frequency_modulator.stop()
         self._interrupter.stop()
         self._pwm.stop()
@@ -283,6 +410,48 @@ class OSCController(BaseController):
         self._pwm_frequency_modulator.set_frequency(frequency)
         self._pwm_frequency_modulator.start()
 
+    def set_pwm_fm_waveform(self, osc_path: str, waveform: str) -> None:
+        """Set the FM waveform
+
+        :param osc_path: Unused
+        :param waveform: Waveform name, or table file in the file directory
+        """
+        self.logger.debug("%s", locals())
+        del osc_path  # unused
+        try:
+            self._pwm_frequency_modulator.set_waveform(
+                self._waveform(waveform))
+        except (ModulatorException, ValueError) as e:
+            self.logger.warning("Unable to set waveform: %s", e)
+
+    def _waveform(self, waveform: str) -> str:
+        """A built-in waveform name, or the path of a table file named in
+        an OSC message
+
+        :raises ValueError: If it names neither
+        """
+        if waveform in WAVEFORMS:
+            return waveform
+        return self._file_path(waveform)
+
+    def _file_path(self, name: str) -> str:
+        """The path of a file named in an OSC message
+
+        OSC is unauthenticated, so it may only name files in the file
+        directory.
+
+        :raises ValueError: If there is no file directory, or `name` is
+            outside it
+        """
+        if self._file_directory is None:
+            raise ValueError("{!r} is not a built-in name, and there is no "
+                             "file directory for OSC".format(name))
+        path = os.path.realpath(os.path.join(self._file_directory, name))
+        if not path.startswith(self._file_directory + os.sep):
+            raise ValueError("{!r} is outside the file directory for "
+                             "OSC".format(name))
+        return path
+
     def set_interrupter_start(self, osc_path: str) -> None:
         """Start the interrupter"""
         self.logger.debug("%s", locals())
@@ -317,6 +486,62 @@ class OSCController(BaseController):
         del osc_path  # unused
         self._interrupter.duty_cycle = duty_cycle
 
+    @_matrix_callback
+    def set_matrix_start(self) -> None:
+        self._matrix.start()
+
+    @_matrix_callback
+    def set_matrix_stop(self, *_) -> None:
+        self._matrix.stop()
+
+    @_matrix_callback
+    def set_matrix_lfo(self, name: str, frequency: float,
+                       waveform: str='sine') -> None:
+        self._matrix.add_source(name, LFO(frequency, self._waveform(waveform)))
+
+    @_matrix_callback
+    def set_matrix_envelope(self, name: str, attack: float, decay: float,
+                            sustain: float, release: float) -> None:
+        self._matrix.add_source(
+            name, Envelope(attack, decay, sustain, release))
+
+    @_matrix_callback
+    def set_matrix_gate(self, name: str, truthy: Any=None) -> None:
+        self._matrix.gate(name, bool(truthy))
+
+    @_matrix_callback
+    def set_matrix_score(self, name: str, path: str) -> None:
+        self._matrix.add_source(
+            name, ScoreLane(Score.from_file(self._file_path(path))))
+
+    @_matrix_callback
+    def set_matrix_remove(self, name: str) -> None:
+        self._matrix.remove_source(name)
+
+    @_matrix_callback
+    def set_matrix_route(self, source: str, target: str, amount: float,
+                         mode: str='add') -> None:
+        self._matrix.route(source, target, amount, mode)
+
+    @_matrix_callback
+    def set_matrix_unroute(self, source: str, target: str) -> None:
+        self._matrix.unroute(source, target)
+
+    @_matrix_callback
+    def set_matrix_clear(self, *_) -> None:
+        self._matrix.clear()
+
+    @property
+    def receive_counters(self) -> Union[Dict[str, int], None]:
+        """`BatchedOSCUDPServer.counters` while running the batched server"""
+        if isinstance(self._server, BatchedOSCUDPServer):
+            return self._server.counters
+        return None
+
+    def _stop_matrix(self) -> None:
+        if self._matrix is not None:
+            self._matrix.stop()
+
     def start(self) -> None:
         """Start the PWM"""
         self._interrupter.start()
@@ -330,6 +555,7 @@ class OSCController(BaseController):
     def shutdown(self) -> None:
         """Gracefully stop the pwm"""
         self.logger.debug("Shutting down")
+        self._stop_matrix()
         self._pwm_frequency_modulator.stop()
         self._interrupter.stop()
         self._pwm.stop()
@@ -340,14 +566,45 @@ class OSCController(BaseController):
         dispatcher = self._get_dispatcher()
         self.logger.info("Binding OSC server to %s:%s",
                          self.osc_bind_host, self.osc_bind_port)
-        server = osc_server.ThreadingOSCUDPServer(
-            (self.osc_bind_host, self.osc_bind_port), dispatcher)
-        server.serve_forever()
+        if self._loop is not None:
+            server = osc_server.AsyncIOOSCUDPServer(
+                (self.osc_bind_host, self.osc_bind_port), dispatcher,
+                self._loop)
+            server.serve()
+            self._loop.run_forever()
+            return
+        if self._server_type == 'batched':
+            self._server = BatchedOSCUDPServer(
+                (self.osc_bind_host, self.osc_bind_port), dispatcher,
+                workers=self._workers,
+                receive_buffer_size=self._receive_buffer_size,
+                late_tolerance=self._late_tolerance)
+            self.logger.info("Receiving OSC on one thread with %s workers and "
+                             "a %s byte buffer", self._workers,
+                             self._server.receive_buffer_size)
+        else:
+            self._server = osc_server.ThreadingOSCUDPServer(
+                (self.osc_bind_host, self.osc_bind_port), dispatcher)
+        if self._mailbox is not None:
+            self._mailbox.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            if self.receive_counters is not None:
+                self.logger.info("OSC receive counters: %s",
+                                 self.receive_counters)
+                self.logger.info("OSC time tag stats: %s",
+                                 self._server.timetag_stats)
+            self._server.server_close()
+            if self._mailbox is not None:
+                self._mailbox.close()
+                self.logger.info("OSC mailbox counters: %s",
+                                 self._mailbox.counters)
 
     def _get_dispatcher(self) -> Dispatcher:
         self.logger.info("Binding dispatcher to OSC address roots %s",
                          self._address_roots)
-        dispatcher = Dispatcher()
+        dispatcher = CompiledDispatcher()
         for root in self._address_roots:
             dispatcher.map("/{root}/start".format(root=root), self.set_pwm_on)
             dispatcher.map("/{root}/stop".format(root=root), self.set_pwm_off)
@@ -365,13 +622,15 @@ class OSCController(BaseController):
                            self.set_pwm_fm_start)
             dispatcher.map("/{root}/fm/stop".format(root=root),
                            self.set_pwm_fm_stop)
-            dispatcher.map("/{root}/fm/toggle",
+            dispatcher.map("/{root}/fm/toggle".format(root=root),
                            _toggle_callback(self.set_pwm_fm_start,
                                             self.set_pwm_fm_stop))
             dispatcher.map("/{root}/fm/spread".format(root=root),
                            self.set_pwm_fm_spread)
             dispatcher.map("/{root}/fm/frequency".format(root=root),
                            self.set_pwm_fm_frequency)
+            dispatcher.map("/{root}/fm/waveform".format(root=root),
+                           self.set_pwm_fm_waveform)
             dispatcher.map("/{root}/duty-cycle".format(root=root),
                            self.set_pwm_duty_cycle)
 
@@ -386,8 +645,33 @@ class OSCController(BaseController):
                            self.set_interrupter_frequency)
             dispatcher.map("/{root}/interrupter/duty-cycle".format(root=root),
                            self.set_interrupter_duty_cycle)
+            if self._matrix is not None:
+                self._map_matrix(dispatcher, root)
+        if self._mailbox is not None:
+            dispatcher = self._through_mailbox(dispatcher)
         return dispatcher
 
+    def _through_mailbox(self, dispatcher: Dispatcher) -> Dispatcher:
+        """`dispatcher` with its handlers wrapped by the mailbox"""
+        continuous = {"/{root}/{control}".format(root=root, control=control)
+                      for root in self._address_roots
+                      for control in CONTINUOUS_CONTROLS}
+        mailbox_dispatcher = CompiledDispatcher()
+        for address, handlers in dispatcher._map.items():
+            wrap = (self._mailbox.latest if address in continuous
+                    else self._mailbox.ordered)
+            for handler in handlers:
+                mailbox_dispatcher.map(address, wrap(handler.callback),
+                                       *handler.args)
+        return mailbox_dispatcher
+
+    def _map_matrix(self, dispatcher: Dispatcher, root: str) -> None:
+        for command in ('start', 'stop', 'lfo', 'envelope', 'gate', 'score',
+                        'remove', 'route', 'unroute', 'clear'):
+            dispatcher.map(
+                "/{root}/matrix/{command}".format(root=root, command=command),
+                getattr(self, 'set_matrix_' + command))
+
     def __enter__(self) -> BaseController:
         self.logger.debug("Entering 'with' statement")
         self.start()
@@ -0,0 +1,170 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""OSC address dispatch without a regular expression per message
+
+`pythonosc.dispatcher.Dispatcher` builds and compiles a regular expression
+from every incoming address and matches it against every mapped address.
+`CompiledDispatcher` looks literal addresses up in a dict, and matches
+address patterns segment by segment against a trie of the mapped
+addresses, with the compiled segment patterns kept in an LRU cache.
+
+Patterns follow the OSC 1.0 specification, within one segment: `?` matches
+any character, `*` any sequence of characters, `[abc]` and `[a-z]` a
+character in the set, `[!abc]` one not in it, and `{foo,bar}` either
+string.
+"""
+import functools
+import re
+from typing import Callable, List
+
+from pythonosc.dispatcher import Dispatcher, Handler
+
+
+# Compiled segment patterns kept
+PATTERN_CACHE_SIZE = 256
+
+_PATTERN_CHARACTERS = re.compile(r'[*?\[{]')
+
+
+def is_pattern(address: str) -> bool:
+    """Whether `address` has OSC pattern characters"""
+    return _PATTERN_CHARACTERS.search(address) is not None
+
+
+def pattern_to_regex(segment: str) -> str:
+    """The regular expression for an OSC pattern without `/`"""
+    parts = []
+    i = 0
+    while i < len(segment):
+        character = segment[i]
+        end = i
+        if character == '[':
+            end = segment.find(']', i + 2)
+            if end > 0:
+                members = segment[i + 1:end]
+                negate = members.startswith('!') and len(members) > 1
+                if negate:
+                    members = members[1:]
+                parts.append('[{}{}]'.format(
+                    '^' if negate else '',
+                    ''.join(c if c == '-' else re.escape(c)
+                            for c in members)))
+        elif character == '{':
+            end = segment.find('}', i + 1)
+            if end > 0:
+                parts.append('(?:{})'.format('|'.join(
+                    re.escape(s) for s in segment[i + 1:end].split(','))))
+        elif character == '?':
+            parts.append('.')
+        elif character == '*':
+            parts.append('.*')
+        else:
+            end = -1
+        if end < 0:
+            # Not a pattern character, or an unclosed `[` or `{`
+            parts.append(re.escape(character))
+        i = max(end, i) + 1
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern: str) -> Callable[[str], object]:
+    """`fullmatch` of the OSC pattern, which may span segments"""
+    return re.compile('/'.join(
+        pattern_to_regex(segment) for segment in pattern.split('/')),
+        re.DOTALL).fullmatch
+
+
+class _Node:
+    __slots__ = ('children', 'address')
+
+    def __init__(self):
+        self.children = {}
+        self.address = None
+
+
+class CompiledDispatcher(Dispatcher):
+    """Drop-in `Dispatcher` that indexes the mapped addresses
+
+    Addresses can also be mapped as patterns, which then match incoming
+    literal addresses. Handlers are returned in the order their addresses
+    were first mapped.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._literal = {}
+        self._order = {}
+        self._trie = _Node()
+        self._patterned = []
+
+    def map(self, address: str, handler: Callable, *args) -> None:
+        super().map(address, handler, *args)
+        if address in self._order:
+            # Appended to the list already indexed
+            return
+        self._order[address] = len(self._order)
+        if is_pattern(address):
+            self._patterned.append((compile_pattern(address), address))
+            return
+        self._literal[address] = self._map[address]
+        node = self._trie
+        for segment in address.split('/'):
+            node = node.children.setdefault(segment, _Node())
+        node.address = address
+
+    def handlers_for_address(self, address_pattern: str) -> List[Handler]:
+        """The handlers for an address or OSC address pattern"""
+        if not self._patterned:
+            # The usual case: a literal address, mapped literally
+            handlers = self._literal.get(address_pattern)
+            if handlers is not None:
+                return list(handlers)
+        if is_pattern(address_pattern):
+            addresses = self._match(address_pattern.split('/'))
+        elif address_pattern in self._literal:
+            addresses = [address_pattern]
+        else:
+            addresses = []
+        addresses.extend(address for fullmatch, address in self._patterned
+                         if fullmatch(address_pattern))
+        if not addresses:
+            if self._default_handler:
+                return [Handler(self._default_handler, [])]
+            return []
+        addresses.sort(key=self._order.__getitem__)
+        return [handler for address in addresses
+                for handler in self._map[address]]
+
+    def _match(self, segments: List[str]) -> List[str]:
+        """The literal addresses matched by the pattern `segments`"""
+        nodes = [self._trie]
+        for segment in segments:
+            if is_pattern(segment):
+                fullmatch = compile_pattern(segment)
+                nodes = [child for node in nodes
+                         for name, child in node.children.items()
+                         if fullmatch(name)]
+            else:
+                nodes = [node.children[segment] for node in nodes
+                         if segment in node.children]
+            if not nodes:
+                return []
+        return [node.address for node in nodes if node.address is not None]
@@ -0,0 +1,165 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Coalescing of OSC messages between the server and their handlers
+
+Controls such as a fader send far more messages than the PWM needs, and
+only the newest value of each matters. A `Mailbox` keeps only the newest
+message for each handler wrapped with `latest`, while every message for a
+handler wrapped with `ordered` is kept, e.g. start and stop commands. A
+thread applies what is waiting at most `apply_frequency` times a second,
+in the order received.
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from numbers import Real
+from typing import Any, Callable, Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """Holds OSC messages until the next apply
+
+    A newer message for a `latest` handler replaces the waiting one and
+    takes its place in the order, so a stale value is never applied after
+    a newer one, nor moved ahead of a command received in between.
+    """
+
+    def __init__(self,
+                 apply_frequency: Real=100.0,
+                 batch: Callable[[], Any]=ExitStack):
+        """
+        :param apply_frequency: Most applies per second
+        :param batch: Context for each apply, e.g. `BasePWM.deferred` to
+            send its writes together
+        """
+        if apply_frequency <= 0:
+            raise ValueError("apply_frequency must be > 0, not {}".format(
+                apply_frequency))
+        self._period = 1.0 / apply_frequency
+        self._batch = batch
+        self._condition = threading.Condition()
+        # key: (callback, osc_path, args); a `latest` callback is its own
+        # key, and each `ordered` message has a new one
+        self._waiting = OrderedDict()
+        self._keys = itertools.count()
+        self._thread = None
+        self._is_closed = False
+
+        self._received = 0
+        self._replaced = 0
+        self._applied = 0
+        self._applies = 0
+
+    @property
+    def apply_frequency(self) -> float:
+        return 1.0 / self._period
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        """Counts since the mailbox was created
+
+        received, replaced, applied: messages, and those replaced by a
+            newer one before they were applied
+        applies: passes over the waiting messages
+        """
+        with self._condition:
+            return {'received': self._received,
+                    'replaced': self._replaced,
+                    'applied': self._applied,
+                    'applies': self._applies}
+
+    def latest(self, callback: Callable) -> Callable:
+        """The OSC handler that leaves only the newest message waiting"""
+        def latest_callback(osc_path: str, *args) -> None:
+            self._put(callback, callback, osc_path, args)
+        return latest_callback
+
+    def ordered(self, callback: Callable) -> Callable:
+        """The OSC handler that queues every message"""
+        def ordered_callback(osc_path: str, *args) -> None:
+            self._put(next(self._keys), callback, osc_path, args)
+        return ordered_callback
+
+    def start(self) -> None:
+        with self._condition:
+            if self._thread is None:
+                self._is_closed = False
+                self._thread = threading.Thread(
+                    target=self._run, name='osc-mailbox', daemon=True)
+                self._thread.start()
+
+    def close(self) -> None:
+        """Stop the thread after applying the messages waiting"""
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._is_closed = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+        self.apply_waiting()
+
+    def apply_waiting(self) -> None:
+        """Call the handlers for the messages waiting, in order"""
+        with self._condition:
+            messages = list(self._waiting.values())
+            self._waiting.clear()
+            if messages:
+                self._applied += len(messages)
+                self._applies += 1
+        if not messages:
+            return
+        with self._batch():
+            for callback, osc_path, args in messages:
+                try:
+                    callback(osc_path, *args)
+                except Exception:
+                    logger.exception("Handler for %s %s failed",
+                                     osc_path, args)
+
+    def _put(self, key, callback: Callable, osc_path: str, args) -> None:
+        with self._condition:
+            self._received += 1
+            if self._waiting.pop(key, None) is not None:
+                self._replaced += 1
+            self._waiting[key] = (callback, osc_path, args)
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._waiting and not self._is_closed:
+                    self._condition.wait()
+                if self._is_closed:
+                    return
+            deadline = time.monotonic() + self._period
+            self.apply_waiting()
+            # Let messages gather until the next apply is due
+            with self._condition:
+                while not self._is_closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
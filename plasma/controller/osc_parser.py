@@ -0,0 +1,207 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""OSC message parsing without copying the datagram
+
+pythonosc's readers slice the rest of the datagram for every bounds check,
+scan strings a byte at a time, and pick each argument's reader from an
+if/elif chain on its type tag. `parse_message` finds strings with
+`bytes.find`, and reads arguments with `struct.Struct.unpack_from` at
+offsets into the datagram, with consecutive fixed-size arguments unpacked
+by one struct. The decoding steps of each type tag string are compiled
+once and kept in an LRU cache. Only strings and blobs are copied out.
+
+Arguments are decoded as pythonosc does, except that a time tag (`t`) is
+its 64-bit NTP integer, as in `plasma.controller.osc_timetags`, and an
+empty string argument is allowed.
+"""
+import functools
+import logging
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+from pythonosc.osc_message import ParseError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Compiled type tag strings kept
+TYPE_TAG_CACHE_SIZE = 256
+
+# Struct codes of the fixed-size arguments, unpacked together when adjacent
+_STRUCT_CODES = {'i': 'i', 'f': 'f', 'd': 'd', 'r': 'I', 't': 'Q'}
+_CONSTANTS = {'T': True, 'F': False}
+
+_INT = struct.Struct('>i')
+_MIDI = struct.Struct('>4B')
+
+# Kinds of decoding step
+_FIXED, _FINAL_FIXED, _MIDI_STEP, _CONSTANT, _STRING, _BLOB, _OPEN, _CLOSE = \
+    range(8)
+
+
+class Message:
+    """An OSC message's address and arguments"""
+
+    __slots__ = ('address', 'params')
+
+    def __init__(self, address: str, params: List):
+        self.address = address
+        self.params = params
+
+    def __iter__(self) -> Iterator:
+        return iter(self.params)
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Message)
+                and (self.address, self.params)
+                == (other.address, other.params))
+
+    def __repr__(self) -> str:
+        return 'Message({!r}, {!r})'.format(self.address, self.params)
+
+
+def parse_message(data: bytes, start: int=0,
+                  end: Optional[int]=None) -> Message:
+    """The message in `data[start:end]`, by default all of `data`
+
+    :raises ParseError: If it is not a well-formed OSC message
+    """
+    if end is None:
+        end = len(data)
+    null = data.find(b'\0', start, end)
+    if null <= start:
+        raise ParseError("Missing OSC address")
+    try:
+        address = data[start:null].decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise ParseError("Bad OSC address: {}".format(e))
+    params = []
+    index = null + 4 - (null - start) % 4
+    if index >= end:
+        return Message(address, params)
+    null = data.find(b'\0', index, end)
+    if null < 0:
+        raise ParseError("Unterminated type tags")
+    steps = _compile(data[index:null])
+    index = null + 4 - (null - index) % 4
+    outer = []
+    for kind, arg in steps:
+        if kind == _FINAL_FIXED:
+            if index + arg.size > end:
+                # Reaktor leaves off the padding of a final float
+                if index + arg.size - end >= 4:
+                    raise ParseError("Datagram is too short")
+                params.extend(arg.unpack(
+                    data[index:end].ljust(arg.size, b'\0')))
+            else:
+                params.extend(arg.unpack_from(data, index))
+            index += arg.size
+        elif kind == _FIXED:
+            if index + arg.size > end:
+                raise ParseError("Datagram is too short")
+            params.extend(arg.unpack_from(data, index))
+            index += arg.size
+        elif kind == _STRING:
+            value, index = _string(data, index, end)
+            params.append(value)
+        elif kind == _CONSTANT:
+            params.append(arg)
+        elif kind == _BLOB:
+            if index + 4 > end:
+                raise ParseError("Datagram is too short")
+            size, = _INT.unpack_from(data, index)
+            index += 4
+            if size < 0 or index + size > end:
+                raise ParseError("Bad blob size {}".format(size))
+            params.append(data[index:index + size])
+            index += size + (-size % 4)
+        elif kind == _MIDI_STEP:
+            if index + 4 > end:
+                raise ParseError("Datagram is too short")
+            params.append(_MIDI.unpack_from(data, index))
+            index += 4
+        elif kind == _OPEN:
+            array = []
+            params.append(array)
+            outer.append(params)
+            params = array
+        else:
+            params = outer.pop()
+    return Message(address, params)
+
+
+def _string(data: bytes, start: int, end: int) -> Tuple[str, int]:
+    """A null-terminated, padded string and the index after it"""
+    null = data.find(b'\0', start, end)
+    if null < 0:
+        raise ParseError("Unterminated string")
+    try:
+        value = data[start:null].decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise ParseError("Bad string: {}".format(e))
+    return value, null + 4 - (null - start) % 4
+
+
+@functools.lru_cache(maxsize=TYPE_TAG_CACHE_SIZE)
+def _compile(type_tags: bytes) -> Tuple[Tuple[int, object], ...]:
+    """The (kind, argument) steps that decode a type tag string's arguments
+
+    :raises ParseError: If the array brackets do not match
+    """
+    steps = []
+    codes = ''
+    depth = 0
+    if type_tags.startswith(b','):
+        type_tags = type_tags[1:]
+    for tag in type_tags.decode('ascii', 'replace'):
+        if tag in _STRUCT_CODES:
+            codes += _STRUCT_CODES[tag]
+            continue
+        if codes:
+            steps.append((_FIXED, struct.Struct('>' + codes)))
+            codes = ''
+        if tag in _CONSTANTS:
+            steps.append((_CONSTANT, _CONSTANTS[tag]))
+        elif tag == 's':
+            steps.append((_STRING, None))
+        elif tag == 'b':
+            steps.append((_BLOB, None))
+        elif tag == 'm':
+            steps.append((_MIDI_STEP, None))
+        elif tag == '[':
+            depth += 1
+            steps.append((_OPEN, None))
+        elif tag == ']':
+            depth -= 1
+            if depth < 0:
+                raise ParseError(
+                    "Unexpected closing bracket in type tag: {}".format(
+                        type_tags))
+            steps.append((_CLOSE, None))
+        else:
+            logger.warning("Unhandled OSC argument type: %s", tag)
+    if depth:
+        raise ParseError(
+            "Missing closing bracket in type tag: {}".format(type_tags))
+    if codes:
+        steps.append((_FINAL_FIXED if codes.endswith('f') else _FIXED,
+                      struct.Struct('>' + codes)))
+    return tuple(steps)
@@ -0,0 +1,252 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""OSC server that receives on one thread and handles on a fixed pool
+
+`pythonosc.osc_server.ThreadingOSCUDPServer` starts a thread for every
+datagram, which at score-player or IanniX rates is hundreds a second on a
+Pi, and handles datagrams in whatever order those threads run.
+`BatchedOSCUDPServer` instead drains the socket in batches on a single
+receive thread, and handles each datagram there or on one of a fixed
+number of workers. The worker is chosen by the datagram's OSC address, so
+messages to one address are handled in the order they were received.
+Messages of future-dated bundles wait for a `TimetagScheduler` instead of
+blocking the thread that received them.
+"""
+import logging
+import queue
+import select
+import socket
+import threading
+from numbers import Integral
+from numbers import Real
+from typing import Dict, Optional, Tuple
+
+from pythonosc import osc_server
+from pythonosc.dispatcher import Dispatcher
+
+from plasma.controller.osc_timetags import TimetagScheduler
+
+
+logger = logging.getLogger(__name__)
+
+
+# Largest UDP payload
+_MAX_DATAGRAM = 65535
+
+
+class BatchedOSCUDPServer:
+    """UDP OSC server with one receive thread and `workers` handler threads
+
+    Used like `socketserver` servers: `serve_forever` blocks until
+    `shutdown` is called from another thread, and `server_close` closes the
+    socket.
+    """
+
+    def __init__(self,
+                 server_address: Tuple[str, int],
+                 dispatcher: Dispatcher,
+                 workers: Integral=0,
+                 receive_buffer_size: Integral=None,
+                 batch_size: Integral=256,
+                 late_tolerance: Optional[Real]=None):
+        """
+        :param server_address: (host, port) to bind
+        :param workers: Handler threads; 0 handles each datagram on the
+            receive thread
+        :param receive_buffer_size: If given, the `SO_RCVBUF` to request,
+            in bytes. The kernel may round it, see `receive_buffer_size`.
+        :param batch_size: Most datagrams received before checking for
+            `shutdown`
+        :param late_tolerance: See `TimetagScheduler`
+        """
+        if workers < 0:
+            raise ValueError("workers must be >= 0, not {}".format(workers))
+        if batch_size < 1:
+            raise ValueError(
+                "batch_size must be >= 1, not {}".format(batch_size))
+        self._dispatcher = dispatcher
+        self._batch_size = batch_size
+        self._timetags = TimetagScheduler(dispatcher, late_tolerance)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if receive_buffer_size:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                       receive_buffer_size)
+            self.socket.bind(server_address)
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = []
+        self._shutdown_request = False
+        self._is_shut_down = threading.Event()
+        self._is_shut_down.set()
+
+        # Written by the receive thread only
+        self._datagrams = 0
+        self._bytes = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._invalid = 0
+        # Written by the handler threads
+        self._counter_lock = threading.Lock()
+        self._handled = 0
+        self._errors = 0
+
+    @property
+    def dispatcher(self) -> Dispatcher:
+        return self._dispatcher
+
+    @property
+    def workers(self) -> int:
+        return len(self._queues)
+
+    @property
+    def receive_buffer_size(self) -> int:
+        """The `SO_RCVBUF` in effect, which Linux doubles and caps"""
+        return self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    @property
+    def timetag_stats(self) -> Dict[str, Real]:
+        """`TimetagScheduler.stats`"""
+        return self._timetags.stats
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        """Counts since the server was created
+
+        datagrams, bytes: received
+        batches, largest_batch: reads until the socket was empty, and the
+            most datagrams read in one
+        invalid: datagrams dropped as not OSC
+        handled, errors: datagrams handled, and those whose handler raised
+        queued: datagrams waiting for a worker
+        """
+        with self._counter_lock:
+            handled, errors = self._handled, self._errors
+        return {
+            'datagrams': self._datagrams,
+            'bytes': self._bytes,
+            'batches': self._batches,
+            'largest_batch': self._largest_batch,
+            'invalid': self._invalid,
+            'handled': handled,
+            'errors': errors,
+            'queued': sum(q.qsize() for q in self._queues),
+        }
+
+    def serve_forever(self, poll_interval: float=0.5) -> None:
+        """Receive and handle datagrams until `shutdown`"""
+        self._is_shut_down.clear()
+        self._timetags.start()
+        self._start_workers()
+        try:
+            while not self._shutdown_request:
+                readable, _, _ = select.select(
+                    [self.socket], [], [], poll_interval)
+                if readable:
+                    self._receive_batch()
+        finally:
+            self._shutdown_request = False
+            self._stop_workers()
+            self._timetags.close()
+            self._is_shut_down.set()
+
+    def shutdown(self) -> None:
+        """Stop `serve_forever`, after the queued datagrams are handled"""
+        self._shutdown_request = True
+        self._is_shut_down.wait()
+
+    def server_close(self) -> None:
+        self.socket.close()
+
+    def __enter__(self) -> 'BatchedOSCUDPServer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.server_close()
+
+    def _receive_batch(self) -> None:
+        count = 0
+        while count < self._batch_size:
+            try:
+                data, _ = self.socket.recvfrom(_MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # e.g. ICMP errors from earlier sends; nothing was read
+                logger.debug("Receive failed: %s", e)
+                break
+            count += 1
+            self._bytes += len(data)
+            if not osc_server._is_valid_request((data,)):
+                self._invalid += 1
+                continue
+            if self._queues:
+                self._queues[hash(_address(data)) % len(self._queues)].put(
+                    data)
+            else:
+                self._handle(data)
+        self._datagrams += count
+        self._batches += 1
+        self._largest_batch = max(self._largest_batch, count)
+
+    def _handle(self, data: bytes) -> None:
+        error = False
+        try:
+            self._timetags.handle(data)
+        except Exception:
+            error = True
+            logger.exception("OSC handler failed")
+        with self._counter_lock:
+            self._handled += 1
+            self._errors += error
+
+    def _work(self, datagrams: queue.Queue) -> None:
+        while True:
+            data = datagrams.get()
+            if data is None:
+                return
+            self._handle(data)
+
+    def _start_workers(self) -> None:
+        self._threads = [
+            threading.Thread(target=self._work, args=(datagrams,),
+                             name='osc-worker-{}'.format(i), daemon=True)
+            for i, datagrams in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.start()
+
+    def _stop_workers(self) -> None:
+        for datagrams in self._queues:
+            datagrams.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def _address(data: bytes) -> bytes:
+    """The OSC address of a message, or b'#bundle' for a bundle"""
+    end = data.find(b'\0')
+    return data if end < 0 else data[:end]
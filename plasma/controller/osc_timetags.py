@@ -0,0 +1,275 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Dispatch of OSC bundles at their time tags
+
+pythonosc sleeps in the handling thread until a future-dated bundle is
+due, and compares its time tag with the current time truncated to whole
+seconds (and reads the tag's seconds as a signed integer, so tags after
+2036 are all in the past). `TimetagScheduler` keeps the messages of future
+bundles in a heap ordered by their 64-bit NTP time tags, and one timer
+thread dispatches each when it is due, so no server thread waits.
+
+A message is dispatched on the calling thread if its bundle's time tag is
+"immediately" or already past, or if it was not in a bundle.
+"""
+import heapq
+import itertools
+import logging
+import struct
+import threading
+import time
+from numbers import Real
+from typing import Dict, List, Optional, Tuple
+
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_packet import ParseError
+
+from plasma.controller import osc_parser
+from plasma.controller.osc_parser import Message, parse_message
+from plasma.utils.timing import DeadlineClock
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds from the NTP epoch, 1900, to the Unix epoch
+NTP_DELTA = 2208988800
+
+# The time tag meaning "now"
+IMMEDIATELY = 1
+
+_BUNDLE_PREFIX = b'#bundle\0'
+_HEADER = struct.Struct('>8sQ')
+_SIZE = struct.Struct('>i')
+
+
+def ntp_time(seconds: Real=None) -> int:
+    """The 64-bit NTP time tag of a `time.time()`, by default now"""
+    if seconds is None:
+        seconds = time.time()
+    whole = int(seconds // 1)
+    return ((whole + NTP_DELTA) << 32) + int((seconds - whole) * 2 ** 32)
+
+
+def ntp_to_time(timetag: int) -> float:
+    """The `time.time()` of a 64-bit NTP time tag"""
+    return (timetag >> 32) - NTP_DELTA + (timetag & 0xffffffff) / 2 ** 32
+
+
+def parse_bundle(data: bytes) -> List[Tuple[int, Message]]:
+    """(time tag, message) for each message in a bundle and its bundles
+
+    :raises ParseError: If `data` is not a well-formed bundle
+    """
+    messages = []
+    try:
+        _parse_bundle(data, 0, len(data), messages)
+    except (struct.error, osc_parser.ParseError) as e:
+        raise ParseError("Could not parse bundle: {}".format(e))
+    return messages
+
+
+def _parse_bundle(data: bytes, start: int, end: int,
+                  messages: List[Tuple[int, Message]]) -> None:
+    if end - start < _HEADER.size:
+        raise ParseError("Bundle is too short")
+    prefix, timetag = _HEADER.unpack_from(data, start)
+    if prefix != _BUNDLE_PREFIX:
+        raise ParseError("Not a bundle")
+    index = start + _HEADER.size
+    while index < end:
+        if index + _SIZE.size > end:
+            raise ParseError("Bundle is too short")
+        size, = _SIZE.unpack_from(data, index)
+        index += _SIZE.size
+        if size < 0 or index + size > end:
+            raise ParseError("Bad bundle element size {}".format(size))
+        if data.startswith(_BUNDLE_PREFIX, index):
+            _parse_bundle(data, index, index + size, messages)
+        else:
+            messages.append(
+                (timetag, parse_message(data, index, index + size)))
+        index += size
+
+
+class TimetagScheduler:
+    """Dispatches OSC messages to `dispatcher` at their time tags
+
+    Call `handle` with each datagram. Future messages wait for a timer
+    thread, started by `start`; those still waiting at `close` are
+    dropped.
+    """
+
+    def __init__(self,
+                 dispatcher: Dispatcher,
+                 late_tolerance: Optional[Real]=None):
+        """
+        :param late_tolerance: Drop messages received more than this many
+            seconds after their time tag; None dispatches them all
+        """
+        self._dispatcher = dispatcher
+        self._late_tolerance = late_tolerance
+        self._clock = DeadlineClock()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._thread = None
+        self._stop_signal = False
+
+        self._immediate = 0
+        self._scheduled = 0
+        self._late = 0
+        self._dropped = 0
+        self._errors = 0
+        self._dispatched = 0
+        self._total_lateness = 0.0
+        self._max_lateness = 0.0
+
+    @property
+    def stats(self) -> Dict[str, Real]:
+        """Counts of messages, and how late the scheduled ones ran
+
+        immediate: dispatched on arrival, without a future time tag
+        late, dropped: received after their time tag, and those of them
+            dropped as later than `late_tolerance`
+        scheduled, pending: queued for the timer thread, and still queued
+        dispatched, errors: dispatched by the timer thread, and those
+            whose handler raised
+        mean_lateness, max_lateness: seconds from the time tag to the
+            dispatch by the timer thread
+        """
+        with self._lock:
+            return {
+                'immediate': self._immediate,
+                'late': self._late,
+                'dropped': self._dropped,
+                'scheduled': self._scheduled,
+                'pending': len(self._heap),
+                'dispatched': self._dispatched,
+                'errors': self._errors,
+                'mean_lateness': (self._total_lateness / self._dispatched
+                                  if self._dispatched else 0.0),
+                'max_lateness': self._max_lateness,
+            }
+
+    def handle(self, data: bytes) -> None:
+        """Dispatch or schedule the messages of an OSC datagram
+
+        Handlers of messages dispatched here may raise.
+        """
+        try:
+            if not data.startswith(_BUNDLE_PREFIX):
+                self._dispatch(parse_message(data))
+                with self._lock:
+                    self._immediate += 1
+                return
+            messages = parse_bundle(data)
+        except (ParseError, osc_parser.ParseError) as e:
+            logger.debug("Ignoring datagram: %s", e)
+            return
+        now = ntp_time()
+        for timetag, message in messages:
+            if timetag > now:
+                self._push(timetag, message)
+                continue
+            if timetag != IMMEDIATELY:
+                lateness = (now - timetag) / 2 ** 32
+                with self._lock:
+                    self._late += 1
+                    if (self._late_tolerance is not None
+                            and lateness > self._late_tolerance):
+                        self._dropped += 1
+                        continue
+            with self._lock:
+                self._immediate += 1
+            self._dispatch(message)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stop_signal = False
+                self._thread = threading.Thread(
+                    target=self._run, name='osc-timetags', daemon=True)
+                self._thread.start()
+
+    def close(self) -> None:
+        """Stop the timer thread, dropping the messages still waiting"""
+        with self._lock:
+            self._stop_signal = True
+            thread, self._thread = self._thread, None
+            if self._heap:
+                logger.info("Dropping %s scheduled OSC messages",
+                            len(self._heap))
+            self._heap = []
+            self._wakeup.set()
+        if thread is not None:
+            thread.join()
+
+    def _push(self, timetag: int, message: Message) -> None:
+        with self._lock:
+            self._scheduled += 1
+            heapq.heappush(self._heap,
+                           (timetag, next(self._sequence), message))
+            if self._heap[0][2] is message:
+                self._wakeup.set()
+
+    def _dispatch(self, message: Message) -> None:
+        address = message.address
+        for handler in self._dispatcher.handlers_for_address(address):
+            if handler.args:
+                handler.callback(address, handler.args, *message)
+            else:
+                handler.callback(address, *message)
+
+    def _run(self) -> None:
+        while not self._stop_signal:
+            self._wakeup.clear()
+            with self._lock:
+                timetag = self._heap[0][0] if self._heap else None
+            if timetag is None:
+                self._wakeup.wait()
+                continue
+            # From the wall clock each time round, in case it was stepped
+            deadline = time.perf_counter() + (
+                ntp_to_time(timetag) - time.time())
+            if not self._clock.wait_until(deadline, self._wakeup):
+                continue
+            with self._lock:
+                if not self._heap or self._heap[0][0] != timetag:
+                    continue
+                _, _, message = heapq.heappop(self._heap)
+            self._dispatch_due(timetag, message)
+
+    def _dispatch_due(self,
+                      timetag: int,
+                      message: Message) -> None:
+        lateness = time.time() - ntp_to_time(timetag)
+        error = False
+        try:
+            self._dispatch(message)
+        except Exception:
+            error = True
+            logger.exception("OSC handler for %s failed", message.address)
+        with self._lock:
+            self._dispatched += 1
+            self._errors += error
+            self._total_lateness += lateness
+            self._max_lateness = max(self._max_lateness, lateness)
@@ -0,0 +1,443 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Run the interrupter and modulator in a child process
+
+The OSC server and its threads stay in the parent, which drives
+`EnginePWM`, `EngineInterrupter` and `EngineModulator` proxies. The
+proxies only write into a `SeqlockBlock` in shared memory; the child
+polls the block and applies the changes to the real PWM, interrupter and
+modulator, whose timing then no longer shares a GIL with OSC traffic.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from numbers import Real
+from typing import Any, Callable, Dict, Iterable, Sequence, Union
+
+from plasma.interrupter.base_interrupter import BaseInterrupter
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.modulator.base_modulator import BaseModulator, ModulatorException
+from plasma.modulator.wavetable_modulator import (
+    WAVEFORMS, WavetableModulator)
+from plasma.pwm.base_pwm import BasePWM
+from plasma.utils.runtime import set_up_timing_thread
+from plasma.utils.scheduler import PRIORITY_LOW, Scheduler
+from plasma.utils.seqlock import SeqlockBlock
+
+
+ENGINE_FIELDS = (
+    'running',
+    'pwm_frequency', 'pwm_duty_cycle', 'pwm_on',
+    'interrupter_frequency', 'interrupter_duty_cycle', 'interrupter_on',
+    'modulator_frequency', 'modulator_spread', 'modulator_center',
+    'modulator_waveform', 'modulator_on',
+)
+
+# Waveforms that can be changed while running, by their index in the block
+_WAVEFORM_NAMES = tuple(sorted(WAVEFORMS))
+
+
+class EngineException(Exception):
+    pass
+
+
+def _logger():
+    return logging.getLogger(__name__)
+
+
+class _Parameters:
+    """The parent's side of the block: writes, and reads its own writes"""
+
+    def __init__(self, block: SeqlockBlock):
+        self._block = block
+        self._values = dict.fromkeys(block.fields, 0.0)
+
+    def __getitem__(self, field: str) -> float:
+        return self._values[field]
+
+    def __setitem__(self, field: str, value: Real) -> None:
+        self._values[field] = value
+        self._block.write(field, value)
+
+
+class EnginePWM(BasePWM):
+    """Stand-in for the PWM driven by a `ProcessEngine`"""
+
+    def __init__(self, parameters: _Parameters):
+        self._parameters = parameters
+
+    @property
+    def is_stopped(self) -> bool:
+        return not self._parameters['pwm_on']
+
+    def start(self) -> None:
+        self._parameters['pwm_on'] = 1
+
+    def stop(self) -> None:
+        self._parameters['pwm_on'] = 0
+
+    @property
+    def duty_cycle(self) -> Real:
+        return self._parameters['pwm_duty_cycle']
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: Real) -> None:
+        self._parameters['pwm_duty_cycle'] = value
+
+    @property
+    def frequency(self) -> Real:
+        return self._parameters['pwm_frequency']
+
+    @frequency.setter
+    def frequency(self, value: Real) -> None:
+        self._parameters['pwm_frequency'] = value
+
+
+class EngineInterrupter(BaseInterrupter):
+    """Stand-in for the `SimpleInterrupter` of a `ProcessEngine`"""
+
+    def __init__(self, parameters: _Parameters, pwm: EnginePWM):
+        self._parameters = parameters
+        self._pwm = pwm
+
+    @property
+    def pwm(self) -> BasePWM:
+        return self._pwm
+
+    @property
+    def is_stopped(self) -> bool:
+        return not self._parameters['interrupter_on']
+
+    def start(self) -> None:
+        self._parameters['interrupter_on'] = 1
+
+    def stop(self) -> None:
+        self._parameters['interrupter_on'] = 0
+
+    @property
+    def duty_cycle(self) -> Real:
+        return self._parameters['interrupter_duty_cycle']
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: Real) -> None:
+        # Invalid settings raise here rather than in the child
+        SimpleInterrupter._validate_duty_cycle(value)
+        self._parameters['interrupter_duty_cycle'] = value
+
+    @property
+    def frequency(self) -> Real:
+        return self._parameters['interrupter_frequency']
+
+    @frequency.setter
+    def frequency(self, value: Real) -> None:
+        SimpleInterrupter._validate_frequency(value)
+        self._parameters['interrupter_frequency'] = value
+
+
+class EngineModulator(BaseModulator):
+    """Stand-in for the `WavetableModulator` of a `ProcessEngine`"""
+
+    def __init__(self, parameters: _Parameters):
+        self._parameters = parameters
+
+    @property
+    def is_stopped(self) -> bool:
+        return not self._parameters['modulator_on']
+
+    def start(self) -> None:
+        self._parameters['modulator_on'] = 1
+
+    def stop(self) -> None:
+        self._parameters['modulator_on'] = 0
+
+    @property
+    def frequency(self) -> Real:
+        return self._parameters['modulator_frequency']
+
+    @frequency.setter
+    def frequency(self, value: Real) -> None:
+        self._parameters['modulator_frequency'] = value
+
+    @property
+    def spread(self) -> Real:
+        return self._parameters['modulator_spread']
+
+    @spread.setter
+    def spread(self, value: Real):
+        self._parameters['modulator_spread'] = value
+
+    @property
+    def center(self) -> Real:
+        return self._parameters['modulator_center']
+
+    @center.setter
+    def center(self, value: Real) -> None:
+        self._parameters['modulator_center'] = value
+
+    def set_waveform(self, value: str) -> None:
+        """Change to a built-in waveform
+
+        Table files and sequences can only be given to `ProcessEngine`.
+        """
+        if value not in WAVEFORMS:
+            raise ModulatorException(
+                "Only {} can be set while the engine runs, not {!r}".format(
+                    ', '.join(_WAVEFORM_NAMES), value))
+        self._parameters['modulator_waveform'] = _WAVEFORM_NAMES.index(value)
+
+
+class ProcessEngine:
+    """Runs a PWM, `SimpleInterrupter` and `WavetableModulator` in a child
+
+    The PWM is built in the child as `pwm_factory(*pwm_args, **pwm_kwargs)`,
+    so the factory and its arguments must be picklable, e.g. a PWM class
+    and its host and pin. Use the `pwm`, `interrupter` and `modulator`
+    stand-ins in place of the real objects, e.g. for an `OSCController`.
+    Each setting reaches the child within one poll period.
+
+    The child is started with the "spawn" method, so it does not inherit
+    the parent's threads or pigpio connections, and is stopped by `close`
+    or when the parent exits.
+    """
+
+    def __init__(self,
+                 pwm_factory: Callable[..., BasePWM],
+                 pwm_args: Sequence=(),
+                 pwm_kwargs: Dict[str, Any]=None,
+                 interrupter_frequency: Real=100.0,
+                 interrupter_duty_cycle: Real=1.0,
+                 modulator_frequency: Real=0.0,
+                 modulator_spread: Real=1.0,
+                 modulator_center: Real=0.0,
+                 modulator_waveform: str='sine',
+                 modulator_dead_band: Union[Real, Callable[[Real], Real]]=0.0,
+                 modulator_keepalive: Real=1.0,
+                 modulator_render_ahead: Real=0.0,
+                 update_frequency: Real=40.0,
+                 poll_frequency: Real=500.0,
+                 realtime_cpus: Iterable[int]=None,
+                 realtime_policy: str='other',
+                 realtime_priority: int=0,
+                 start_timeout: Real=10.0):
+        """
+        :param modulator_waveform: Initial waveform, e.g. a table file
+        :param modulator_dead_band: See `CallbackModulator`; a function
+            must be picklable
+        :param update_frequency: Modulator updates per second
+        :param poll_frequency: Checks of the parameter block per second
+        :param realtime_cpus: See `set_thread_scheduling`, applied to the
+            child's timing thread
+        :param start_timeout: Seconds to wait for the child to build the
+            PWM before raising `EngineException`
+        """
+        context = multiprocessing.get_context('spawn')
+        buffer = context.RawArray('B', SeqlockBlock.size(len(ENGINE_FIELDS)))
+        self._parameters = _Parameters(SeqlockBlock(ENGINE_FIELDS, buffer))
+        self._parameters['running'] = 1
+        self._parameters['interrupter_frequency'] = interrupter_frequency
+        self._parameters['interrupter_duty_cycle'] = interrupter_duty_cycle
+        self._parameters['modulator_frequency'] = modulator_frequency
+        self._parameters['modulator_spread'] = modulator_spread
+        self._parameters['modulator_center'] = modulator_center
+
+        self._pwm = EnginePWM(self._parameters)
+        self._interrupter = EngineInterrupter(self._parameters, self._pwm)
+        self._modulator = EngineModulator(self._parameters)
+
+        ready = context.Event()
+        self._process = context.Process(
+            target=_run_engine,
+            name='plasma-engine',
+            args=(buffer, ready, os.getpid(), pwm_factory, tuple(pwm_args),
+                  dict(pwm_kwargs or {}),
+                  {'waveform': modulator_waveform,
+                   'dead_band': modulator_dead_band,
+                   'keepalive': modulator_keepalive,
+                   'render_ahead': modulator_render_ahead,
+                   'update_frequency': update_frequency},
+                  poll_frequency,
+                  (realtime_cpus, realtime_policy, realtime_priority),
+                  logging.getLogger().getEffectiveLevel()),
+            daemon=True)
+        self._process.start()
+        # Runs before multiprocessing's own exit handler, which would
+        # terminate the child without letting it stop the PWM
+        atexit.register(self.close)
+        deadline = time.monotonic() + start_timeout
+        while not ready.wait(0.05):
+            if not self._process.is_alive():
+                raise EngineException(
+                    "Engine process exited while starting, with code "
+                    "{}".format(self._process.exitcode))
+            if time.monotonic() > deadline:
+                self.close()
+                raise EngineException(
+                    "Engine process did not start within {} s".format(
+                        start_timeout))
+
+    @property
+    def pwm(self) -> EnginePWM:
+        return self._pwm
+
+    @property
+    def interrupter(self) -> EngineInterrupter:
+        return self._interrupter
+
+    @property
+    def modulator(self) -> EngineModulator:
+        return self._modulator
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def close(self, timeout: Real=2.0) -> None:
+        """Stop the child, letting it stop and close the PWM"""
+        atexit.unregister(self.close)
+        if self._process.is_alive():
+            self._parameters['running'] = 0
+            self._process.join(timeout)
+        if self._process.is_alive():
+            _logger().warning("Engine process did not stop; terminating it")
+            self._process.terminate()
+            self._process.join()
+
+    def __enter__(self) -> 'ProcessEngine':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class _Engine:
+    """The child's side: applies changes in the block to the real objects"""
+
+    def __init__(self,
+                 block: SeqlockBlock,
+                 parent_pid: int,
+                 pwm: BasePWM,
+                 modulator_kwargs: Dict[str, Any]):
+        self._block = block
+        self._parent_pid = parent_pid
+        self._sequence = None
+        self._counters = (0,) * len(block.fields)
+        _, values, _ = block.read()
+        values = dict(zip(block.fields, values))
+        self._pwm = pwm
+        self._interrupter = SimpleInterrupter(
+            pwm, values['interrupter_frequency'],
+            values['interrupter_duty_cycle'])
+        self._modulator = WavetableModulator(
+            pwm.set_frequency_deferred,
+            frequency=values['modulator_frequency'],
+            spread=values['modulator_spread'],
+            center=values['modulator_center'],
+            **modulator_kwargs)
+        self._done = threading.Event()
+
+    def run(self, poll_frequency: Real) -> None:
+        task = Scheduler.shared().schedule_periodic(
+            self._poll, 1.0 / poll_frequency, priority=PRIORITY_LOW)
+        self._done.wait()
+        task.cancel()
+        self._modulator.stop()
+        self._interrupter.stop()
+        close = getattr(self._pwm, 'close', self._pwm.stop)
+        close()
+
+    def _poll(self) -> None:
+        if os.getppid() != self._parent_pid:
+            _logger().warning("Parent process exited; stopping")
+            self._done.set()
+            return
+        if self._block.sequence == self._sequence:
+            return
+        self._sequence, values, counters = self._block.read()
+        changed = {field for field, old, new
+                   in zip(self._block.fields, self._counters, counters)
+                   if old != new}
+        self._counters = counters
+        try:
+            self._apply(dict(zip(self._block.fields, values)), changed)
+        except Exception:
+            _logger().exception("Unable to apply %s", sorted(changed))
+
+    def _apply(self, values: Dict[str, float], changed: set) -> None:
+        """Apply the changed fields, stopping before and starting after"""
+        if not values['running']:
+            self._done.set()
+            return
+        if 'modulator_on' in changed and not values['modulator_on']:
+            self._modulator.stop()
+        if 'interrupter_on' in changed and not values['interrupter_on']:
+            self._interrupter.stop()
+
+        if 'pwm_frequency' in changed:
+            self._pwm.frequency = values['pwm_frequency']
+        if 'pwm_duty_cycle' in changed:
+            self._pwm.duty_cycle = values['pwm_duty_cycle']
+        if 'pwm_on' in changed:
+            if values['pwm_on']:
+                self._pwm.start()
+            else:
+                self._pwm.stop()
+
+        for target, field, name in (
+                (self._interrupter, 'interrupter_frequency', 'frequency'),
+                (self._interrupter, 'interrupter_duty_cycle', 'duty_cycle'),
+                (self._modulator, 'modulator_frequency', 'frequency'),
+                (self._modulator, 'modulator_spread', 'spread'),
+                (self._modulator, 'modulator_center', 'center')):
+            if field in changed:
+                setattr(target, name, values[field])
+        if 'modulator_waveform' in changed:
+            self._modulator.waveform = _WAVEFORM_NAMES[
+                int(values['modulator_waveform'])]
+
+        if 'interrupter_on' in changed and values['interrupter_on']:
+            self._interrupter.start()
+        if 'modulator_on' in changed and values['modulator_on']:
+            self._modulator.start()
+
+
+def _run_engine(buffer,
+                ready,
+                parent_pid: int,
+                pwm_factory: Callable[..., BasePWM],
+                pwm_args: tuple,
+                pwm_kwargs: dict,
+                modulator_kwargs: dict,
+                poll_frequency: Real,
+                realtime: tuple,
+                log_level: int) -> None:
+    """Entry point of the engine process"""
+    # Ctrl-C reaches the whole process group; the parent stops the engine
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level)
+    engine = _Engine(SeqlockBlock(ENGINE_FIELDS, buffer), parent_pid,
+                     pwm_factory(*pwm_args, **pwm_kwargs), modulator_kwargs)
+    set_up_timing_thread(*realtime)
+    ready.set()
+    engine.run(poll_frequency)
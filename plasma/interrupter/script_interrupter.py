@@ -0,0 +1,185 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import logging
+from numbers import Real
+
+import pigpio
+
+from plasma.interrupter.base_interrupter import (
+    BaseInterrupter, InterrupterException)
+from plasma.pwm.pi_pwm import PiHardwarePWM
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptInterrupter(BaseInterrupter):
+    """Interrupter that runs its on/off loop as a script inside pigpiod
+
+    The loop is uploaded once, with `store_script` when the interrupter is
+    created. Frequency and duty cycle changes, of the interrupter and of the
+    PWM, only update the script's parameters, so the edges are timed by the
+    daemon rather than by Python and the network. The PWM sends its own
+    state to the script (see `PiHardwarePWM.attach_script`), which applies
+    it on the next on edge.
+
+    A duty cycle of 1 or a frequency of 0 leaves the PWM running steadily.
+    Call `close` to free the daemon's script slot.
+    """
+
+    # p0: hardware PWM frequency, p1: duty cycle ticks,
+    # p2: on time (us), p3: off time (us)
+    _SCRIPT = (
+        "tag 0 lda p2 jz 1 hp {pin} p0 p1 mics p2 "
+        "tag 1 lda p3 jz 0 hp {pin} 0 p1 mics p3 jmp 0")
+
+    # Longest delay accepted by the script `mics` command
+    _MAX_PHASE_MICROSECONDS = 1000000
+
+    def __init__(self,
+                 pwm: PiHardwarePWM,
+                 frequency: Real,
+                 duty_cycle: Real=0.5):
+
+        self._is_stopped = True
+        self._is_script_running = False
+        self._script_id = None
+
+        self._validate_frequency(frequency)
+        self._validate_duty_cycle(duty_cycle)
+
+        self._pwm = pwm
+        self._frequency = frequency
+        self._duty_cycle = duty_cycle
+        # Stored now, as storing returns data, which can't be done within
+        # a batch such as the OSC mailbox's
+        self._script_id = pwm.store_script(
+            self._SCRIPT.format(pin=pwm.gpio_pin))
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """Stop the interrupter and delete its script from pigpiod"""
+        self.stop()
+        if self._script_id is not None:
+            try:
+                self._pwm.pi.delete_script(self._script_id)
+            except pigpio.error:
+                logger.exception("Unable to delete script %s",
+                                 self._script_id)
+            self._script_id = None
+
+    @staticmethod
+    def _validate_frequency(frequency: Real):
+        if frequency < 0:
+            raise InterrupterException(
+                "Interrupter frequency should be non-negative, not %s",
+                frequency)
+
+    @staticmethod
+    def _validate_duty_cycle(duty_cycle: Real):
+        if duty_cycle < 0 or duty_cycle > 1:
+            raise InterrupterException(
+                "Interrupter duty cycle should be in [0,1], not %s",
+                duty_cycle)
+
+    @property
+    def frequency(self) -> Real:
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, value: Real):
+        self._validate_frequency(value)
+        self._frequency = value
+        self._update()
+
+    @property
+    def duty_cycle(self) -> Real:
+        return self._duty_cycle
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: Real):
+        self._validate_duty_cycle(value)
+        self._duty_cycle = value
+        self._update()
+
+    @property
+    def pwm(self) -> PiHardwarePWM:
+        return self._pwm
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._is_stopped
+
+    def start(self) -> None:
+        if self.is_stopped:
+            self._is_stopped = False
+            self._update()
+
+    def stop(self) -> None:
+        if not self.is_stopped:
+            self._is_stopped = True
+            self._update()
+
+    def _update(self) -> None:
+        """Bring the script in line with the interrupter state"""
+        should_run = (not self._is_stopped
+                      and self._frequency > 0 and self._duty_cycle < 1)
+        if should_run:
+            params = self._phase_microseconds()
+            if self._is_script_running:
+                self._pwm.attach_script(self._script_id, params)
+            else:
+                try:
+                    self._run_script(params)
+                except Exception:
+                    # Without its script it isn't running
+                    self._is_stopped = True
+                    raise
+        elif self._is_script_running:
+            self._pwm.pi.stop_script(self._script_id)
+            self._is_script_running = False
+            self._pwm.detach_script()
+
+    def _run_script(self, params) -> None:
+        pi = self._pwm.pi
+        if self._script_id is None:
+            self._script_id = self._pwm.store_script(
+                self._SCRIPT.format(pin=self._pwm.gpio_pin))
+        # Parameters are written before the loop starts, so its first edge
+        # already uses the current PWM state.
+        self._pwm.attach_script(self._script_id, params)
+        pi.run_script(self._script_id)
+        self._is_script_running = True
+
+    def _phase_microseconds(self):
+        """On and off times of one period, for p2 and p3"""
+        period = 1e6 / self._frequency
+        on = int(round(period * self._duty_cycle))
+        off = int(round(period)) - on
+        # Keep both phases when rounding would drop one, and stay within
+        # the range `mics` accepts.
+        if self._duty_cycle > 0:
+            on = max(on, 1)
+        off = max(off, 1)
+        return [min(on, self._MAX_PHASE_MICROSECONDS),
+                min(off, self._MAX_PHASE_MICROSECONDS)]
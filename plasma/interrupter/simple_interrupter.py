@@ -20,12 +20,12 @@
 
 import threading
 from numbers import Real
-from concurrent.futures import ThreadPoolExecutor
 import time
 
 from plasma.interrupter.base_interrupter import (
     BaseInterrupter, InterrupterException)
 from plasma.pwm.base_pwm import BasePWM
+from plasma.utils.scheduler import PRIORITY_HIGH, Scheduler
 
 
 class SimpleInterrupter(BaseInterrupter):
@@ -33,12 +33,18 @@ class SimpleInterrupter(BaseInterrupter):
 
     This class is prone to jitter, particularly when the on/off calls to the
     PWM go over a network.
+
+    Each edge is a task on the `Scheduler` (the process-wide one by
+    default), due one phase after the last, so the phase does not drift.
+    With a duty cycle of 0 or 1, or a frequency of 0 (no interruption), the
+    PWM is left off or on and nothing is scheduled until a setting changes.
     """
 
     def __init__(self,
                  pwm: BasePWM,
                  frequency: float,
-                 duty_cycle: float=0.5):
+                 duty_cycle: float=0.5,
+                 scheduler: Scheduler=None):
 
         self._validate_frequency(frequency)
         self._validate_duty_cycle(duty_cycle)
@@ -46,14 +52,11 @@ class SimpleInterrupter(BaseInterrupter):
         self._pwm = pwm
         self._frequency = frequency
         self._duty_cycle = duty_cycle
-        self._is_stopped = True
-
-        self._executor = ThreadPoolExecutor(max_workers=1)
-        self._run_future = None
-        self._stop_signal = True
 
-        self._time_error = 0.0
-        self._run_lock = threading.Lock()
+        self._scheduler = scheduler or Scheduler.shared()
+        self._task = None
+        self._parked = False
+        self._lock = threading.Lock()
 
     def __del__(self):
         self.stop()
@@ -80,6 +83,7 @@ class SimpleInterrupter(BaseInterrupter):
     def frequency(self, value: Real):
         self._validate_frequency(value)
         self._frequency = value
+        self._kick()
 
     @property
     def duty_cycle(self) -> float:
@@ -89,6 +93,7 @@ class SimpleInterrupter(BaseInterrupter):
     def duty_cycle(self, value: float):
         self._validate_duty_cycle(value)
         self._duty_cycle = value
+        self._kick()
 
     @property
     def pwm(self) -> BasePWM:
@@ -96,46 +101,65 @@ class SimpleInterrupter(BaseInterrupter):
 
     @property
     def is_stopped(self) -> bool:
-        return self._is_stopped
+        return self._task is None
 
     def start(self) -> None:
-        if self.is_stopped:
-            self._run_future = self._executor.submit(self._run)
+        with self._lock:
+            if self._task is None:
+                self._parked = False
+                self._task = self._scheduler.schedule(
+                    self._edge, priority=PRIORITY_HIGH)
 
     def stop(self) -> None:
-        if not self.is_stopped:
-            self._stop_signal = True
-            self._wait_for_run_to_finish()
-
-    def _wait_for_run_to_finish(self):
-        self._run_future.result()
-
-    def _run(self) -> None:
-        self._stop_signal = False
-        with self._run_lock:
-            self._is_stopped = False
-            while not self._stop_signal:
-                self._toggle_and_wait()
-            self._is_stopped = True
-
-    def _toggle_and_wait(self):
-        toggle_time = time.time()
-        toggle_seconds = 0.0
-        if self._pwm.is_stopped and self.duty_cycle > 0.0:
-            toggle_seconds = (
-                1.0 / self.frequency * self.duty_cycle - self._time_error)
-            self._pwm.start()
-        elif self.duty_cycle < 1.0:
-            toggle_seconds = (
-                1.0 / self.frequency * (1 - self.duty_cycle)
-                - self._time_error)
-            self._pwm.stop()
-        if toggle_seconds > 0:
-            self._spin_wait(toggle_seconds)
-        self._time_error = time.time() - toggle_time - toggle_seconds
-
-    def _spin_wait(self, time_seconds: float):
-        start = time.time()
-        now = start
-        while now < start + time_seconds and not self._stop_signal:
-            now = time.time()
+        with self._lock:
+            task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+
+    def _kick(self) -> None:
+        """Apply a setting now if it starts or ends the interruption
+
+        Other changes take effect from the next edge.
+        """
+        with self._lock:
+            if self._task is not None and (
+                    self._parked or self._is_steady()):
+                self._parked = False
+                self._task.reschedule(time.perf_counter())
+
+    def _edge(self, deadline: float):
+        with self._lock:
+            self._parked = self._is_steady()
+        if self._parked:
+            self._set_pwm(self._duty_cycle > 0 or self._frequency <= 0)
+            # Nothing to do until a setting changes
+            return None
+        return self._toggle(deadline)
+
+    def _is_steady(self) -> bool:
+        return (self._frequency <= 0
+                or self._duty_cycle <= 0 or self._duty_cycle >= 1)
+
+    def _set_pwm(self, on: bool) -> None:
+        if on == self._pwm.is_stopped:
+            with self._pwm.deferred():
+                if on:
+                    self._pwm.start()
+                else:
+                    self._pwm.stop()
+
+    def _toggle(self, deadline: float) -> float:
+        """Toggle the PWM and return the deadline of the next edge"""
+        period = 1.0 / self._frequency
+        if self._pwm.is_stopped:
+            self._set_pwm(True)
+            deadline += period * self._duty_cycle
+        else:
+            self._set_pwm(False)
+            deadline += period * (1 - self._duty_cycle)
+        now = time.perf_counter()
+        if deadline < now - period:
+            # More than a period behind, e.g. after the host stalled:
+            # restart the schedule rather than rush through the backlog.
+            deadline = now
+        return deadline
@@ -89,6 +89,11 @@ class BaseModulator(ABC):
     def set_center(self, value: Real) -> None:
         self.center = value
 
+    def set_waveform(self, value) -> None:
+        """Change the waveform, for modulators that support it"""
+        raise ModulatorException(
+            "{} has a fixed waveform".format(self.__class__.__name__))
+
     # def __str__(self):
     #     return (f"{self.__class__.__name__}("
     #             f"frequency={self.frequency}, "
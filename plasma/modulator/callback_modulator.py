@@ -17,21 +17,50 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with the Cdf Plasma Controller.  If not, see
 # <http://www.gnu.org/licenses/>.
-import sys
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
 import math
+from array import array
 from numbers import Real
-from typing import Callable
+from typing import Callable, Union
 
-from plasma.modulator.base_modulator import BaseModulator
+from plasma.modulator.base_modulator import BaseModulator, ModulatorException
+from plasma.utils.scheduler import (
+    PRIORITY_LOW, PRIORITY_NORMAL, Scheduler, next_deadline)
 
 
 _2PI = 2 * math.pi
 
+# Most values computed by one call of the render-ahead task. Each takes a
+# waveform call on the scheduler thread, and an update that falls due
+# meanwhile waits for the call to return.
+RENDER_CHUNK = 16
+
 
 class CallbackModulator(BaseModulator):
+    """Modulator that passes each new value to a callback
+
+    A value within `dead_band` of the last one passed on is dropped, unless
+    nothing was passed on for `keepalive` seconds. With the default dead
+    band of 0, only repeats are dropped, e.g. all updates while the
+    modulation frequency or spread is 0.
+
+    The phase, in cycles, is accumulated from the `time.monotonic()`
+    interval between updates, so it stays precise however long the
+    modulator runs and frequency changes do not jump.
+
+    With `render_ahead`, values are computed for the update times on a
+    fixed grid, that many seconds in advance, by a low-priority task into
+    a ring buffer. Each update then only passes on its precomputed value,
+    so a late wakeup delays the value but does not change it. Settings
+    changes re-render the values not yet passed on.
+
+    The render task shares the scheduler thread with the updates, and its
+    priority only orders tasks due at the same time. So it computes at
+    most `RENDER_CHUNK` values per call, then yields to any update that
+    is due before carrying on. An update can still be held up by one
+    chunk.
+    """
 
     def __init__(self,
                  callback: Callable[[Real], None],
@@ -40,7 +69,19 @@ class CallbackModulator(BaseModulator):
                  center: Real,
                  update_frequency: Real = 60.0,
                  waveform: Callable[[Real], Real]=math.sin,
+                 scheduler: Scheduler=None,
+                 dead_band: Union[Real, Callable[[Real], Real]]=0.0,
+                 keepalive: Real=1.0,
+                 render_ahead: Real=0.0,
                  ):
+        """
+        :param dead_band: Largest change not passed on, or a function of
+            the value giving it, e.g. `HardwarePWMQuantizer.resolution`
+        :param keepalive: Longest time (s) without a callback; 0 passes
+            on every update
+        :param render_ahead: Seconds of values to compute in advance; 0
+            computes each value when it is due
+        """
 
         super().__init__()
         self._callback = callback
@@ -50,19 +91,38 @@ class CallbackModulator(BaseModulator):
         self._update_frequency = update_frequency
         self._waveform = waveform
 
-        self._phase_offset = 0.0
-        self._previous_frequency = frequency
+        self._phase = 0.0
+        self._last_time = None
 
-        self._is_stopped = True
-        self._executor = ThreadPoolExecutor(max_workers=1)
-        self._run_future = None
-        self._stop_signal = False
+        # Updates run as a task on the (by default process-wide) scheduler
+        self._scheduler = scheduler or Scheduler.shared()
+        self._task = None
+        self._lock = threading.Lock()
 
-        self._time_error = 0.0
-        self._run_lock = threading.Lock()
+        self._dead_band = dead_band
+        self._keepalive = keepalive
+        self._last_value = None
+        self._last_callback_time = None
+        self._emitted_count = 0
+        self._suppressed_count = 0
 
-        # The switch interval should not be changed after this
-        self._thread_switch_interval = sys.getswitchinterval()
+        self._render_task = None
+        if render_ahead < 0:
+            raise ModulatorException(
+                "render_ahead must be >= 0, not {}".format(render_ahead))
+        # Ring buffers of the value, and the phase it was computed at, for
+        # update slots [_rendered_to - size, _rendered_to). Slot n is due
+        # at _origin + n / update_frequency, and _next_slot is the next
+        # one to pass on.
+        self._render_ahead = render_ahead
+        self._render_slots = int(math.ceil(render_ahead * update_frequency))
+        size = self._render_slots + 1 if self._render_slots else 0
+        self._values = array('d', [0.0]) * size
+        self._phases = array('d', [0.0]) * size
+        self._origin = 0.0
+        self._next_slot = 0
+        self._rendered_to = 0
+        self._underrun_count = 0
 
     def __del__(self):
         self.stop()
@@ -74,6 +134,7 @@ class CallbackModulator(BaseModulator):
     @frequency.setter
     def frequency(self, value: Real) -> None:
         self._frequency = value
+        self._discard_rendered()
 
     @property
     def spread(self) -> Real:
@@ -82,6 +143,7 @@ class CallbackModulator(BaseModulator):
     @spread.setter
     def spread(self, value: Real):
         self._spread = value
+        self._discard_rendered()
 
     @property
     def center(self) -> Real:
@@ -90,64 +152,161 @@ class CallbackModulator(BaseModulator):
     @center.setter
     def center(self, value: Real) -> None:
         self._center = value
+        self._discard_rendered()
 
     @property
     def update_frequency(self) -> Real:
         return self._update_frequency
 
+    @property
+    def render_ahead(self) -> Real:
+        return self._render_ahead
+
+    @property
+    def emitted_count(self) -> int:
+        """Updates passed on to the callback"""
+        return self._emitted_count
+
+    @property
+    def suppressed_count(self) -> int:
+        """Updates dropped within the dead band"""
+        return self._suppressed_count
+
+    @property
+    def underrun_count(self) -> int:
+        """Updates due before their value was rendered ahead"""
+        return self._underrun_count
+
     @property
     def is_stopped(self) -> bool:
-        return self._is_stopped
+        return self._task is None
 
     def start(self) -> None:
-        if self.is_stopped:
-            self._stop_signal = False
-            self._run_future = self._executor.submit(self._run)
+        with self._lock:
+            if self._task is None:
+                # Whatever was sent last, the first update goes through,
+                # and the phase carries on from where it stopped
+                self._last_value = None
+                self._last_time = None
+                if not self._render_slots:
+                    self._task = self._scheduler.schedule(
+                        self._update, priority=PRIORITY_NORMAL)
+                    return
+                self._origin = time.perf_counter()
+                self._next_slot = 0
+                self._rendered_to = 0
+                self._render(self._render_slots)
+                self._task = self._scheduler.schedule(
+                    self._emit_rendered, self._origin, PRIORITY_NORMAL)
+                self._render_task = self._scheduler.schedule(
+                    self._render_ahead_task, priority=PRIORITY_LOW)
 
     def stop(self) -> None:
-        self._stop_signal = True
-        if not self.is_stopped:
-            self._wait_for_run_to_finish()
-
-    def _wait_for_run_to_finish(self):
-        self._run_future.result()
-
-    def _run(self) -> None:
-        with self._run_lock:
-            self._is_stopped = False
-            self._run_timing_loop()
-            self._is_stopped = True
-
-    def _run_timing_loop(self) -> None:
-        while not self._stop_signal:
-            callback_start_time = time.time()
-            self._do_callback(callback_start_time)
-            callback_seconds = time.time() - callback_start_time
-            wait_seconds = max(
-                0.0, 1.0 / self._update_frequency - callback_seconds)
-            self._wait(wait_seconds)
+        with self._lock:
+            task, self._task = self._task, None
+            render_task, self._render_task = self._render_task, None
+        if task is not None:
+            task.cancel()
+        if render_task is not None:
+            render_task.cancel()
+            # A restart carries on from the last value passed on
+            self._discard_rendered()
+
+    def _update(self, deadline: Real) -> Real:
+        self._do_callback(time.monotonic())
+        return next_deadline(deadline, 1.0 / self._update_frequency)
 
     def _do_callback(self, current_time: Real) -> None:
-        self._callback(self._compute_callback_arg(current_time))
+        self._emit(self._compute_callback_arg(current_time), current_time)
+
+    def _emit(self, value: Real, current_time: Real) -> None:
+        if self._is_suppressed(value, current_time):
+            self._suppressed_count += 1
+            return
+        self._callback(value)
+        self._last_value = value
+        self._last_callback_time = current_time
+        self._emitted_count += 1
+
+    def _is_suppressed(self, value: Real, current_time: Real) -> bool:
+        if self._last_value is None or (
+                current_time - self._last_callback_time >= self._keepalive):
+            return False
+        dead_band = self._dead_band
+        if callable(dead_band):
+            dead_band = dead_band(value)
+        return abs(value - self._last_value) <= dead_band
+
+    def _emit_rendered(self, deadline: Real) -> Real:
+        period = 1.0 / self._update_frequency
+        with self._lock:
+            # A late wakeup resyncs its deadline off the grid, so round to
+            # the nearest slot, and never go back
+            slot = max(int(round((deadline - self._origin) / period)),
+                       self._next_slot)
+            if slot >= self._rendered_to:
+                self._underrun_count += 1
+                self._render(slot + 1)
+            value = self._values[slot % len(self._values)]
+            self._next_slot = slot + 1
+        self._emit(value, self._slot_time(slot))
+        return next_deadline(deadline, period)
+
+    def _render_ahead_task(self, deadline: Real) -> Real:
+        with self._lock:
+            end = self._next_slot + self._render_slots
+            self._render(min(end, self._rendered_to + RENDER_CHUNK))
+            if self._rendered_to < end:
+                # Due now, so updates due already run first
+                return time.perf_counter()
+        return next_deadline(deadline, self._render_ahead / 2)
+
+    def _render(self, end: int) -> None:
+        """Render the slots up to `end`; called with the lock held"""
+        size = len(self._values)
+        # Slots that would be overwritten before they are due are skipped;
+        # the phase accumulates over the gap
+        for slot in range(max(self._rendered_to, end - size), end):
+            current_time = self._slot_time(slot)
+            self._values[slot % size] = self._compute_callback_arg(
+                current_time)
+            self._phases[slot % size] = self._phase
+        self._rendered_to = max(self._rendered_to, end)
+
+    def _discard_rendered(self) -> None:
+        """Re-render the slots not yet passed on, e.g. after a change"""
+        with self._lock:
+            if self._rendered_to <= self._next_slot:
+                return
+            # Back to the phase of the last slot passed on, which the ring
+            # buffer always still holds
+            slot = self._next_slot - 1
+            self._phase = self._phases[max(slot, 0) % len(self._phases)]
+            self._last_time = self._slot_time(slot) if slot >= 0 else None
+            self._rendered_to = self._next_slot
+            render_task = self._render_task
+            if render_task is not None:
+                # The next few here rather than as an underrun on the
+                # timing thread, and the rest by the render task
+                self._render(self._next_slot + min(self._render_slots,
+                                                   RENDER_CHUNK))
+        if render_task is not None:
+            render_task.reschedule(time.perf_counter())
+
+    def _slot_time(self, slot: int) -> float:
+        return self._origin + slot / self._update_frequency
+
+    def _advance_phase(self, current_time: Real) -> float:
+        """The phase in cycles, in [0, 1), at `current_time`"""
+        if self._last_time is not None:
+            # Only the time since the last update runs at the current
+            # frequency, so frequency changes are phase-continuous
+            self._phase = (self._phase + self._frequency * (
+                current_time - self._last_time)) % 1.0
+        self._last_time = current_time
+        return self._phase
 
     def _compute_callback_arg(self, current_time: Real):
-        # Compute the new phase offset so that frequency changes
-        # do not create discontinuities
-        self._phase_offset = (
-                self._phase_offset + _2PI*current_time * (
-                    1.0 * self._previous_frequency - 1.0 * self._frequency
-                )) % _2PI
-        phase = (
-            _2PI*current_time * self.frequency + self._phase_offset) % _2PI
-        self._previous_frequency = self._frequency
-        return max(0, self.spread * self._waveform(phase) + self.center)
-
-    def _wait(self, time_seconds: float):
-        sleep_time = max(0, time_seconds - 0.5*self._thread_switch_interval)
-        now = time.time()
-        end = now + time_seconds
-        time.sleep(sleep_time)
-
-        # Spin wait for remaining time
-        while now < end and not self._stop_signal:
-            now = time.time()
+        phase = self._advance_phase(current_time)
+        return max(0, self.spread * self._waveform(_2PI * phase)
+                   + self.center)
@@ -0,0 +1,343 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+from numbers import Real
+from typing import Dict, List, Sequence, Tuple, Union
+
+from plasma.interrupter.base_interrupter import BaseInterrupter
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.wavetable_modulator import get_table, lookup
+from plasma.player.score import Score
+from plasma.pwm.base_pwm import BasePWM
+from plasma.utils.scheduler import PRIORITY_NORMAL, Scheduler, next_deadline
+
+
+# Parameters a matrix can modulate, with the range each is clamped to
+MATRIX_TARGETS = {
+    'pwm-frequency': (0.0, float('inf')),
+    'pwm-duty-cycle': (0.0, 1.0),
+    'interrupter-frequency': (0.0, float('inf')),
+    'interrupter-duty-cycle': (0.0, 1.0),
+}
+
+# How a route combines a source with its target
+ROUTE_MODES = ('add', 'multiply')
+
+
+def _logger():
+    return logging.getLogger(__name__)
+
+
+class LFO:
+    """Low-frequency oscillator reading a wavetable, in [-1, 1]"""
+
+    def __init__(self,
+                 frequency: Real,
+                 waveform: Union[str, Sequence[Real]]='sine'):
+        """
+        :param frequency: Cycles per second
+        :param waveform: As for `WavetableModulator`
+        """
+        self.frequency = frequency
+        self._table = get_table(waveform)
+        self._phase = 0.0
+
+    def step(self, seconds: Real) -> float:
+        """Advance by `seconds` and return the new value"""
+        self._phase = (self._phase + self.frequency * seconds) % 1.0
+        return lookup(self._table, self._phase)
+
+
+class Envelope:
+    """Linear attack-decay-sustain-release envelope, in [0, 1]
+
+    It rises while the gate is open and falls to 0 once it closes.
+    """
+
+    def __init__(self,
+                 attack: Real,
+                 decay: Real,
+                 sustain: Real,
+                 release: Real):
+        """
+        :param attack: Seconds from 0 to 1
+        :param decay: Seconds from 1 to `sustain`
+        :param sustain: Level held while the gate is open
+        :param release: Seconds from 1 to 0 once the gate closes
+        """
+        if min(attack, decay, release) < 0 or not 0 <= sustain <= 1:
+            raise ModulatorException(
+                "Envelope times should be non-negative and the sustain "
+                "level in [0, 1]")
+        self._attack = attack
+        self._decay = decay
+        self._sustain = sustain
+        self._release = release
+        self._is_open = False
+        self._is_decaying = False
+        self._level = 0.0
+
+    def gate(self, is_open: bool) -> None:
+        """Open the gate to start the envelope, close it to release"""
+        if is_open and not self._is_open:
+            self._is_decaying = False
+        self._is_open = bool(is_open)
+
+    def step(self, seconds: Real) -> float:
+        level = self._level
+        if not self._is_open:
+            level -= seconds / self._release if self._release else level
+            level = max(level, 0.0)
+        elif not self._is_decaying:
+            level += seconds / self._attack if self._attack else 1.0
+            if level >= 1.0:
+                level = 1.0
+                self._is_decaying = True
+        else:
+            span = 1.0 - self._sustain
+            if self._decay and span:
+                level -= span * seconds / self._decay
+            level = max(level, self._sustain)
+        self._level = level
+        return level
+
+
+class ScoreLane:
+    """A `Score` played from the time the lane is added"""
+
+    def __init__(self, score: Score):
+        self._score = score
+        self._time = 0.0
+
+    def step(self, seconds: Real) -> float:
+        self._time += seconds
+        return self._score.sample(self._time)
+
+
+class ModulationMatrix:
+    """Sums or multiplies named sources onto PWM and interrupter settings
+
+    Every tick steps all sources once, combines each target's routes,
+
+        base + sum(amount * source)              ('add' routes)
+        * product(1 + amount * source)           ('multiply' routes)
+
+    and writes the targets, the PWM frequency and duty cycle together in
+    one deferred write. A target's base is its current setting: a value
+    set by anything but the matrix, e.g. over OSC, becomes the new base.
+    Targets are put back to their bases when they lose their last route
+    or the matrix stops.
+
+    Ticks run as one task on the `Scheduler`, however many sources and
+    routes there are.
+    """
+
+    def __init__(self,
+                 pwm: BasePWM,
+                 interrupter: BaseInterrupter=None,
+                 update_frequency: Real=50.0,
+                 scheduler: Scheduler=None):
+        self._pwm = pwm
+        self._interrupter = interrupter
+        self._update_frequency = update_frequency
+        self._scheduler = scheduler or Scheduler.shared()
+        self._task = None
+        self._lock = threading.Lock()
+
+        self._sources = {}
+        self._routes = {}
+        # Rebuilt on changes: the sources, and for each routed target the
+        # (source index, amount) pairs to add and to multiply by
+        self._source_list = []
+        self._plan = []
+        self._bases = {}
+        self._written = {}
+        self._last_deadline = None
+
+    @property
+    def update_frequency(self) -> Real:
+        return self._update_frequency
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._task is None
+
+    @property
+    def sources(self) -> Dict[str, object]:
+        with self._lock:
+            return dict(self._sources)
+
+    @property
+    def routes(self) -> Dict[Tuple[str, str], Tuple[Real, str]]:
+        """{(source, target): (amount, mode)}"""
+        with self._lock:
+            return dict(self._routes)
+
+    def add_source(self, name: str, source) -> None:
+        """Add or replace a source: anything with a `step(seconds)` method"""
+        with self._lock:
+            self._sources[name] = source
+            self._rebuild()
+
+    def remove_source(self, name: str) -> None:
+        """Remove a source and its routes"""
+        with self._lock:
+            self._sources.pop(name, None)
+            for key in [key for key in self._routes if key[0] == name]:
+                del self._routes[key]
+            self._rebuild()
+
+    def gate(self, name: str, is_open: bool) -> None:
+        """Open or close the gate of an `Envelope` source"""
+        with self._lock:
+            source = self._sources.get(name)
+        if not isinstance(source, Envelope):
+            raise ModulatorException(
+                "No envelope named {!r}".format(name))
+        source.gate(is_open)
+
+    def route(self,
+              source: str,
+              target: str,
+              amount: Real,
+              mode: str='add') -> None:
+        """Route `source`, scaled by `amount`, to `target`"""
+        if target not in MATRIX_TARGETS:
+            raise ModulatorException(
+                "Unknown target {!r}; expected one of {}".format(
+                    target, sorted(MATRIX_TARGETS)))
+        if mode not in ROUTE_MODES:
+            raise ModulatorException(
+                "Unknown route mode {!r}; expected one of {}".format(
+                    mode, ROUTE_MODES))
+        if target.startswith('interrupter') and self._interrupter is None:
+            raise ModulatorException("No interrupter to modulate")
+        with self._lock:
+            if source not in self._sources:
+                raise ModulatorException(
+                    "No source named {!r}".format(source))
+            self._routes[(source, target)] = (amount, mode)
+            self._rebuild()
+
+    def unroute(self, source: str, target: str) -> None:
+        with self._lock:
+            self._routes.pop((source, target), None)
+            self._rebuild()
+
+    def clear(self) -> None:
+        """Remove all sources and routes"""
+        with self._lock:
+            self._sources.clear()
+            self._routes.clear()
+            self._rebuild()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._task is None:
+                self._last_deadline = None
+                self._task = self._scheduler.schedule(
+                    self._tick, priority=PRIORITY_NORMAL)
+
+    def stop(self) -> None:
+        with self._lock:
+            task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with self._lock:
+                self._restore(list(self._written))
+
+    def _rebuild(self) -> None:
+        """Recompute the plan; called with the lock held"""
+        names = sorted(self._sources)
+        index = {name: i for i, name in enumerate(names)}
+        plan = []
+        for target in MATRIX_TARGETS:
+            added = []
+            multiplied = []
+            for (source, routed_target), (amount, mode) in \
+                    sorted(self._routes.items()):
+                if routed_target == target:
+                    routes = added if mode == 'add' else multiplied
+                    routes.append((index[source], amount))
+            if added or multiplied:
+                plan.append((target, added, multiplied))
+        self._source_list = [self._sources[name] for name in names]
+        self._plan = plan
+        routed = {target for target, _, _ in plan}
+        self._restore([t for t in self._written if t not in routed])
+
+    def _tick(self, deadline: Real) -> Real:
+        period = 1.0 / self._update_frequency
+        seconds = period if self._last_deadline is None \
+            else deadline - self._last_deadline
+        self._last_deadline = deadline
+        with self._lock:
+            values = [source.step(seconds) for source in self._source_list]
+            outputs = {}
+            for target, added, multiplied in self._plan:
+                value = self._base(target)
+                for i, amount in added:
+                    value += amount * values[i]
+                for i, amount in multiplied:
+                    value *= 1 + amount * values[i]
+                low, high = MATRIX_TARGETS[target]
+                outputs[target] = min(max(value, low), high)
+            self._write(outputs)
+        return next_deadline(deadline, period)
+
+    def _base(self, target: str) -> float:
+        value = self._get(target)
+        if target not in self._written or value != self._written[target]:
+            # Set by something other than the matrix
+            self._bases[target] = value
+        return self._bases[target]
+
+    def _get(self, target: str) -> float:
+        if target == 'pwm-frequency':
+            return self._pwm.frequency
+        if target == 'pwm-duty-cycle':
+            return self._pwm.duty_cycle
+        if target == 'interrupter-frequency':
+            return self._interrupter.frequency
+        return self._interrupter.duty_cycle
+
+    def _write(self, outputs: Dict[str, float]) -> None:
+        if 'pwm-frequency' in outputs or 'pwm-duty-cycle' in outputs:
+            with self._pwm.deferred():
+                self._pwm.set_output(
+                    outputs.get('pwm-frequency', self._pwm.frequency),
+                    outputs.get('pwm-duty-cycle', self._pwm.duty_cycle))
+        if 'interrupter-frequency' in outputs:
+            self._interrupter.frequency = outputs['interrupter-frequency']
+        if 'interrupter-duty-cycle' in outputs:
+            self._interrupter.duty_cycle = outputs['interrupter-duty-cycle']
+        self._written.update(outputs)
+
+    def _restore(self, targets: List[str]) -> None:
+        """Put `targets` back to their bases, unless since set elsewhere"""
+        outputs = {}
+        for target in targets:
+            if self._get(target) == self._written.pop(target):
+                outputs[target] = self._bases[target]
+        self._write(outputs)
+        for target in outputs:
+            del self._written[target]
@@ -0,0 +1,204 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import logging
+import math
+from numbers import Integral, Real
+from typing import Callable
+
+import pigpio
+
+from plasma.modulator.base_modulator import BaseModulator, ModulatorException
+from plasma.pwm.pi_pwm import PiHardwarePWM
+
+
+logger = logging.getLogger(__name__)
+
+
+_2PI = 2 * math.pi
+
+
+class ScriptModulator(BaseModulator):
+    """Frequency modulator that steps through a waveform table in pigpiod
+
+    One period of `waveform` is sampled into `steps` values and unrolled
+    into a pigpio script, stored once when the modulator is created. The
+    script writes `center + spread * waveform` to the hardware PWM at each
+    step, so the update rate is `steps * frequency` with no per-update work
+    in Python. `frequency`, `spread` and `center` are script parameters:
+    changing them only sends `update_script`.
+
+    The PWM's own frequency is not used while modulating, but stopping the
+    PWM still turns the output off. The PWM drives one script at a time, so
+    this can't be combined with a `ScriptInterrupter`. Call `close` to free
+    the daemon's script slot.
+    """
+
+    # Waveform values are sent as integers in thousandths
+    _TABLE_SCALE = 1000
+
+    # Longest delay accepted by the script `mics` command
+    _MAX_STEP_MICROSECONDS = 1000000
+
+    def __init__(self,
+                 pwm: PiHardwarePWM,
+                 frequency: Real,
+                 spread: Real,
+                 center: Real,
+                 steps: Integral=64,
+                 waveform: Callable[[Real], Real]=math.sin,
+                 ):
+        """
+        :param pwm: PWM to modulate
+        :param frequency: Modulation frequency (Hz)
+        :param spread: Amplitude of the modulation (Hz)
+        :param center: Center frequency (Hz)
+        :param steps: Table entries per modulation period
+        :param waveform: Function of the phase, in [-1, 1]
+        """
+        self._is_stopped = True
+        self._is_script_running = False
+        self._script_id = None
+
+        if steps < 1:
+            raise ModulatorException(
+                "Modulator steps should be positive, not %s", steps)
+
+        self._pwm = pwm
+        self._frequency = frequency
+        self._spread = spread
+        self._center = center
+        self._steps = steps
+        self._table = [
+            int(round(self._TABLE_SCALE * waveform(_2PI * i / steps)))
+            for i in range(steps)]
+        # Stored now, as storing returns data, which can't be done within
+        # a batch such as the OSC mailbox's
+        self._script_id = pwm.store_script(self._script())
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """Stop modulating and delete the script from pigpiod"""
+        self.stop()
+        if self._script_id is not None:
+            try:
+                self._pwm.pi.delete_script(self._script_id)
+            except pigpio.error:
+                logger.exception("Unable to delete script %s",
+                                 self._script_id)
+            self._script_id = None
+
+    @property
+    def frequency(self) -> Real:
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, value: Real) -> None:
+        self._frequency = value
+        self._update()
+
+    @property
+    def spread(self) -> Real:
+        return self._spread
+
+    @spread.setter
+    def spread(self, value: Real):
+        self._spread = value
+        self._update()
+
+    @property
+    def center(self) -> Real:
+        return self._center
+
+    @center.setter
+    def center(self, value: Real) -> None:
+        self._center = value
+        self._update()
+
+    @property
+    def update_frequency(self) -> Real:
+        return self._steps * self._frequency
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._is_stopped
+
+    def start(self) -> None:
+        if self.is_stopped:
+            self._is_stopped = False
+            self._update()
+
+    def stop(self) -> None:
+        if not self.is_stopped:
+            self._is_stopped = True
+            self._update()
+
+    def _update(self) -> None:
+        """Bring the script in line with the modulator state"""
+        if not self._is_stopped and self._frequency > 0:
+            params = self._script_params()
+            if self._is_script_running:
+                self._pwm.attach_script(self._script_id, params)
+            else:
+                try:
+                    self._run_script(params)
+                except Exception:
+                    # Without its script it isn't running
+                    self._is_stopped = True
+                    raise
+        elif self._is_script_running:
+            self._pwm.pi.stop_script(self._script_id)
+            self._is_script_running = False
+            self._pwm.detach_script()
+
+    def _run_script(self, params) -> None:
+        if self._script_id is None:
+            self._script_id = self._pwm.store_script(self._script())
+        self._pwm.attach_script(self._script_id, params)
+        self._pwm.pi.run_script(self._script_id)
+        self._is_script_running = True
+
+    def _script(self) -> str:
+        """Unrolled table loop
+
+        p0: hardware PWM frequency, 0 while the PWM is stopped
+        p1: duty cycle ticks
+        p2: step time (us)
+        p3: center (Hz)
+        p4: spread (Hz)
+        """
+        steps = " ".join(
+            "lda p4 mlt {} call 1".format(value) for value in self._table)
+        return (
+            "tag 0 {steps} jmp 0 "
+            "tag 1 div {scale} add p3 jm 2 sta v0 lda p0 jz 2 "
+            "hp {pin} v0 p1 mics p2 ret "
+            # Negative frequencies, like a stopped PWM, turn the output off
+            "tag 2 hp {pin} 0 p1 mics p2 ret").format(
+                steps=steps, scale=self._TABLE_SCALE,
+                pin=self._pwm.gpio_pin)
+
+    def _script_params(self):
+        """p2 to p4"""
+        step = int(round(1e6 / (self._frequency * self._steps)))
+        step = min(max(step, 1), self._MAX_STEP_MICROSECONDS)
+        return [step, int(round(self._center)), int(round(self._spread))]
@@ -0,0 +1,210 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import math
+import random
+from array import array
+from numbers import Integral, Real
+from typing import Callable, Sequence, Union
+
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.utils.scheduler import Scheduler
+
+
+_2PI = 2 * math.pi
+
+DEFAULT_TABLE_SIZE = 1024
+
+
+def render_table(waveform: Callable[[Real], Real],
+                 size: Integral=DEFAULT_TABLE_SIZE) -> array:
+    """Sample one period of `waveform`, a function of the phase in radians"""
+    return array('d', (waveform(_2PI * i / size) for i in range(size)))
+
+
+def sine_table(size: Integral=DEFAULT_TABLE_SIZE) -> array:
+    return render_table(math.sin, size)
+
+
+def triangle_table(size: Integral=DEFAULT_TABLE_SIZE) -> array:
+    """Rises from 0 to 1, falls to -1 and rises back, in phase with sine"""
+    def triangle(phase: Real) -> Real:
+        x = phase / _2PI
+        return 4 * x if x < 0.25 else 2 - 4 * x if x < 0.75 else 4 * x - 4
+    return render_table(triangle, size)
+
+
+def saw_table(size: Integral=DEFAULT_TABLE_SIZE) -> array:
+    """Rises from -1 to 1 over the period"""
+    return render_table(lambda phase: phase / math.pi - 1, size)
+
+
+def square_table(size: Integral=DEFAULT_TABLE_SIZE) -> array:
+    return render_table(lambda phase: 1.0 if phase < math.pi else -1.0, size)
+
+
+def smoothed_random_table(size: Integral=DEFAULT_TABLE_SIZE,
+                          points: Integral=16,
+                          seed: int=None) -> array:
+    """`points` random levels in [-1, 1], joined by cosine interpolation
+
+    The table wraps smoothly, so it loops without a jump.
+    """
+    rng = random.Random(seed)
+    levels = [rng.uniform(-1, 1) for _ in range(points)]
+    table = array('d')
+    for i in range(size):
+        position = i * points / size
+        j = int(position)
+        weight = (1 - math.cos(math.pi * (position - j))) / 2
+        table.append(levels[j] * (1 - weight)
+                     + levels[(j + 1) % points] * weight)
+    return table
+
+
+def load_table(path: str) -> array:
+    """Read a table from a text file of values in [-1, 1]
+
+    Values are separated by commas or whitespace; text after `#` on a line
+    is ignored.
+    """
+    table = array('d')
+    with open(path, 'r') as fp:
+        for line in fp:
+            line = line.split('#', 1)[0]
+            table.extend(float(v) for v in line.replace(',', ' ').split())
+    return _validate_table(table, path)
+
+
+def _validate_table(table: Sequence[Real], name: str='table') -> array:
+    if len(table) < 2:
+        raise ModulatorException(
+            "Wavetable {} needs at least 2 values, not {}".format(
+                name, len(table)))
+    if min(table) < -1 or max(table) > 1:
+        raise ModulatorException(
+            "Wavetable {} values should be in [-1, 1]".format(name))
+    return array('d', table)
+
+
+def lookup(table: Sequence[Real], phase: Real) -> float:
+    """Interpolate `table` at `phase`, in cycles in [0, 1)"""
+    size = len(table)
+    position = phase * size
+    i = int(position)
+    # A phase that rounds up to 1.0 wraps to the start of the table
+    value = table[i % size]
+    return value + (table[(i + 1) % size] - value) * (position - i)
+
+
+def table_function(table: Sequence[Real]) -> Callable[[Real], Real]:
+    """The function of the phase (radians) that interpolates `table`
+
+    For code that takes a waveform function, e.g. `ScriptModulator`.
+    """
+    def waveform(phase: Real) -> Real:
+        return lookup(table, phase / _2PI % 1.0)
+    return waveform
+
+
+# Built-in tables, by the name used on the command line and over OSC
+WAVEFORMS = {
+    'sine': sine_table,
+    'triangle': triangle_table,
+    'saw': saw_table,
+    'square': square_table,
+    'random': smoothed_random_table,
+}
+
+
+def get_table(waveform: Union[str, Sequence[Real]]) -> array:
+    """The table for a name in `WAVEFORMS`, a file path, or a sequence"""
+    if not isinstance(waveform, str):
+        return _validate_table(waveform)
+    if waveform in WAVEFORMS:
+        return WAVEFORMS[waveform]()
+    try:
+        return load_table(waveform)
+    except (OSError, ValueError) as e:
+        raise ModulatorException(
+            "Unknown waveform {!r}; expected one of {} or a table "
+            "file: {}".format(waveform, sorted(WAVEFORMS), e))
+
+
+class WavetableModulator(CallbackModulator):
+    """Callback modulator that reads its waveform from a table
+
+    The waveform is rendered once; each update advances a phase
+    accumulator by `frequency` times the time since the last update and
+    interpolates linearly between the neighbouring table entries. Every
+    waveform therefore costs the same per update, and frequency changes
+    don't make the output jump.
+
+    The waveform can be replaced while running, by name (see `WAVEFORMS`),
+    table file, or sequence of values in [-1, 1].
+    """
+
+    def __init__(self,
+                 callback: Callable[[Real], None],
+                 frequency: Real,
+                 spread: Real,
+                 center: Real,
+                 update_frequency: Real=60.0,
+                 waveform: Union[str, Sequence[Real]]='sine',
+                 scheduler: Scheduler=None,
+                 dead_band: Union[Real, Callable[[Real], Real]]=0.0,
+                 keepalive: Real=1.0,
+                 render_ahead: Real=0.0):
+        """
+        :param waveform: Name in `WAVEFORMS`, table file, or one period of
+            values in [-1, 1]
+
+        See `CallbackModulator` for the other parameters.
+        """
+        super().__init__(callback, frequency, spread, center,
+                         update_frequency=update_frequency,
+                         scheduler=scheduler, dead_band=dead_band,
+                         keepalive=keepalive, render_ahead=render_ahead)
+        self._table = get_table(waveform)
+        self._waveform_name = waveform if isinstance(waveform, str) else None
+
+    @property
+    def waveform(self) -> Union[str, None]:
+        """The waveform name or file, or None for a sequence"""
+        return self._waveform_name
+
+    @waveform.setter
+    def waveform(self, value: Union[str, Sequence[Real]]) -> None:
+        # Swapped in one assignment, so an update sees the old or new table
+        self._table = get_table(value)
+        self._waveform_name = value if isinstance(value, str) else None
+        self._discard_rendered()
+
+    def set_waveform(self, value: Union[str, Sequence[Real]]) -> None:
+        self.waveform = value
+
+    @property
+    def table(self) -> array:
+        return self._table
+
+    def _compute_callback_arg(self, current_time: Real):
+        value = lookup(self._table, self._advance_phase(current_time))
+        return max(0, self.spread * value + self.center)
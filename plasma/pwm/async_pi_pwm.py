@@ -0,0 +1,152 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""PWM driven from an asyncio event loop; requires Python 3.5.2 or newer"""
+import asyncio
+import collections
+import logging
+import threading
+from numbers import Integral
+
+import pigpio
+
+from plasma.utils.async_pigpio import AsyncPi
+from .base_pwm import BasePWM
+from .pi_pwm import HardwarePWMState, PiPWMException
+from .quantization import HardwarePWMQuantizer
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPiHardwarePWM(HardwarePWMState, BasePWM):
+    """Hardware PWM for the RPi driven from an asyncio event loop
+
+    The setters keep the synchronous `BasePWM` interface: they record the
+    new state and schedule a write on the loop. At most one write is in
+    flight at a time. Frequency and duty cycle changes made while it is in
+    flight are coalesced into the next one, but every `start` and `stop` is
+    written, in order. Setters may also be called from other threads, in
+    which case the write is handed to the loop thread. While the loop is
+    not running (e.g., during setup and shutdown), setters write through.
+
+    Create instances on the loop with `connect`:
+
+        pwm = await AsyncPiHardwarePWM.connect(18, host, port)
+    """
+
+    def __init__(self, pi: AsyncPi, gpio_pin: Integral,
+                 loop: asyncio.AbstractEventLoop=None,
+                 pwm_clock: Integral=None):
+        """
+        :param pi: A connected `AsyncPi`
+        :param gpio_pin: BCM pin with a hardware PWM channel
+        :param loop: The loop `pi` runs on (default: the current loop)
+        :param pwm_clock: PWM clock of the Pi (Hz), as for `PiHardwarePWM`
+        """
+        if not pi.connected:
+            raise PiPWMException("AsyncPi is not connected")
+        self._pi = pi
+        self._init_state(gpio_pin)
+        if pwm_clock is not None:
+            self._quantizer = HardwarePWMQuantizer(pwm_clock)
+        self._loop = loop or asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+
+        # Loop-side write state; other threads only append to _edges
+        self._edges = collections.deque()
+        self._is_dirty = False
+        self._last_written = None
+        self._flush_task = None
+
+    @classmethod
+    async def connect(cls, gpio_pin: Integral, host: str=None,
+                      port: Integral=8888,
+                      pwm_clock: Integral=None) -> 'AsyncPiHardwarePWM':
+        pi = await AsyncPi(host, port).connect()
+        return cls(pi, gpio_pin, pwm_clock=pwm_clock)
+
+    def close(self) -> None:
+        """Stop the PWM and disconnect, if the loop is not running"""
+        self.stop()
+        if not self._loop.is_running():
+            self._loop.run_until_complete(self._pi.close())
+
+    async def aclose(self) -> None:
+        """Stop the PWM and disconnect from within the loop"""
+        self.stop()
+        await self.flush()
+        await self._pi.close()
+
+    def start(self) -> None:
+        if self._is_stopped:
+            self._is_stopped = self._frequency <= 0.0
+            self._write_edge()
+
+    def stop(self) -> None:
+        if not self._is_stopped:
+            self._is_stopped = True
+            self._write_edge()
+
+    async def flush(self) -> None:
+        """Wait until the hardware matches the current state"""
+        while self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+
+    def _write_edge(self) -> None:
+        self._edges.append(self._hardware_state())
+        self._request_flush()
+
+    def _sync_hardware(self) -> None:
+        self._is_dirty = True
+        self._request_flush()
+
+    def _request_flush(self) -> None:
+        if threading.get_ident() != self._loop_thread_id:
+            self._loop.call_soon_threadsafe(self._schedule_flush)
+            return
+        self._schedule_flush()
+        if not self._loop.is_running():
+            self._loop.run_until_complete(self.flush())
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None and (self._edges or self._is_dirty):
+            self._flush_task = asyncio.ensure_future(
+                self._flush(), loop=self._loop)
+
+    async def _flush(self) -> None:
+        try:
+            while self._edges or self._is_dirty:
+                if self._edges:
+                    state = self._edges.popleft()
+                else:
+                    self._is_dirty = False
+                    state = self._hardware_state()
+                if state == self._last_written:
+                    continue
+                try:
+                    await self._pi.hardware_PWM(self._pin, *state)
+                except pigpio.error:
+                    logger.exception("hardware_PWM%s failed",
+                                     (self._pin,) + state)
+                else:
+                    self._last_written = state
+        finally:
+            self._flush_task = None
@@ -19,6 +19,7 @@
 # <http://www.gnu.org/licenses/>.
 
 from abc import ABC, abstractmethod
+from contextlib import ExitStack
 from numbers import Real
 
 
@@ -76,6 +77,27 @@ class BasePWM(ABC):
     def set_frequency(self, value: Real) -> None:
         self.frequency = value
 
+    def set_output(self, frequency: Real, duty_cycle: Real) -> None:
+        """Set the frequency and duty cycle together
+
+        PWMs that can should send both in one write.
+        """
+        self.frequency = frequency
+        self.duty_cycle = duty_cycle
+
+    def deferred(self):
+        """Context in which writes need not wait for the hardware to reply
+
+        Meant for frequent, non-critical updates such as modulator steps
+        and interrupter toggles. Errors may be reported by a later write.
+        By default, writes are synchronous.
+        """
+        return ExitStack()
+
+    def set_frequency_deferred(self, value: Real) -> None:
+        with self.deferred():
+            self.frequency = value
+
     # def __str__(self):
     #     return (f"{self.__class__.__name__}("
     #             f"frequency={self.frequency}, "
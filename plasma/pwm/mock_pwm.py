@@ -22,6 +22,7 @@ from numbers import Real
 import logging
 
 from .base_pwm import BasePWM
+from .timeline import PWMTimeline
 
 
 class MockPWM(BasePWM):
@@ -64,3 +65,41 @@ class MockPWM(BasePWM):
     def stop(self) -> None:
         self._info("%s", locals())
         self._is_stopped = True
+
+
+class RecordingMockPWM(MockPWM):
+    """MockPWM that records every command in a `PWMTimeline`
+
+    Nothing is logged per command, so long mock runs stay cheap.
+    """
+
+    def __init__(self, *args, timeline: PWMTimeline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeline = PWMTimeline() if timeline is None else timeline
+        self._record = self.timeline.append
+
+    @property
+    def duty_cycle(self) -> Real:
+        return self._duty_cycle
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: Real):
+        self._duty_cycle = value
+        self._record(self._frequency, value, not self._is_stopped)
+
+    @property
+    def frequency(self) -> Real:
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, value: Real):
+        self._frequency = value
+        self._record(value, self._duty_cycle, not self._is_stopped)
+
+    def start(self) -> None:
+        self._is_stopped = False
+        self._record(self._frequency, self._duty_cycle, True)
+
+    def stop(self) -> None:
+        self._is_stopped = True
+        self._record(self._frequency, self._duty_cycle, False)
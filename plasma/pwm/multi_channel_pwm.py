@@ -0,0 +1,194 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from numbers import Integral
+
+import logging
+import threading
+
+import pigpio
+
+from .base_pwm import BasePWM
+from .pi_pwm import HardwarePWMState, PiPWMException
+
+
+logger = logging.getLogger(__name__)
+
+
+class PWMChannel(HardwarePWMState, BasePWM):
+    """One hardware PWM channel of a `MultiChannelPWM`"""
+
+    def __init__(self, owner: 'MultiChannelPWM', gpio_pin: Integral):
+        self._owner = owner
+        self._init_state(gpio_pin)
+
+    @property
+    def gpio_pin(self) -> Integral:
+        return self._pin
+
+    def deferred(self):
+        return self._owner.deferred()
+
+    def start(self) -> None:
+        if self._is_stopped:
+            self._is_stopped = self._frequency <= 0.0
+            self._sync_hardware()
+
+    def stop(self) -> None:
+        if not self._is_stopped:
+            self._is_stopped = True
+            self._sync_hardware()
+
+    def _sync_hardware(self) -> None:
+        self._owner._write(self)
+
+
+class MultiChannelPWM:
+    """Both hardware PWM channels of a Pi over one pigpiod connection
+
+    Each channel is a `BasePWM`. Changes made to several channels inside
+    `update()` are sent in a single batch, so they reach the daemon
+    together:
+
+        pwm = MultiChannelPWM((18, 13))
+        with pwm.update():
+            pwm[0].frequency = 30000
+            pwm[1].frequency = 31000
+    """
+
+    # BCM pins of each hardware PWM channel
+    _CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+
+    def __init__(self,
+                 gpio_pins=(18, 13),
+                 host: str=None,
+                 port: Integral='8888'):
+        """
+        :param gpio_pins: BCM pins, at most one per hardware channel
+        :param host: pigpiod host (default: local daemon)
+        :param port: pigpiod port
+        """
+        self._pi = None
+        self._channels = []
+        self._validate_pins(gpio_pins)
+
+        if host is None:
+            self._pi = pigpio.pi()
+        else:
+            self._pi = pigpio.pi(host, port)
+        if not self._pi.connected:
+            raise PiPWMException(
+                "Unable to connect to pi %s:%s", host, port)
+
+        self._lock = threading.RLock()
+        # Channels changed inside update(), guarded by self._lock
+        self._update_depth = 0
+        self._pending = []
+
+        self._channels = [PWMChannel(self, pin) for pin in gpio_pins]
+        with self.update():
+            for channel in self._channels:
+                channel._sync_hardware()
+
+    @classmethod
+    def _validate_pins(cls, gpio_pins) -> None:
+        channels = []
+        for pin in gpio_pins:
+            if pin not in cls._CHANNELS:
+                raise PiPWMException(
+                    "GPIO %s has no hardware PWM channel", pin)
+            channels.append(cls._CHANNELS[pin])
+        if len(set(channels)) != len(channels):
+            raise PiPWMException(
+                "GPIOs %s share a hardware PWM channel", gpio_pins)
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """Stop every channel and release the daemon connection"""
+        if self._pi is None:
+            return
+        if self._pi.connected:
+            with self.update():
+                for channel in self._channels:
+                    channel.stop()
+            self._log_deferred_errors(drain=True)
+            self._pi.stop()
+        self._pi = None
+
+    def __getitem__(self, index: Integral) -> PWMChannel:
+        return self._channels[index]
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def __iter__(self):
+        return iter(self._channels)
+
+    @property
+    def pi(self) -> pigpio.pi:
+        return self._pi
+
+    @contextmanager
+    def update(self):
+        """Send the channel changes made in this context as one batch
+
+        Only the final state of each channel is written. The daemon's
+        replies are awaited, and errors raised, when the context exits.
+        """
+        with self._lock:
+            self._update_depth += 1
+            try:
+                yield
+            finally:
+                self._update_depth -= 1
+                if not self._update_depth:
+                    pending, self._pending = self._pending, []
+                    with self._pi.batch():
+                        for channel in pending:
+                            self._pi.hardware_PWM(
+                                channel.gpio_pin,
+                                *channel._hardware_state())
+
+    @contextmanager
+    def deferred(self):
+        """Send the writes made in this context without awaiting replies
+
+        Errors reported by the daemon are logged after a later write.
+        """
+        with self._pi.batch(wait=False):
+            yield
+        self._log_deferred_errors(drain=False)
+
+    def _log_deferred_errors(self, drain: bool) -> None:
+        for cmd, p1, p2, status in self._pi.check_deferred(drain):
+            logger.warning("Deferred pigpio command %s(%s, %s) failed: %s",
+                           cmd, p1, p2, pigpio.error_text(status))
+
+    def _write(self, channel: PWMChannel) -> None:
+        with self._lock:
+            if self._update_depth:
+                if channel not in self._pending:
+                    self._pending.append(channel)
+                return
+            self._pi.hardware_PWM(channel.gpio_pin,
+                                  *channel._hardware_state())
@@ -19,14 +19,17 @@
 # <http://www.gnu.org/licenses/>.
 
 from abc import ABC
+from contextlib import contextmanager
 from numbers import Integral, Real
 
 import logging
 import threading
+import time
 
 import pigpio
 
 from .base_pwm import BasePWM, PWMException
+from .quantization import HardwareOutput, HardwarePWMQuantizer
 
 
 logger = logging.getLogger(__name__)
@@ -44,44 +47,26 @@ class PigpioException(PiPWMException, ABC):
 PigpioException.register(pigpio.error)
 
 
-class PiHardwarePWM(BasePWM):
-    """Thread-safe hardware PWM for the RPi"""
+class HardwarePWMState:
+    """Frequency, duty cycle and run state of a pigpio hardware PWM
 
-    _MAX_DUTY_CYCLE_TICKS = 1000000
+    Shared by the pigpio-backed PWMs: setters validate and record the new
+    state, then call `_sync_hardware`, which the PWM implements to send
+    `_hardware_state()` to the daemon. With a `_quantizer`, the state is
+    snapped to the output the PWM clock can actually produce.
+    """
 
-    def __init__(self,
-                 gpio_pin: Integral,
-                 host: str=None,
-                 port: Integral='8888'):
+    _MAX_DUTY_CYCLE_TICKS = 1000000
+    _quantizer = None
 
-        if host is None:
-            self._pi = pigpio.pi()
-        else:
-            self._pi = pigpio.pi(host, port)
+    def _init_state(self, gpio_pin: Integral) -> None:
         self._pin = gpio_pin
         self._is_stopped = True
         self._frequency = 0.0
         self._duty_cycle = 0.5
-        self._lock = threading.RLock()
-
-        if not self._pi.connected:
-            raise PiPWMException(
-                "Unable to connect to pi %s:%s", host, port)
-
-        self.stop()
 
-    def __del__(self):
-        self.stop()
-
-    def start(self) -> None:
-        if self._is_stopped:
-            self._is_stopped = self._frequency <= 0.0
-            self._sync_hardware()
-
-    def stop(self) -> None:
-        if not self._is_stopped:
-            self._is_stopped = True
-            self._sync_hardware()
+    def _sync_hardware(self) -> None:
+        raise NotImplementedError
 
     @property
     def is_stopped(self) -> bool:
@@ -107,12 +92,45 @@ class PiHardwarePWM(BasePWM):
         self._frequency = value
         self._sync_hardware()
 
-    def _sync_hardware(self):
-        with self._lock:
-            set_frequency = int(0 if self.is_stopped else self._frequency)
-            self._pi.hardware_PWM(self._pin,
-                                  set_frequency,
-                                  self._duty_cycle_ticks())
+    def set_output(self, frequency: Real, duty_cycle: Real) -> None:
+        """Set the frequency and duty cycle in one write"""
+        self._validate_frequency(frequency)
+        self._validate_duty_cycle(duty_cycle)
+        self._frequency = frequency
+        self._duty_cycle = duty_cycle
+        self._sync_hardware()
+
+    @property
+    def hardware_output(self) -> HardwareOutput:
+        """The output the current frequency and duty cycle produce
+
+        Without a PWM clock model, the frequency is only truncated to an
+        integer, as pigpiod expects.
+        """
+        if self._quantizer is not None:
+            return self._quantizer.quantize(self._frequency, self._duty_cycle)
+        ticks = self._duty_cycle_ticks()
+        return HardwareOutput(int(self._frequency), ticks,
+                              float(int(self._frequency)),
+                              ticks / self._MAX_DUTY_CYCLE_TICKS)
+
+    @property
+    def frequency_error(self) -> Real:
+        """Output frequency less the requested frequency (Hz)"""
+        return self.hardware_output.frequency - self._frequency
+
+    @property
+    def duty_cycle_error(self) -> Real:
+        """Output duty cycle less the requested duty cycle"""
+        return self.hardware_output.duty_cycle - self._duty_cycle
+
+    def _hardware_state(self):
+        if self._quantizer is not None:
+            output = self._quantizer.quantize(
+                0 if self.is_stopped else self._frequency, self._duty_cycle)
+            return output.frequency_request, output.duty_cycle_request
+        set_frequency = int(0 if self.is_stopped else self._frequency)
+        return set_frequency, self._duty_cycle_ticks()
 
     def _duty_cycle_ticks(self):
         return int(self._duty_cycle * self._MAX_DUTY_CYCLE_TICKS)
@@ -130,3 +148,236 @@ class PiHardwarePWM(BasePWM):
         if duty_cycle < 0 or duty_cycle > 1:
             raise PiPWMException(
                 "PWM duty cycle should be in [0,1], not %s", duty_cycle)
+
+
+class PiHardwarePWM(HardwarePWMState, BasePWM):
+    """Thread-safe hardware PWM for the RPi
+
+    By default every setter writes through to pigpiod on the calling thread.
+    If `write_behind_frequency` is given, the frequency and duty cycle
+    setters only record the desired state and a single owner thread sends
+    it to the daemon, at most once per update slot, skipping writes that
+    repeat the last value sent. `start` and `stop` always write through, so
+    interrupter edges are never merged.
+
+    The owner thread keeps the instance alive: call `close` when done with
+    a write-behind PWM.
+
+    If `pwm_clock` is given, requests are snapped to the outputs a PWM
+    clock of that frequency can produce (see `HardwarePWMQuantizer`), and
+    writes that would not change the output are skipped.
+
+    A pigpio script can take over the output with `attach_script`; the
+    state is then sent as the script's first two parameters instead of
+    through `hardware_PWM`.
+    """
+
+    def __init__(self,
+                 gpio_pin: Integral,
+                 host: str=None,
+                 port: Integral='8888',
+                 write_behind_frequency: Real=None,
+                 pwm_clock: Integral=None):
+        """
+        :param gpio_pin: BCM pin with a hardware PWM channel
+        :param host: pigpiod host (default: local daemon)
+        :param port: pigpiod port
+        :param write_behind_frequency: If positive, the maximum rate (Hz)
+            at which the owner thread writes frequency and duty cycle
+            changes to pigpiod. If None or zero, every change is written
+            synchronously.
+        :param pwm_clock: PWM clock of the Pi (Hz), e.g.
+            `quantization.BCM2835_PWM_CLOCK`. If None, the output is not
+            modelled and every change is written.
+        """
+
+        if host is None:
+            self._pi = pigpio.pi()
+        else:
+            self._pi = pigpio.pi(host, port)
+        self._init_state(gpio_pin)
+        if pwm_clock is not None:
+            self._quantizer = HardwarePWMQuantizer(pwm_clock)
+        self._lock = threading.RLock()
+
+        # Write-behind state, guarded by self._lock
+        self._wakeup = threading.Condition(self._lock)
+        self._is_dirty = False
+        self._is_closing = False
+        self._last_written = None
+        self._owner = None
+
+        # Attached script, guarded by self._lock
+        self._script_id = None
+        self._script_params = []
+
+        if not self._pi.connected:
+            raise PiPWMException(
+                "Unable to connect to pi %s:%s", host, port)
+
+        if write_behind_frequency is not None and write_behind_frequency < 0:
+            raise PiPWMException(
+                "Write-behind frequency should be non-negative, not %s",
+                write_behind_frequency)
+
+        if write_behind_frequency:
+            self._write_behind_period = 1.0 / write_behind_frequency
+            self._owner = threading.Thread(
+                target=self._run_owner,
+                name="PiHardwarePWM-{}".format(gpio_pin),
+                daemon=True)
+            self._owner.start()
+
+        self.stop()
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """Stop the PWM and, in write-behind mode, the owner thread"""
+        owner = self._owner
+        if owner is not None:
+            with self._lock:
+                self._is_closing = True
+                self._wakeup.notify()
+            owner.join()
+            self._owner = None
+        self.stop()
+        self._log_deferred_errors(drain=True)
+
+    @property
+    def is_write_behind(self) -> bool:
+        return self._owner is not None
+
+    @property
+    def pi(self) -> pigpio.pi:
+        return self._pi
+
+    @property
+    def gpio_pin(self) -> Integral:
+        return self._pin
+
+    def store_script(self, text: str, timeout: Real=1.0) -> int:
+        """Store a pigpio script and wait until it is ready to run
+
+        :return: The script id, for `attach_script`
+        """
+        script_id = self._pi.store_script(text.encode())
+        deadline = time.monotonic() + timeout
+        while self._pi.script_status(script_id)[0] == pigpio.PI_SCRIPT_INITING:
+            if time.monotonic() > deadline:
+                self._pi.delete_script(script_id)
+                raise PiPWMException(
+                    "Script for GPIO %s did not initialise", self._pin)
+            time.sleep(0.001)
+        return script_id
+
+    def attach_script(self, script_id: Integral, params=()) -> None:
+        """Send the state to a pigpio script instead of the PWM channel
+
+        The script receives the hardware frequency (0 while stopped) as p0
+        and the duty cycle in ticks as p1, followed by `params`. Calling it
+        again with the same script only updates `params`.
+        """
+        with self._lock:
+            self._script_id = script_id
+            self._script_params = list(params)
+            self._last_written = None
+            self._write_hardware()
+
+    def detach_script(self) -> None:
+        """Write the state through `hardware_PWM` again"""
+        with self._lock:
+            if self._script_id is None:
+                return
+            self._script_id = None
+            self._script_params = []
+            self._last_written = None
+            self._write_hardware()
+
+    @contextmanager
+    def deferred(self):
+        """Send the writes made in this context without awaiting replies
+
+        Errors reported by the daemon are logged after a later write.
+        Within a batch already open on this thread, e.g. another
+        `deferred`, the writes join that batch.
+        """
+        if self._pi.in_batch():
+            yield
+            return
+        with self._pi.batch(wait=False):
+            yield
+        self._log_deferred_errors(drain=False)
+
+    def _log_deferred_errors(self, drain: bool) -> None:
+        for cmd, p1, p2, status in self._pi.check_deferred(drain):
+            logger.warning("Deferred pigpio command %s(%s, %s) failed: %s",
+                           cmd, p1, p2, pigpio.error_text(status))
+
+    def start(self) -> None:
+        if self._is_stopped:
+            self._is_stopped = self._frequency <= 0.0
+            self._write_hardware()
+
+    def stop(self) -> None:
+        if not self._is_stopped:
+            self._is_stopped = True
+            self._write_hardware()
+
+    def _sync_hardware(self):
+        with self._lock:
+            if self._owner is not None:
+                self._is_dirty = True
+                self._wakeup.notify()
+                return
+        self._write_hardware()
+
+    def _write_hardware(self):
+        """Write the current state on the calling thread"""
+        with self._lock:
+            # Includes any change the owner has not written yet
+            self._is_dirty = False
+            state = self._hardware_state()
+            if self._quantizer is not None and state == self._last_written:
+                # Snapped states are equal only if the outputs are
+                return
+            self._send_state(state)
+            self._last_written = state
+
+    def _send_state(self, state) -> None:
+        if self._script_id is None:
+            self._pi.hardware_PWM(self._pin, *state)
+        else:
+            self._pi.update_script(
+                self._script_id, list(state) + self._script_params)
+
+    def _run_owner(self) -> None:
+        """Write the latest state to pigpiod, at most once per slot"""
+        while True:
+            with self._lock:
+                while not (self._is_dirty or self._is_closing):
+                    self._wakeup.wait()
+                if not self._is_dirty:
+                    return
+                self._is_dirty = False
+                slot_end = time.monotonic() + self._write_behind_period
+                # Written under the lock, so a start() or stop() on another
+                # thread can't be overtaken by an older state.
+                state = self._hardware_state()
+                if state != self._last_written:
+                    try:
+                        with self._pi.batch(wait=False):
+                            self._send_state(state)
+                        self._log_deferred_errors(drain=False)
+                    except pigpio.error:
+                        logger.exception(
+                            "Write-behind of %s to GPIO %s failed",
+                            state, self._pin)
+                    else:
+                        self._last_written = state
+
+                remaining = slot_end - time.monotonic()
+                while remaining > 0 and not self._is_closing:
+                    self._wakeup.wait(remaining)
+                    remaining = slot_end - time.monotonic()
@@ -0,0 +1,122 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import math
+from numbers import Integral, Real
+
+
+# PWM clock pigpiod runs the hardware PWM from
+BCM2835_PWM_CLOCK = 250000000
+BCM2711_PWM_CLOCK = 375000000
+
+_MAX_DUTY_CYCLE_TICKS = 1000000
+
+
+HardwareOutput = collections.namedtuple(
+    'HardwareOutput', ['frequency_request', 'duty_cycle_request',
+                       'frequency', 'duty_cycle'])
+HardwareOutput.__doc__ = """A `hardware_PWM` request and what it produces
+
+The requests are the integers to send to pigpiod; `frequency` (Hz) and
+`duty_cycle` (in [0, 1]) are the output they actually produce. Requests
+producing the same output are always snapped to the same integers.
+"""
+
+
+class HardwarePWMQuantizer:
+    """Model of the outputs the hardware PWM can produce
+
+    pigpiod sets the PWM range to `clock // frequency` steps, giving an
+    output of `clock / range` Hz, and scales the duty cycle ticks to
+    `ticks * range // 1000000` steps. Only those outputs are achievable;
+    `quantize` snaps a request to the nearest one.
+    """
+
+    def __init__(self, clock: Integral=BCM2835_PWM_CLOCK):
+        if clock < 1:
+            raise ValueError(
+                "PWM clock should be positive, not {}".format(clock))
+        self._clock = clock
+
+    @property
+    def clock(self) -> Integral:
+        return self._clock
+
+    def output_frequency(self, frequency_request: Integral) -> float:
+        """Frequency produced by an integer `hardware_PWM` request"""
+        if frequency_request <= 0:
+            return 0.0
+        return self._clock / (self._clock // frequency_request)
+
+    def quantize(self, frequency: Real, duty_cycle: Real) -> HardwareOutput:
+        """The achievable output nearest `frequency` and `duty_cycle`
+
+        A frequency of 0, or one too high to have a single step, turns
+        the PWM off.
+        """
+        steps_range = self._nearest_range(frequency)
+        if not steps_range:
+            return HardwareOutput(
+                0, int(duty_cycle * _MAX_DUTY_CYCLE_TICKS), 0.0, duty_cycle)
+        steps = int(math.floor(duty_cycle * steps_range + 0.5))
+        # The fewest ticks pigpiod scales to at least `steps`; there are
+        # fewer ticks than steps below 250 Hz.
+        ticks = min(-(-steps * _MAX_DUTY_CYCLE_TICKS // steps_range),
+                    _MAX_DUTY_CYCLE_TICKS)
+        steps = ticks * steps_range // _MAX_DUTY_CYCLE_TICKS
+        return HardwareOutput(self._clock // steps_range, ticks,
+                              self._clock / steps_range, steps / steps_range)
+
+    def _nearest_range(self, frequency: Real) -> Integral:
+        if frequency <= 0 or frequency > self._clock:
+            return 0
+        ideal_range = self._clock / frequency
+        # Neighbouring ranges, and those of the neighbouring integer
+        # requests where the integers are coarser than the ranges.
+        candidates = {max(1, int(ideal_range)), int(ideal_range) + 1,
+                      self._clock // max(1, math.floor(frequency)),
+                      self._clock // math.ceil(frequency)}
+        # Some ranges are not the range of any integer request
+        reachable = [r for r in candidates
+                     if r <= self._clock
+                     and self._clock // (self._clock // r) == r]
+        return min(reachable,
+                   key=lambda r: abs(self._clock / r - frequency))
+
+    def resolution(self, frequency: Real) -> float:
+        """Spacing (Hz) of the achievable outputs around `frequency`
+
+        Changes smaller than this move the output by at most one step.
+        """
+        steps_range = self._nearest_range(frequency)
+        if not steps_range:
+            return 0.0
+        return self._clock / steps_range - self._clock / (steps_range + 1)
+
+    def achievable_frequencies(self, low: Real, high: Real):
+        """Sorted table of the output frequencies in [low, high]"""
+        low = max(low, 1)
+        if high < low:
+            return []
+        ranges = range(max(1, int(math.ceil(self._clock / high))),
+                       int(self._clock // low) + 1)
+        return [self._clock / r for r in reversed(ranges)
+                if self._clock // (self._clock // r) == r]
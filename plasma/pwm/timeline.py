@@ -0,0 +1,136 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from array import array
+from numbers import Real
+import csv
+import struct
+import threading
+import time
+
+
+def _monotonic_ns_fallback() -> int:
+    return int(time.monotonic() * 1e9)
+
+
+# time.monotonic_ns is new in Python 3.7
+monotonic_ns = getattr(time, 'monotonic_ns', _monotonic_ns_fallback)
+
+
+class PWMTimeline:
+    """Fixed-size ring buffer of commanded PWM states
+
+    Each row is `(time_ns, frequency, duty_cycle, running)`, with
+    `time_ns` from `monotonic_ns()`. Columns are preallocated `array`s, so
+    appending is O(1) and allocation-free; once full, the oldest rows are
+    overwritten and counted in `dropped`.
+    """
+
+    FIELDS = ('time_ns', 'frequency', 'duty_cycle', 'running')
+
+    # Little-endian packed rows, matching _NPY_DESCR
+    _ROW = struct.Struct('<qdd?')
+    _NPY_DESCR = ("[('time_ns', '<i8'), ('frequency', '<f8'), "
+                  "('duty_cycle', '<f8'), ('running', '|b1')]")
+
+    def __init__(self, capacity: int=1 << 20):
+        if capacity < 1:
+            raise ValueError(
+                "Timeline capacity should be positive, not {}".format(
+                    capacity))
+        self._capacity = capacity
+        self._time_ns = array('q', bytes(8 * capacity))
+        self._frequency = array('d', bytes(8 * capacity))
+        self._duty_cycle = array('d', bytes(8 * capacity))
+        self._running = array('b', bytes(capacity))
+        self._appended = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def dropped(self) -> int:
+        """Rows overwritten since the timeline was created or cleared"""
+        return max(0, self._appended - self._capacity)
+
+    def __len__(self) -> int:
+        return min(self._appended, self._capacity)
+
+    def append(self,
+               frequency: Real,
+               duty_cycle: Real,
+               running: bool) -> None:
+        with self._lock:
+            i = self._appended % self._capacity
+            self._time_ns[i] = monotonic_ns()
+            self._frequency[i] = frequency
+            self._duty_cycle[i] = duty_cycle
+            self._running[i] = running
+            self._appended += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._appended = 0
+
+    def rows(self):
+        """Recorded rows, oldest first"""
+        with self._lock:
+            count = len(self)
+            first = self._appended - count
+            rows = []
+            for n in range(first, first + count):
+                i = n % self._capacity
+                rows.append((self._time_ns[i], self._frequency[i],
+                             self._duty_cycle[i], bool(self._running[i])))
+        return rows
+
+    def save(self, path: str) -> None:
+        """Write the rows to a `.npy` or `.csv` file, by extension"""
+        if path.endswith('.npy'):
+            with open(path, 'wb') as fp:
+                self.write_npy(fp)
+        elif path.endswith('.csv'):
+            with open(path, 'w', newline='') as fp:
+                self.write_csv(fp)
+        else:
+            raise ValueError(
+                "Timeline files should end in .npy or .csv, not {}".format(
+                    path))
+
+    def write_csv(self, fp) -> None:
+        writer = csv.writer(fp)
+        writer.writerow(self.FIELDS)
+        writer.writerows(
+            (t, repr(f), repr(d), int(r)) for t, f, d, r in self.rows())
+
+    def write_npy(self, fp) -> None:
+        """Write a NumPy structured array, without needing NumPy"""
+        rows = self.rows()
+        header = "{{'descr': {}, 'fortran_order': False, 'shape': ({},), }}"
+        header = header.format(self._NPY_DESCR, len(rows))
+        # Magic, version and length take 10 bytes; the data is 64-aligned
+        padding = -(10 + len(header) + 1) % 64
+        header = (header + ' ' * padding + '\n').encode('latin1')
+        fp.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)))
+        fp.write(header)
+        pack = self._ROW.pack
+        fp.write(b''.join(pack(*row) for row in rows))
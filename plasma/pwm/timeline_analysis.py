@@ -0,0 +1,177 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Measure the output fidelity recorded in a `PWMTimeline`
+
+Needs NumPy, which the controller itself does not. Each analysis takes the
+structured array returned by `load_timeline` (or `numpy.load` of a saved
+`.npy` timeline) and reports absolute errors as `Percentiles`.
+"""
+
+import collections
+from numbers import Real
+from typing import Callable
+
+import numpy as np
+
+from plasma.pwm.timeline import PWMTimeline
+
+
+Percentiles = collections.namedtuple(
+    'Percentiles', ['p50', 'p90', 'p99', 'max'])
+
+InterrupterReport = collections.namedtuple(
+    'InterrupterReport', ['cycles', 'period_error', 'duty_cycle_error'])
+InterrupterReport.__doc__ = """Interrupter accuracy, one sample per cycle
+
+`period_error` is in seconds, `duty_cycle_error` a fraction of a period.
+"""
+
+StepReport = collections.namedtuple(
+    'StepReport', ['steps', 'interval_error'])
+StepReport.__doc__ = """Modulator step timing; `interval_error` in seconds"""
+
+SpectrumReport = collections.namedtuple(
+    'SpectrumReport', ['peak_frequency', 'amplitude', 'spurious_ratio',
+                       'ideal_amplitude', 'ideal_spurious_ratio',
+                       'rms_error'])
+SpectrumReport.__doc__ = """FM produced, against the ideal waveform
+
+Amplitudes and `rms_error` are in Hz. The spurious ratios are the power
+outside the modulation frequency relative to the power at it.
+"""
+
+_DTYPE = np.dtype([('time_ns', '<i8'), ('frequency', '<f8'),
+                   ('duty_cycle', '<f8'), ('running', '?')])
+
+
+def load_timeline(path: str) -> np.ndarray:
+    """Read a timeline saved by `PWMTimeline.save`"""
+    if path.endswith('.csv'):
+        return np.loadtxt(path, dtype=_DTYPE, delimiter=',', skiprows=1,
+                          ndmin=1)
+    return np.load(path)
+
+
+def from_timeline(timeline: PWMTimeline) -> np.ndarray:
+    return np.array(timeline.rows(), dtype=_DTYPE)
+
+
+def percentiles(values: np.ndarray) -> Percentiles:
+    if not len(values):
+        return Percentiles(*[float('nan')] * 4)
+    values = np.abs(values)
+    return Percentiles(*np.percentile(values, [50, 90, 99, 100]))
+
+
+def _seconds(timeline: np.ndarray) -> np.ndarray:
+    time_ns = timeline['time_ns']
+    return (time_ns - time_ns[0]) * 1e-9
+
+
+def analyze_interrupter(timeline: np.ndarray,
+                        frequency: Real,
+                        duty_cycle: Real) -> InterrupterReport:
+    """Compare the on/off edges with the commanded interrupter"""
+    seconds = _seconds(timeline)
+    running = timeline['running'].astype(np.int8)
+    edges = np.diff(running)
+    on = seconds[1:][edges > 0]
+    off = seconds[1:][edges < 0]
+    # Pair each complete cycle's on edge with the off edge that follows
+    off = off[np.searchsorted(off, on[0]):] if len(on) else off
+    cycles = min(len(on) - 1, len(off))
+    if cycles < 1:
+        return InterrupterReport(0, percentiles(np.empty(0)),
+                                 percentiles(np.empty(0)))
+    periods = np.diff(on[:cycles + 1])
+    on_times = off[:cycles] - on[:cycles]
+    return InterrupterReport(
+        cycles,
+        percentiles(periods - 1.0 / frequency),
+        percentiles(on_times / periods - duty_cycle))
+
+
+def analyze_steps(timeline: np.ndarray,
+                  update_frequency: Real) -> StepReport:
+    """Compare the intervals between frequency changes with the update rate
+
+    Repeated frequencies are not steps, so plateaus in the waveform show
+    up as multiples of the update interval.
+    """
+    seconds = _seconds(timeline)
+    frequency = timeline['frequency']
+    changes = np.flatnonzero(np.diff(frequency)) + 1
+    intervals = np.diff(seconds[changes])
+    return StepReport(
+        len(changes), percentiles(intervals - 1.0 / update_frequency))
+
+
+def analyze_spectrum(timeline: np.ndarray,
+                     frequency: Real,
+                     spread: Real,
+                     center: Real,
+                     sample_rate: Real=1000.0,
+                     waveform: Callable=np.sin) -> SpectrumReport:
+    """FFT of the frequency actually commanded, and of the ideal waveform
+
+    The commanded frequency is held between rows and sampled at
+    `sample_rate`. The ideal `CallbackModulator` output,
+    `max(0, center + spread * waveform(phase))`, is phase-aligned to it.
+    A timeline spanning less than two samples reports NaN throughout.
+    """
+    if len(timeline) < 2:
+        return SpectrumReport(*[float('nan')] * 6)
+    seconds = _seconds(timeline)
+    grid = np.arange(0.0, seconds[-1], 1.0 / sample_rate)
+    if len(grid) < 2:
+        return SpectrumReport(*[float('nan')] * 6)
+    held = np.searchsorted(seconds, grid, side='right') - 1
+    measured = timeline['frequency'][held]
+
+    omega = 2 * np.pi * frequency * grid
+    amplitude, phase = _fit_sine(measured, omega)
+    ideal = np.maximum(0, center + spread * waveform(omega + phase))
+    ideal_amplitude, _ = _fit_sine(ideal, omega)
+
+    peak, spurious = _spectrum(measured, frequency, sample_rate)
+    _, ideal_spurious = _spectrum(ideal, frequency, sample_rate)
+    return SpectrumReport(
+        peak, amplitude, spurious, ideal_amplitude, ideal_spurious,
+        float(np.sqrt(np.mean((measured - ideal) ** 2))))
+
+
+def _fit_sine(samples: np.ndarray, omega: np.ndarray):
+    """Least-squares amplitude and phase of `sin(omega + phase)`"""
+    basis = np.column_stack([np.sin(omega), np.cos(omega)])
+    (a, b), _, _, _ = np.linalg.lstsq(basis, samples - samples.mean(),
+                                      rcond=None)
+    return float(np.hypot(a, b)), float(np.arctan2(b, a))
+
+
+def _spectrum(samples: np.ndarray, frequency: Real, sample_rate: Real):
+    """Peak frequency and the power outside `frequency` relative to it"""
+    window = np.hanning(len(samples))
+    power = np.abs(np.fft.rfft((samples - samples.mean()) * window)) ** 2
+    frequencies = np.fft.rfftfreq(len(samples), 1.0 / sample_rate)
+    fundamental = int(round(frequency * len(samples) / sample_rate))
+    # The Hann window spreads a tone over the neighbouring bins
+    fundamental_power = power[max(fundamental - 2, 0):fundamental + 3].sum()
+    spurious = (power.sum() - fundamental_power) / fundamental_power
+    return float(frequencies[np.argmax(power)]), float(spurious)
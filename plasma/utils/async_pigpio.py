@@ -0,0 +1,249 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""asyncio client for the pigpio daemon.
+
+Speaks the same socket protocol as `pigpio.pi`, but over asyncio streams
+instead of a blocking socket and a notification thread, so the PWM can
+share an event loop with `pythonosc.osc_server.AsyncIOOSCUDPServer`.
+
+Only the subset the controller needs is covered: `hardware_PWM`,
+`set_mode`, `set_pull_up_down`, `set_glitch_filter` and `callback`.
+
+Commands are pipelined: each is written as soon as it is issued and a
+single reader task resolves replies in order, so no lock is needed.
+
+Requires Python 3.5.2 or newer (`async def`, `loop.create_future`); the
+rest of the controller still runs on 3.4.
+
+    pi = AsyncPi('localhost', 8888)
+    await pi.connect()
+    await pi.hardware_PWM(18, 30000, 500000)
+    cb = await pi.callback(4, pigpio.EITHER_EDGE, print)
+    ...
+    await cb.cancel()
+    await pi.close()
+"""
+import asyncio
+import collections
+import logging
+import struct
+from typing import Callable
+
+import pigpio
+
+
+logger = logging.getLogger(__name__)
+
+_COMMAND = struct.Struct('IIII')
+_REPLY = struct.Struct('12xI')
+_REPORT = struct.Struct('HHII')
+
+
+class AsyncCallback:
+    """Handle for a GPIO edge callback registered with `AsyncPi.callback`"""
+
+    def __init__(self, pi: 'AsyncPi', gpio: int, edge: int,
+                 func: Callable[[int, int, int], None]):
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        self.bit = 1 << gpio
+        self._pi = pi
+
+    async def cancel(self) -> None:
+        await self._pi._remove_callback(self)
+
+
+class AsyncPi:
+    """Pipelined asyncio connection to a pigpio daemon"""
+
+    def __init__(self, host: str='localhost', port: int=8888):
+        self._host = host or 'localhost'
+        self._port = int(port)
+        self._reader = None
+        self._writer = None
+        self._replies = collections.deque()
+        self._reply_task = None
+
+        self._notify_reader = None
+        self._notify_writer = None
+        self._notify_task = None
+        self._notify_handle = None
+        self._last_level = 0
+        self._monitor = 0
+        self._callbacks = []
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    async def connect(self) -> 'AsyncPi':
+        self._reader, self._writer = await asyncio.open_connection(
+            self._host, self._port)
+        self._reply_task = asyncio.ensure_future(self._read_replies())
+        return self
+
+    async def close(self) -> None:
+        if self._notify_writer is not None:
+            self._notify_writer.write(_COMMAND.pack(
+                pigpio._PI_CMD_NC, self._notify_handle, 0, 0))
+            self._notify_writer.close()
+            self._notify_writer = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for task in (self._notify_task, self._reply_task):
+            if task is not None:
+                task.cancel()
+        self._fail_pending(pigpio.error("pigpio connection closed"))
+
+    def _command(self, cmd: int, p1: int, p2: int,
+                 extension: bytes=b'') -> asyncio.Future:
+        """Send a command; the future resolves to the unsigned reply"""
+        if self._writer is None:
+            raise pigpio.error("not connected to pigpio")
+        future = asyncio.get_event_loop().create_future()
+        self._replies.append(future)
+        self._writer.write(
+            _COMMAND.pack(cmd, p1, p2, len(extension)) + extension)
+        return future
+
+    async def _read_replies(self) -> None:
+        try:
+            while True:
+                data = await self._reader.readexactly(_COMMAND.size)
+                if not self._replies:
+                    # Replies are matched to commands by order alone, so
+                    # after a stray one none of them can be trusted
+                    logger.error("Closing pigpio connection after a reply "
+                                 "without a command")
+                    self._writer.close()
+                    self._writer = None
+                    self._fail_pending(pigpio.error(
+                        "pigpio reply without a command"))
+                    return
+                future = self._replies.popleft()
+                if not future.cancelled():
+                    future.set_result(_REPLY.unpack(data)[0])
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._fail_pending(pigpio.error(
+                "pigpio connection lost: {}".format(e)))
+
+    def _fail_pending(self, exc: Exception) -> None:
+        while self._replies:
+            future = self._replies.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _status(self, cmd: int, p1: int, p2: int,
+                      extension: bytes=b'') -> int:
+        return pigpio._u2i(await self._command(cmd, p1, p2, extension))
+
+    async def hardware_PWM(self, gpio: int, PWMfreq: int,
+                           PWMduty: int) -> int:
+        """See `pigpio.pi.hardware_PWM`"""
+        return await self._status(pigpio._PI_CMD_HP, gpio, PWMfreq,
+                                  struct.pack('I', PWMduty))
+
+    async def set_mode(self, gpio: int, mode: int) -> int:
+        """See `pigpio.pi.set_mode`"""
+        return await self._status(pigpio._PI_CMD_MODES, gpio, mode)
+
+    async def set_pull_up_down(self, gpio: int, pud: int) -> int:
+        """See `pigpio.pi.set_pull_up_down`"""
+        return await self._status(pigpio._PI_CMD_PUD, gpio, pud)
+
+    async def set_glitch_filter(self, user_gpio: int, steady: int) -> int:
+        """See `pigpio.pi.set_glitch_filter`"""
+        return await self._status(pigpio._PI_CMD_FG, user_gpio, steady)
+
+    async def callback(self, user_gpio: int,
+                       edge: int=pigpio.RISING_EDGE,
+                       func: Callable[[int, int, int], None]=None) \
+            -> AsyncCallback:
+        """See `pigpio.pi.callback`; `func` is called on the event loop"""
+        if func is None:
+            raise ValueError("An async callback requires a function")
+        await self._open_notifications()
+        cb = AsyncCallback(self, user_gpio, edge, func)
+        self._callbacks.append(cb)
+        await self._set_monitor()
+        return cb
+
+    async def _remove_callback(self, cb: AsyncCallback) -> None:
+        if cb in self._callbacks:
+            self._callbacks.remove(cb)
+            await self._set_monitor()
+
+    async def _set_monitor(self) -> None:
+        monitor = 0
+        for cb in self._callbacks:
+            monitor |= cb.bit
+        if monitor != self._monitor:
+            self._monitor = monitor
+            await self._status(
+                pigpio._PI_CMD_NB, self._notify_handle, monitor)
+
+    async def _open_notifications(self) -> None:
+        if self._notify_writer is not None:
+            return
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port)
+        # Same handshake as pigpio._callback_thread: read the current
+        # levels, then turn the socket into a notification stream.
+        writer.write(_COMMAND.pack(pigpio._PI_CMD_BR1, 0, 0, 0))
+        self._last_level = _REPLY.unpack(
+            await reader.readexactly(_COMMAND.size))[0]
+        writer.write(_COMMAND.pack(pigpio._PI_CMD_NOIB, 0, 0, 0))
+        self._notify_handle = pigpio._u2i(_REPLY.unpack(
+            await reader.readexactly(_COMMAND.size))[0])
+        self._notify_reader, self._notify_writer = reader, writer
+        self._notify_task = asyncio.ensure_future(self._read_reports())
+
+    async def _read_reports(self) -> None:
+        try:
+            while True:
+                data = await self._notify_reader.readexactly(_REPORT.size)
+                _seq, flags, tick, level = _REPORT.unpack(data)
+                self._dispatch_report(flags, tick, level)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("pigpio notification stream closed")
+
+    def _dispatch_report(self, flags: int, tick: int, level: int) -> None:
+        if flags == 0:
+            changed = level ^ self._last_level
+            self._last_level = level
+            for cb in list(self._callbacks):
+                if cb.bit & changed:
+                    new_level = 1 if cb.bit & level else 0
+                    if cb.edge ^ new_level:
+                        self._call(cb, new_level, tick)
+        elif flags & pigpio.NTFY_FLAGS_WDOG:
+            gpio = flags & pigpio.NTFY_FLAGS_GPIO
+            for cb in list(self._callbacks):
+                if cb.gpio == gpio:
+                    self._call(cb, pigpio.TIMEOUT, tick)
+
+    @staticmethod
+    def _call(cb: AsyncCallback, level: int, tick: int) -> None:
+        try:
+            cb.func(cb.gpio, level, tick)
+        except Exception:
+            logger.exception("Callback on GPIO %d raised", cb.gpio)
@@ -0,0 +1,645 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Pure-Python stand-in for the pigpio daemon.
+
+Speaks pigpiod's socket protocol (16 byte commands and replies, and 12 byte
+level reports on notification sockets), so `pigpio.pi`, `PiHardwarePWM`
+and `ButtonWatcher` can be exercised and benchmarked without a Pi:
+
+    with FakePigpiod(latency=0.001, jitter=0.0005) as daemon:
+        pwm = PiHardwarePWM(18, '127.0.0.1', daemon.port)
+        pwm.frequency = 30000
+        daemon.press(4, hold_seconds=0.1)
+        print(daemon.hardware_pwm_writes())
+
+Only GPIO levels, modes, hardware PWM, notifications and a subset of the
+script language (see `_Script`) are modelled; other commands are recorded
+and answered with 0.
+
+It can also be run on its own, in place of pigpiod:
+
+    python -m plasma.utils.fake_pigpiod --port 8888 --latency 0.002
+"""
+import argparse
+import collections
+import logging
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+import pigpio
+
+
+logger = logging.getLogger(__name__)
+
+_COMMAND = struct.Struct('IIII')
+_REPLY = struct.Struct('IIIi')
+_REPORT = struct.Struct('HHII')
+
+_HARDWARE_PWM_GPIOS = (12, 13, 18, 19)
+_MAX_HARDWARE_PWM_FREQUENCY = 125000000
+_MAX_HARDWARE_PWM_DUTY = 1000000
+_MAX_HANDLES = 32
+_HARDWARE_REVISION = 0xa02082
+_PIGPIO_VERSION = 68
+_MAX_SCRIPTS = 32
+_MAX_SCRIPT_PARAMS = 10
+_MAX_SCRIPT_VARIABLES = 150
+_MAX_MICS_DELAY = 1000000
+_MAX_MILS_DELAY = 60000
+
+
+CommandRecord = collections.namedtuple(
+    'CommandRecord', ['time', 'cmd', 'p1', 'p2', 'extension'])
+CommandRecord.__doc__ = """A command received by `FakePigpiod`
+
+`time` is the `time.monotonic()` at which the command was read, before any
+injected latency.
+"""
+
+
+class _Notifier:
+    """An open notification handle"""
+
+    def __init__(self, handle: int):
+        self.handle = handle
+        self.bits = 0
+        self.sock = None
+        self.seq = 0
+
+
+class ScriptError(Exception):
+    """A script was rejected; `args[0]` is the pigpio error code"""
+    pass
+
+
+class _Script:
+    """A stored script, run on its own thread
+
+    Understands `tag`, `jmp`, `jz`, `jnz`, `jm`, `jp`, `call`, `ret`,
+    `lda`, `sta`, `add`, `sub`, `mlt`, `div`, `hp`, `w`, `mics` and `mils`,
+    with literal, `p0`-`p9` or `v0`-`v149` arguments.
+    """
+
+    _ARITY = {'tag': 1, 'jmp': 1, 'jz': 1, 'jnz': 1, 'jm': 1, 'jp': 1,
+              'call': 1, 'ret': 0, 'lda': 1, 'sta': 1, 'add': 1, 'sub': 1,
+              'mlt': 1, 'div': 1, 'hp': 3, 'w': 2, 'mics': 1, 'mils': 1}
+    _JUMPS = {
+        'jmp': lambda a: True,
+        'jz': lambda a: a == 0,
+        'jnz': lambda a: a != 0,
+        'jm': lambda a: a < 0,
+        'jp': lambda a: a >= 0,
+        'call': lambda a: True,
+    }
+    _ARITHMETIC = {
+        'add': lambda a, x: a + x,
+        'sub': lambda a, x: a - x,
+        'mlt': lambda a, x: a * x,
+        # C division, truncating towards zero
+        'div': lambda a, x: int(a / x),
+    }
+
+    def __init__(self, daemon: 'FakePigpiod', text: str):
+        self.daemon = daemon
+        self.params = [0] * _MAX_SCRIPT_PARAMS
+        self.variables = [0] * _MAX_SCRIPT_VARIABLES
+        self.status = pigpio.PI_SCRIPT_HALTED
+        self.program = []
+        self.tags = {}
+        self._halt = threading.Event()
+        self._thread = None
+        self._parse(text)
+
+    def _parse(self, text: str) -> None:
+        tokens = text.split()
+        while tokens:
+            op = tokens.pop(0).lower()
+            arity = self._ARITY.get(op)
+            if arity is None or len(tokens) < arity:
+                raise ScriptError(pigpio.PI_BAD_SCRIPT_CMD)
+            args = [self._parse_arg(t) for t in tokens[:arity]]
+            del tokens[:arity]
+            if op == 'tag':
+                if args[0] in self.tags:
+                    raise ScriptError(pigpio.PI_DUP_TAG)
+                self.tags[args[0]] = len(self.program)
+            elif op == 'sta' and not isinstance(args[0], tuple):
+                raise ScriptError(pigpio.PI_BAD_VAR_NUM)
+            else:
+                self.program.append((op, args))
+        for op, args in self.program:
+            if op in self._JUMPS and args[0] not in self.tags:
+                raise ScriptError(pigpio.PI_BAD_TAG)
+
+    @staticmethod
+    def _parse_arg(token: str):
+        """An int literal, or a ('p'|'v', index) register"""
+        token = token.lower()
+        if token[0] in 'pv' and token[1:].isdigit():
+            index = int(token[1:])
+            if token[0] == 'p' and index >= _MAX_SCRIPT_PARAMS:
+                raise ScriptError(pigpio.PI_BAD_PARAM_NUM)
+            if token[0] == 'v' and index >= _MAX_SCRIPT_VARIABLES:
+                raise ScriptError(pigpio.PI_BAD_VAR_NUM)
+            return token[0], index
+        try:
+            return int(token)
+        except ValueError:
+            raise ScriptError(pigpio.PI_BAD_SCRIPT)
+
+    def _value(self, arg) -> int:
+        if isinstance(arg, tuple):
+            kind, index = arg
+            return (self.params if kind == 'p' else self.variables)[index]
+        return arg
+
+    def run(self) -> None:
+        self.stop()
+        self._halt.clear()
+        self.status = pigpio.PI_SCRIPT_RUNNING
+        self._thread = threading.Thread(
+            target=self._run, name="FakePigpiod-script", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._halt.set()
+        if (self._thread is not None
+                and self._thread is not threading.current_thread()):
+            self._thread.join()
+        self._thread = None
+        if self.status != pigpio.PI_SCRIPT_FAILED:
+            self.status = pigpio.PI_SCRIPT_HALTED
+
+    def _run(self) -> None:
+        pc = 0
+        accumulator = 0
+        stack = []
+        while pc < len(self.program) and not self._halt.is_set():
+            op, args = self.program[pc]
+            pc += 1
+            if op in self._JUMPS:
+                if self._JUMPS[op](accumulator):
+                    if op == 'call':
+                        stack.append(pc)
+                    pc = self.tags[args[0]]
+                continue
+            if op == 'ret':
+                if not stack:
+                    self.status = pigpio.PI_SCRIPT_FAILED
+                    return
+                pc = stack.pop()
+                continue
+            values = [self._value(a) for a in args]
+            if op == 'lda':
+                accumulator = values[0]
+            elif op == 'sta':
+                self.variables[args[0][1]] = accumulator
+            elif op in self._ARITHMETIC:
+                if op == 'div' and values[0] == 0:
+                    self.status = pigpio.PI_SCRIPT_FAILED
+                    return
+                accumulator = pigpio.u2i(
+                    self._ARITHMETIC[op](accumulator, values[0])
+                    & 0xffffffff)
+            elif op in ('mics', 'mils'):
+                limit = _MAX_MICS_DELAY if op == 'mics' else _MAX_MILS_DELAY
+                if not 0 <= values[0] <= limit:
+                    self.status = pigpio.PI_SCRIPT_FAILED
+                    return
+                scale = 1e-6 if op == 'mics' else 1e-3
+                self._halt.wait(values[0] * scale)
+            else:
+                with self.daemon._lock:
+                    if op == 'hp':
+                        res = self.daemon._hardware_pwm_locked(*values)
+                    else:
+                        res = self.daemon._write_locked(*values)
+                if res < 0:
+                    self.status = pigpio.PI_SCRIPT_FAILED
+                    return
+        self.status = pigpio.PI_SCRIPT_HALTED
+
+
+class FakePigpiod:
+    """Threaded, in-process pigpio daemon listening on a TCP port
+
+    :param host: Interface to listen on
+    :param port: Port to listen on; 0 picks a free one (see `port`)
+    :param latency: Seconds to wait before answering each command
+    :param jitter: Each delay is drawn uniformly from
+        `latency +/- jitter` (and clamped at 0)
+    :param seed: Seed for the jitter, for reproducible runs
+    """
+
+    def __init__(self, host: str='127.0.0.1', port: int=0,
+                 latency: float=0.0, jitter: float=0.0, seed: int=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._commands = []
+        self._levels = 0
+        self._modes = {}
+        self._hardware_pwm = {}
+        self._notifiers = {}
+        self._scripts = {}
+        self._pwm_history = []
+        self._start_time = time.monotonic()
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(8)
+        self._connections = []
+        self._is_closed = False
+        self._accept_thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.getsockname()[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.getsockname()[1]
+
+    def start(self) -> 'FakePigpiod':
+        self._accept_thread = threading.Thread(
+            target=self._accept, name="FakePigpiod", daemon=True)
+        self._accept_thread.start()
+        return self
+
+    def close(self) -> None:
+        self._is_closed = True
+        try:
+            # Unblock accept()
+            socket.create_connection(self._server.getsockname(), 1).close()
+        except OSError:
+            pass
+        if self._accept_thread is not None:
+            self._accept_thread.join()
+        self._server.close()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def __enter__(self) -> 'FakePigpiod':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Inspection
+
+    @property
+    def commands(self):
+        """Every `CommandRecord` received so far, in order"""
+        with self._lock:
+            return list(self._commands)
+
+    def clear(self) -> None:
+        """Forget the recorded commands"""
+        with self._lock:
+            self._commands = []
+
+    def hardware_pwm_writes(self):
+        """[(time, gpio, frequency, duty)] for each hardware_PWM command"""
+        return [(c.time, c.p1, c.p2, struct.unpack('I', c.extension)[0])
+                for c in self.commands if c.cmd == pigpio._PI_CMD_HP]
+
+    def hardware_pwm_history(self, gpio: int):
+        """[(time, frequency, duty)] for each change applied to `gpio`
+
+        Unlike `hardware_pwm_writes`, includes writes made by scripts.
+        """
+        with self._lock:
+            return [(t, f, d) for t, g, f, d in self._pwm_history
+                    if g == gpio]
+
+    def hardware_pwm(self, gpio: int):
+        """The (frequency, duty) the daemon is generating on `gpio`"""
+        with self._lock:
+            return self._hardware_pwm.get(gpio, (0, 0))
+
+    def level(self, gpio: int) -> int:
+        with self._lock:
+            return (self._levels >> gpio) & 1
+
+    def tick(self) -> int:
+        """Microseconds since the daemon started, wrapping like pigpio's"""
+        return int((time.monotonic() - self._start_time) * 1e6) & 0xffffffff
+
+    # Stimulus
+
+    def set_level(self, gpio: int, level: int) -> None:
+        """Drive an input, reporting the change to notification handles"""
+        with self._lock:
+            if level:
+                levels = self._levels | 1 << gpio
+            else:
+                levels = self._levels & ~(1 << gpio)
+            self._set_levels_locked(levels)
+
+    def press(self, gpio: int, hold_seconds: float=0.05,
+              active_low: bool=True) -> None:
+        """Synthesize a button press and release, blocking while held"""
+        self.set_level(gpio, 0 if active_low else 1)
+        time.sleep(hold_seconds)
+        self.set_level(gpio, 1 if active_low else 0)
+
+    def _set_levels_locked(self, levels: int) -> None:
+        changed = levels ^ self._levels
+        self._levels = levels
+        if not changed:
+            return
+        tick = self.tick()
+        for notifier in self._notifiers.values():
+            if notifier.sock is not None and notifier.bits & changed:
+                report = _REPORT.pack(notifier.seq, 0, tick, levels)
+                notifier.seq = (notifier.seq + 1) & 0xffff
+                try:
+                    notifier.sock.sendall(report)
+                except OSError:
+                    notifier.sock = None
+
+    # Protocol
+
+    def _accept(self) -> None:
+        while not self._is_closed:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            if self._is_closed:
+                conn.close()
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,),
+                             name="FakePigpiod-conn", daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        notifying = False
+        try:
+            while True:
+                header = self._recv_exactly(conn, _COMMAND.size)
+                if header is None:
+                    return
+                cmd, p1, p2, p3 = _COMMAND.unpack(header)
+                extension = b''
+                if p3:
+                    extension = self._recv_exactly(conn, p3)
+                    if extension is None:
+                        return
+                with self._lock:
+                    self._commands.append(CommandRecord(
+                        time.monotonic(), cmd, p1, p2, extension))
+                self._delay()
+                if notifying:
+                    # Only NC is expected on a notification stream, and it
+                    # is not answered: replies would corrupt the reports.
+                    self._execute(conn, cmd, p1, p2, extension)
+                    continue
+                res = self._execute(conn, cmd, p1, p2, extension)
+                if cmd == pigpio._PI_CMD_NOIB and res >= 0:
+                    with self._lock:
+                        conn.sendall(_REPLY.pack(cmd, p1, p2, res))
+                        self._notifiers[res].sock = conn
+                    notifying = True
+                    continue
+                conn.sendall(_REPLY.pack(cmd, p1, p2, res))
+                if cmd == pigpio._PI_CMD_PROCP and res > 0:
+                    conn.sendall(self._script_status(p1))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                for notifier in self._notifiers.values():
+                    if notifier.sock is conn:
+                        notifier.sock = None
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    @staticmethod
+    def _recv_exactly(conn: socket.socket, count: int):
+        data = b''
+        while len(data) < count:
+            chunk = conn.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _delay(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _execute(self, conn: socket.socket, cmd: int, p1: int, p2: int,
+                 extension: bytes) -> int:
+        """Apply a command and return its (signed) result"""
+        with self._lock:
+            if cmd == pigpio._PI_CMD_HP:
+                return self._hardware_pwm_locked(
+                    p1, p2, struct.unpack('I', extension)[0])
+            if cmd == pigpio._PI_CMD_MODES:
+                if p1 > 53:
+                    return pigpio.PI_BAD_GPIO
+                self._modes[p1] = p2
+                return 0
+            if cmd == pigpio._PI_CMD_PUD:
+                if p1 > 53:
+                    return pigpio.PI_BAD_GPIO
+                # A floating input follows its pull
+                if p2 == pigpio.PUD_UP:
+                    self._set_levels_locked(self._levels | 1 << p1)
+                elif p2 == pigpio.PUD_DOWN:
+                    self._set_levels_locked(self._levels & ~(1 << p1))
+                return 0
+            if cmd == pigpio._PI_CMD_MODEG:
+                if p1 > 53:
+                    return pigpio.PI_BAD_GPIO
+                return self._modes.get(p1, pigpio.INPUT)
+            if cmd == pigpio._PI_CMD_READ:
+                if p1 > 53:
+                    return pigpio.PI_BAD_GPIO
+                return (self._levels >> p1) & 1
+            if cmd == pigpio._PI_CMD_WRITE:
+                return self._write_locked(p1, p2)
+            if cmd == pigpio._PI_CMD_BR1:
+                return self._levels
+            if cmd == pigpio._PI_CMD_TICK:
+                return self.tick()
+            if cmd == pigpio._PI_CMD_HWVER:
+                return _HARDWARE_REVISION
+            if cmd == pigpio._PI_CMD_PIGPV:
+                return _PIGPIO_VERSION
+            if cmd in (pigpio._PI_CMD_NO, pigpio._PI_CMD_NOIB):
+                for handle in range(_MAX_HANDLES):
+                    if handle not in self._notifiers:
+                        self._notifiers[handle] = _Notifier(handle)
+                        return handle
+                return pigpio.PI_NO_HANDLE
+            if cmd == pigpio._PI_CMD_NB:
+                if p1 not in self._notifiers:
+                    return pigpio.PI_BAD_HANDLE
+                self._notifiers[p1].bits = p2
+                return 0
+            if cmd == pigpio._PI_CMD_NP:
+                if p1 not in self._notifiers:
+                    return pigpio.PI_BAD_HANDLE
+                self._notifiers[p1].bits = 0
+                return 0
+            if cmd == pigpio._PI_CMD_NC:
+                if self._notifiers.pop(p1, None) is None:
+                    return pigpio.PI_BAD_HANDLE
+                return 0
+        if cmd in (pigpio._PI_CMD_PROC, pigpio._PI_CMD_PROCR,
+                   pigpio._PI_CMD_PROCU, pigpio._PI_CMD_PROCS,
+                   pigpio._PI_CMD_PROCD, pigpio._PI_CMD_PROCP):
+            # Outside the lock: scripts take it to write the hardware
+            return self._execute_script_command(cmd, p1, extension)
+        return 0
+
+    def _execute_script_command(self, cmd: int, script_id: int,
+                                extension: bytes) -> int:
+        if cmd == pigpio._PI_CMD_PROC:
+            try:
+                script = _Script(self, extension.decode('latin-1'))
+            except ScriptError as e:
+                return e.args[0]
+            with self._lock:
+                for script_id in range(_MAX_SCRIPTS):
+                    if script_id not in self._scripts:
+                        self._scripts[script_id] = script
+                        return script_id
+            return pigpio.PI_NO_SCRIPT_ROOM
+        with self._lock:
+            script = self._scripts.get(script_id)
+        if script is None:
+            return pigpio.PI_BAD_SCRIPT_ID
+        if cmd in (pigpio._PI_CMD_PROCR, pigpio._PI_CMD_PROCU):
+            params = struct.unpack('{}I'.format(len(extension) // 4),
+                                   extension)
+            if len(params) > _MAX_SCRIPT_PARAMS:
+                return pigpio.PI_TOO_MANY_PARAM
+            script.params[:len(params)] = params
+            if cmd == pigpio._PI_CMD_PROCR:
+                script.run()
+        elif cmd == pigpio._PI_CMD_PROCS:
+            script.stop()
+        elif cmd == pigpio._PI_CMD_PROCD:
+            script.stop()
+            with self._lock:
+                del self._scripts[script_id]
+        elif cmd == pigpio._PI_CMD_PROCP:
+            return 4 * (1 + _MAX_SCRIPT_PARAMS)
+        return 0
+
+    def _script_status(self, script_id: int) -> bytes:
+        with self._lock:
+            script = self._scripts[script_id]
+            return struct.pack('11i', script.status,
+                               *[pigpio.u2i(p) for p in script.params])
+
+    def _write_locked(self, gpio: int, level: int) -> int:
+        if gpio > 53:
+            return pigpio.PI_BAD_GPIO
+        self._modes[gpio] = pigpio.OUTPUT
+        if level:
+            self._set_levels_locked(self._levels | 1 << gpio)
+        else:
+            self._set_levels_locked(self._levels & ~(1 << gpio))
+        return 0
+
+    def _hardware_pwm_locked(self, gpio: int, frequency: int,
+                             duty: int) -> int:
+        if gpio not in _HARDWARE_PWM_GPIOS:
+            return pigpio.PI_NOT_HPWM_GPIO
+        if frequency > _MAX_HARDWARE_PWM_FREQUENCY:
+            return pigpio.PI_BAD_HPWM_FREQ
+        if duty > _MAX_HARDWARE_PWM_DUTY:
+            return pigpio.PI_BAD_HPWM_DUTY
+        self._hardware_pwm[gpio] = (frequency, duty)
+        self._pwm_history.append((time.monotonic(), gpio, frequency, duty))
+        self._modes[gpio] = pigpio.ALT0 if gpio in (12, 13) else pigpio.ALT5
+        return 0
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run a pure-Python stand-in for pigpiod")
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help="interface to listen on (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8888,
+        help="port to listen on (default: 8888)",
+    )
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help="seconds to wait before answering each command (default: 0)",
+    )
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0.0,
+        help="spread (s) of the uniform jitter added to the latency "
+             "(default: 0)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    logging.basicConfig(level=logging.INFO)
+    daemon = FakePigpiod(args.host, args.port, args.latency, args.jitter)
+    with daemon:
+        logger.info("Fake pigpiod listening on %s:%d", daemon.host,
+                    daemon.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
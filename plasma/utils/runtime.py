@@ -21,7 +21,23 @@
 score_player.py."""
 
 import logging
-from typing import Tuple, Union
+import os
+from typing import Iterable, Set, Tuple, Union
+
+from plasma.utils.scheduler import Scheduler
+
+
+# Scheduling policies for the timing thread, by config/CLI name
+REALTIME_POLICIES = {
+    'other': 'SCHED_OTHER',
+    'fifo': 'SCHED_FIFO',
+    'rr': 'SCHED_RR',
+}
+
+# Longest busy-wait before a deadline on a SCHED_FIFO or SCHED_RR timing
+# thread (s). Spinning at a realtime priority keeps every other thread on
+# its CPU, including those waiting for the GIL, from running.
+REALTIME_MAX_SPIN = 100e-6
 
 
 def cpu_serial() -> Union[str, None]:
@@ -86,3 +102,102 @@ def set_up_logging(verbosity_level: int=0) -> None:
     mock_logger.setLevel(pwm_level)
 
     logging.getLogger(__name__).debug("verbosity_level: %s", verbosity_level)
+
+
+def parse_cpu_list(cpu_list: str) -> Union[Set[int], None]:
+    """Parse a CPU list such as "3" or "2,3" or "2-3" into a set
+
+    An empty list gives None, for no pinning.
+    """
+    cpus = set()
+    for part in cpu_list.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus or None
+
+
+def set_thread_scheduling(cpus: Iterable[int]=None,
+                          policy: str='other',
+                          priority: int=0) -> str:
+    """Pin the calling thread to `cpus` and give it `policy`, if permitted
+
+    Each step that is unsupported or not permitted (e.g. SCHED_FIFO
+    without CAP_SYS_NICE) is logged and skipped, leaving the thread as
+    it was.
+
+    :param cpus: CPUs to run on, or None to leave the affinity alone
+    :param policy: One of `REALTIME_POLICIES`
+    :param priority: Static priority for 'fifo' and 'rr' (1-99)
+    :return: A description of the effective policy, priority and CPUs
+    """
+    if policy not in REALTIME_POLICIES:
+        raise ValueError("Unknown scheduling policy {!r}; expected one "
+                         "of {}".format(policy, sorted(REALTIME_POLICIES)))
+    logger = logging.getLogger(__name__)
+    if cpus:
+        try:
+            # On Linux, pid 0 is the calling thread rather than the process
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError, ValueError) as e:
+            logger.warning("Unable to pin timing thread to CPUs %s: %s",
+                           sorted(cpus), e)
+    if policy != 'other':
+        try:
+            os.sched_setscheduler(
+                0, getattr(os, REALTIME_POLICIES[policy]),
+                os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            logger.warning("Unable to set timing thread to %s priority %s: "
+                           "%s", REALTIME_POLICIES[policy], priority, e)
+    return describe_thread_scheduling()
+
+
+def describe_thread_scheduling() -> str:
+    """The calling thread's scheduling policy, priority and CPUs"""
+    try:
+        policy = os.sched_getscheduler(0)
+        priority = os.sched_getparam(0).sched_priority
+        cpus = sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return "unknown (no sched_* support)"
+    names = {getattr(os, name): name for name in REALTIME_POLICIES.values()
+             if hasattr(os, name)}
+    return "{} priority {} on CPUs {}".format(
+        names.get(policy, policy), priority,
+        ','.join(str(cpu) for cpu in cpus))
+
+
+def set_up_timing_thread(cpus: Iterable[int]=None,
+                         policy: str='other',
+                         priority: int=0,
+                         scheduler: Scheduler=None) -> str:
+    """Apply `set_thread_scheduling` to the scheduler's thread
+
+    The timing work of the interrupter, modulator and player all runs on
+    that thread (by default the process-wide `Scheduler.shared()`). If it
+    ends up with a realtime policy, its spin before each deadline is
+    limited to `REALTIME_MAX_SPIN`. The effective setting is logged and
+    returned.
+    """
+    scheduler = scheduler or Scheduler.shared()
+
+    def set_up() -> str:
+        description = set_thread_scheduling(cpus, policy, priority)
+        if _is_realtime():
+            scheduler.limit_spin(REALTIME_MAX_SPIN)
+        return description
+
+    description = scheduler.run_in_thread(set_up)
+    logging.getLogger(__name__).info("Timing thread: %s", description)
+    return description
+
+
+def _is_realtime() -> bool:
+    """Whether the calling thread has a SCHED_FIFO or SCHED_RR policy"""
+    try:
+        return os.sched_getscheduler(0) in (os.SCHED_FIFO, os.SCHED_RR)
+    except (AttributeError, OSError):
+        return False
@@ -0,0 +1,292 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from numbers import Real
+from typing import Callable, Optional, TypeVar
+
+from plasma.utils.timing import DeadlineClock
+
+
+# Task priorities: when several tasks are due at once, lower values run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+T = TypeVar('T')
+
+# callback(deadline) -> deadline of the next call, or None to finish
+TaskCallback = Callable[[Real], Optional[Real]]
+
+
+def _logger():
+    return logging.getLogger(__name__)
+
+
+class Task:
+    """A callback registered with a `Scheduler`"""
+
+    def __init__(self,
+                 scheduler: 'Scheduler',
+                 callback: TaskCallback,
+                 priority: int):
+        self._scheduler = scheduler
+        self._callback = callback
+        self._priority = priority
+        self._deadline = None
+        self._generation = 0
+        self._is_cancelled = False
+
+    @property
+    def priority(self) -> int:
+        return self._priority
+
+    @property
+    def deadline(self) -> Optional[Real]:
+        """`time.perf_counter` time of the next call, None once finished"""
+        return self._deadline
+
+    @property
+    def is_active(self) -> bool:
+        return self._deadline is not None
+
+    def reschedule(self, deadline: Real) -> None:
+        """Move the next call to `deadline`, reviving a finished task"""
+        self._scheduler._push(self, deadline)
+
+    def cancel(self) -> None:
+        """Remove the task
+
+        Called from any thread but the scheduler's, this also waits for a
+        call in progress to return, so the callback does not run again
+        once `cancel` returns.
+        """
+        self._scheduler._cancel(self)
+
+
+class Scheduler:
+    """Runs timed callbacks for a whole process on one thread
+
+    Components register a callback instead of owning a timing thread.
+    Each callback is called with its deadline (a `time.perf_counter`
+    time) and returns the deadline of its next call, or None to finish;
+    computing the next deadline from the last one keeps periodic work
+    free of drift. Tasks due at the same time run in priority order.
+
+    The thread sleeps on a `DeadlineClock` until the earliest deadline, and
+    is started with the first task. Callbacks run one at a time and should
+    return quickly: a slow callback delays every other task.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, name: str='Scheduler'):
+        self._name = name
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Held while callbacks run, so cancel() can wait them out
+        self._run_lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._clock = DeadlineClock()
+        self._thread = None
+        self._stop_signal = False
+
+    @classmethod
+    def shared(cls) -> 'Scheduler':
+        """The scheduler shared by all periodic work in this process"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def schedule(self,
+                 callback: TaskCallback,
+                 deadline: Real=None,
+                 priority: int=PRIORITY_NORMAL) -> Task:
+        """Call `callback(deadline)` at `deadline` (default: now)
+
+        :return: The task, for rescheduling or cancelling it
+        """
+        task = Task(self, callback, priority)
+        if deadline is None:
+            deadline = time.perf_counter()
+        self._push(task, deadline)
+        return task
+
+    def schedule_periodic(self,
+                          callback: Callable[[], None],
+                          period: Real,
+                          priority: int=PRIORITY_NORMAL) -> Task:
+        """Call `callback()` every `period` seconds, starting now"""
+        def run(deadline: Real) -> Real:
+            callback()
+            return next_deadline(deadline, period)
+        return self.schedule(run, priority=priority)
+
+    def run_in_thread(self, function: Callable[[], T]) -> T:
+        """Call `function()` on the scheduler thread and return its result
+
+        For per-thread settings such as the scheduling policy.
+        """
+        if threading.current_thread() is self._thread:
+            return function()
+        if self._stop_signal:
+            raise RuntimeError("Scheduler is closed")
+        done = threading.Event()
+        outcome = {}
+
+        def call(deadline: Real) -> None:
+            try:
+                outcome['result'] = function()
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        self.schedule(call, priority=PRIORITY_HIGH)
+        done.wait()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def limit_spin(self, seconds: Real) -> None:
+        """Spin for at most `seconds` before each deadline
+
+        Call on the scheduler thread, e.g. through `run_in_thread`.
+        """
+        self._clock.max_margin = seconds
+
+    def close(self) -> None:
+        """Drop all tasks and stop the thread"""
+        with self._lock:
+            self._stop_signal = True
+            for _, _, _, task, _ in self._heap:
+                task._deadline = None
+            self._heap = []
+            thread = self._thread
+            self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    @property
+    def is_running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _push(self, task: Task, deadline: Real) -> None:
+        with self._lock:
+            if self._stop_signal or task._is_cancelled:
+                return
+            task._generation += 1
+            task._deadline = deadline
+            heapq.heappush(self._heap, (
+                deadline, task.priority, next(self._sequence), task,
+                task._generation))
+            if self._heap[0][3] is task:
+                self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def _cancel(self, task: Task) -> None:
+        with self._lock:
+            task._is_cancelled = True
+            task._deadline = None
+        # Stale heap entries are dropped when they come due
+        if threading.current_thread() is not self._thread:
+            with self._run_lock:
+                pass
+
+    def _next_deadline(self) -> Optional[Real]:
+        with self._lock:
+            while self._heap:
+                _, _, _, task, generation = self._heap[0]
+                if generation == task._generation and not task._is_cancelled:
+                    return self._heap[0][0]
+                heapq.heappop(self._heap)
+            return None
+
+    def _pop_due(self, now: Real) -> list:
+        """Live tasks due at `now`, in the order to run them"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, priority, sequence, task, generation = \
+                    heapq.heappop(self._heap)
+                if generation == task._generation and not task._is_cancelled:
+                    due.append((priority, deadline, sequence, task))
+        due.sort(key=lambda entry: entry[:3])
+        return [(task, deadline, task._generation)
+                for _, deadline, _, task in due]
+
+    def _run(self) -> None:
+        while not self._stop_signal:
+            self._wakeup.clear()
+            deadline = self._next_deadline()
+            if deadline is None:
+                self._wakeup.wait()
+                continue
+            if not self._clock.wait_until(deadline, self._wakeup):
+                continue
+            with self._run_lock:
+                for task, deadline, generation in self._pop_due(
+                        time.perf_counter()):
+                    self._run_task(task, deadline, generation)
+
+    def _run_task(self,
+                  task: Task,
+                  deadline: Real,
+                  generation: int) -> None:
+        if task._is_cancelled or task._generation != generation:
+            # Cancelled or rescheduled by a task run before it
+            return
+        try:
+            next_call = task._callback(deadline)
+        except Exception:
+            _logger().exception("Scheduled task failed; dropping it")
+            next_call = None
+        with self._lock:
+            if task._is_cancelled or task._generation != generation:
+                # Rescheduled or cancelled during the call
+                return
+            task._deadline = None
+        if next_call is not None:
+            self._push(task, next_call)
+
+
+def next_deadline(deadline: Real, period: Real) -> Real:
+    """The deadline one period after `deadline`
+
+    If that is more than a period in the past, e.g. after the host
+    stalled, the schedule restarts from now rather than rushing through
+    the backlog.
+    """
+    deadline += period
+    now = time.perf_counter()
+    if deadline < now - period:
+        deadline = now
+    return deadline
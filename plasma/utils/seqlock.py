@@ -0,0 +1,99 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import struct
+import threading
+from numbers import Real
+from typing import Sequence, Tuple
+
+
+class SeqlockBlock:
+    """Named float parameters in shared memory, guarded by a seqlock
+
+    One process writes and others read without locks or system calls,
+    e.g. through a `multiprocessing.RawArray` of `size(len(fields))`
+    bytes. The block starts with a sequence number that the writer makes
+    odd while it updates a field and even again afterwards; a reader
+    retries until it copies the block between two equal, even sequence
+    numbers. Every field also has a write counter, so a reader can tell a
+    repeated write of the same value from no write at all.
+
+    Writes are serialised with a lock, so threads of the writing process
+    may share the block.
+    """
+
+    _SEQUENCE = struct.Struct('<I')
+
+    def __init__(self, fields: Sequence[str], buffer):
+        """
+        :param fields: Field names, in layout order
+        :param buffer: Writable buffer of at least `size(len(fields))` bytes
+        """
+        self._fields = tuple(fields)
+        self._index = {field: i for i, field in enumerate(self._fields)}
+        self._buffer = buffer
+        n = len(self._fields)
+        self._block = struct.Struct('<I{}d{}I'.format(n, n))
+        self._value = struct.Struct('<d')
+        self._counter = struct.Struct('<I')
+        self._values_offset = self._SEQUENCE.size
+        self._counters_offset = self._values_offset + 8 * n
+        self._lock = threading.Lock()
+        if memoryview(buffer).nbytes < self._block.size:
+            raise ValueError("Buffer too small for {} fields".format(n))
+
+    @classmethod
+    def size(cls, field_count: int) -> int:
+        """Bytes needed for a block of `field_count` fields"""
+        return struct.calcsize('<I{}d{}I'.format(field_count, field_count))
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return self._fields
+
+    @property
+    def sequence(self) -> int:
+        """Changes with every write, for a cheap check before `read`"""
+        return self._SEQUENCE.unpack_from(self._buffer)[0]
+
+    def write(self, field: str, value: Real) -> None:
+        i = self._index[field]
+        with self._lock:
+            sequence = self.sequence
+            counter_offset = self._counters_offset + 4 * i
+            counter = self._counter.unpack_from(
+                self._buffer, counter_offset)[0]
+            self._SEQUENCE.pack_into(
+                self._buffer, 0, (sequence + 1) & 0xffffffff)
+            self._value.pack_into(
+                self._buffer, self._values_offset + 8 * i, value)
+            self._counter.pack_into(
+                self._buffer, counter_offset, (counter + 1) & 0xffffffff)
+            self._SEQUENCE.pack_into(
+                self._buffer, 0, (sequence + 2) & 0xffffffff)
+
+    def read(self) -> Tuple[int, Tuple[float, ...], Tuple[int, ...]]:
+        """A consistent snapshot as (sequence, values, write counters)"""
+        n = len(self._fields)
+        while True:
+            snapshot = self._block.unpack_from(self._buffer)
+            sequence = snapshot[0]
+            if sequence % 2 == 0 and sequence == self.sequence:
+                return sequence, snapshot[1:n + 1], snapshot[n + 1:]
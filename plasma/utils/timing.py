@@ -0,0 +1,90 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from numbers import Real
+
+
+class DeadlineClock:
+    """Waits for absolute `time.perf_counter` deadlines
+
+    Each wait sleeps until shortly before the deadline, then spins for
+    the rest. The margin left for spinning follows the measured wakeup
+    latency of the sleeps: it jumps to twice any late wakeup, and decays
+    slowly back towards `min_margin` while wakeups are prompt.
+
+    Scheduling each deadline from the previous one, rather than from the
+    time a wait returned, keeps a periodic loop free of drift.
+    """
+
+    _MARGIN_DECAY = 0.98
+
+    def __init__(self,
+                 min_margin: Real=50e-6,
+                 max_margin: Real=2e-3):
+        """
+        :param min_margin: Shortest spin before a deadline (s)
+        :param max_margin: Longest spin before a deadline (s)
+        """
+        self._min_margin = min_margin
+        self._max_margin = max_margin
+        self._margin = max_margin
+
+    @property
+    def margin(self) -> Real:
+        """Current spin time before each deadline (s)"""
+        return self._margin
+
+    @property
+    def max_margin(self) -> Real:
+        """Longest spin before a deadline (s)"""
+        return self._max_margin
+
+    @max_margin.setter
+    def max_margin(self, value: Real) -> None:
+        self._max_margin = value
+        self._min_margin = min(self._min_margin, value)
+        self._margin = min(self._margin, value)
+
+    def wait_until(self,
+                   deadline: Real,
+                   interrupt: threading.Event=None) -> bool:
+        """Return at `deadline`, or once `interrupt` is set
+
+        :return: False if interrupted before the deadline
+        """
+        sleep_seconds = deadline - time.perf_counter() - self._margin
+        if sleep_seconds > 0:
+            wake_time = time.perf_counter() + sleep_seconds
+            if interrupt is not None:
+                if interrupt.wait(sleep_seconds):
+                    return False
+            else:
+                time.sleep(sleep_seconds)
+            self._update_margin(time.perf_counter() - wake_time)
+        while time.perf_counter() < deadline:
+            if interrupt is not None and interrupt.is_set():
+                return False
+        return True
+
+    def _update_margin(self, latency: Real) -> None:
+        margin = max(2 * latency, self._margin * self._MARGIN_DECAY)
+        self._margin = min(max(margin, self._min_margin), self._max_margin)
@@ -21,16 +21,24 @@
 # <http://www.gnu.org/licenses/>.
 
 import argparse
+import asyncio
 import logging
 import sys
 
 from plasma.controller.base_controller import BaseController
-from plasma.utils.runtime import parse_bind_host, set_up_logging
+from plasma.utils.runtime import (
+    REALTIME_POLICIES, parse_bind_host, parse_cpu_list, set_up_logging,
+    set_up_timing_thread)
 from plasma.controller.keyboard_controller import KeyboardController
-from plasma.controller.osc_controller import OSCController
+from plasma.controller.osc_controller import OSCController, SERVER_TYPES
 from plasma.interrupter.simple_interrupter import SimpleInterrupter
-from plasma.modulator.callback_modulator import CallbackModulator
-from plasma.pwm.mock_pwm import MockPWM
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.modulation_matrix import ModulationMatrix
+from plasma.modulator.wavetable_modulator import (
+    WavetableModulator, get_table, table_function)
+from plasma.pwm.mock_pwm import MockPWM, RecordingMockPWM
+from plasma.pwm.quantization import HardwarePWMQuantizer
+from plasma.pwm.timeline import PWMTimeline
 try:
     from plasma.pwm.pi_pwm import PiHardwarePWM
 except ImportError as e:
@@ -58,11 +66,81 @@ def parse_arguments() -> argparse.Namespace:
              "If the port is not specified, the default 5005 "
              "is used.  (default: 0.0.0.0:5005)"
     )
+    parser.add_argument(
+        "--osc-server",
+        dest='osc_server',
+        default='threading',
+        choices=SERVER_TYPES,
+        help="threading: handle each OSC datagram on a new thread; "
+             "batched: receive on one thread and handle on --osc-workers "
+             "threads, in order for each address (default: threading)"
+    )
+    parser.add_argument(
+        "--osc-workers",
+        dest='osc_workers',
+        type=int,
+        default=0,
+        help="with --osc-server batched, OSC handler threads; 0 handles "
+             "datagrams on the receive thread (default: 0)"
+    )
+    parser.add_argument(
+        "--osc-receive-buffer",
+        dest='osc_receive_buffer',
+        type=int,
+        default=None,
+        help="with --osc-server batched, the socket receive buffer in "
+             "bytes (default: the system default)"
+    )
+    parser.add_argument(
+        "--osc-late-tolerance",
+        dest='osc_late_tolerance',
+        type=float,
+        default=None,
+        help="with --osc-server batched, drop bundled messages received "
+             "more than this many seconds after their time tag (default: "
+             "apply them all)"
+    )
+    parser.add_argument(
+        "--osc-file-dir",
+        dest='osc_file_directory',
+        default=None,
+        help="directory of the table and score files that OSC messages "
+             "may name, e.g. with /fm/waveform (default: none, only "
+             "built-in waveforms)"
+    )
+    parser.add_argument(
+        "--osc-apply-frequency",
+        dest='osc_apply_frequency',
+        type=float,
+        default=0.0,
+        help="apply OSC messages at most this many times a second, keeping "
+             "only the newest value of continuous controls (default: 0.0 "
+             "== apply each message as it arrives)"
+    )
     parser.add_argument(
         "--mock",
         action="store_true",
         help="use mock PWM to test controller without a Pi"
     )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="with --mock, record the PWM commands and write them to FILE "
+             "(.npy or .csv) on exit"
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="drive the PWM and the OSC server from one asyncio event loop "
+             "(OSC controller only)"
+    )
+    parser.add_argument(
+        "--engine-process",
+        dest="engine_process",
+        action="store_true",
+        help="run the interrupter and modulator in a child process, out of "
+             "reach of the OSC server's threads"
+    )
     parser.add_argument(
         "--host",
         type=str,
@@ -76,6 +154,47 @@ def parse_arguments() -> argparse.Namespace:
         default=18,
         help="GPIO pin to run hardware PWM (default: 18)",
     )
+    parser.add_argument(
+        '--write-behind-frequency',
+        dest='write_behind_frequency',
+        type=float,
+        default=0.0,
+        help="maximum rate (Hz) of coalesced writes to pigpiod from a "
+             "single owner thread (default: 0.0 == write synchronously)",
+    )
+    parser.add_argument(
+        '--pwm-clock',
+        dest='pwm_clock',
+        type=int,
+        default=None,
+        help="PWM clock of the Pi in Hz, e.g. 250000000 (Pi 0-3) or "
+             "375000000 (Pi 4). Snaps requests to achievable outputs and "
+             "skips writes that don't change the output (default: off)",
+    )
+    parser.add_argument(
+        '--realtime-cpus',
+        dest='realtime_cpus',
+        type=parse_cpu_list,
+        default=None,
+        help="CPUs to pin the interrupter/modulator timing thread to, "
+             "e.g. 3 or 2-3 (default: any CPU)",
+    )
+    parser.add_argument(
+        '--realtime-policy',
+        dest='realtime_policy',
+        choices=sorted(REALTIME_POLICIES),
+        default='other',
+        help="scheduling policy of the timing thread; fifo and rr need "
+             "root or CAP_SYS_NICE (default: other)",
+    )
+    parser.add_argument(
+        '--realtime-priority',
+        dest='realtime_priority',
+        type=int,
+        default=50,
+        help="priority (1-99) of the timing thread with --realtime-policy "
+             "fifo or rr (default: 50)",
+    )
     parser.add_argument(
         '-m', '--modulator-frequency',
         dest='modulator_frequency',
@@ -90,6 +209,44 @@ def parse_arguments() -> argparse.Namespace:
         default=1.0,
         help="frequency spread (Hz) of FM modulator (default: 1.0)",
     )
+    parser.add_argument(
+        '--modulator-dead-band',
+        dest='modulator_dead_band',
+        type=float,
+        default=None,
+        help="smallest FM change (Hz) sent to the PWM (default: one "
+             "hardware step with --pwm-clock, otherwise 0 == changes only)",
+    )
+    parser.add_argument(
+        '--modulator-keepalive',
+        dest='modulator_keepalive',
+        type=float,
+        default=1.0,
+        help="longest time (s) between FM updates sent to the PWM "
+             "(default: 1.0)",
+    )
+    parser.add_argument(
+        '--modulator-render-ahead',
+        dest='modulator_render_ahead',
+        type=float,
+        default=0.0,
+        help="seconds of FM values to compute in advance, in chunks "
+             "between updates, so late updates are not skewed (default: "
+             "0.0 == when due)",
+    )
+    parser.add_argument(
+        '--waveform',
+        default='sine',
+        help="FM waveform: sine, triangle, saw, square, random, or a file "
+             "of values in [-1, 1] (default: sine)",
+    )
+    parser.add_argument(
+        '--script-modulator',
+        dest='script_modulator',
+        action="store_true",
+        help="step the FM modulator through a waveform table in a script "
+             "inside pigpiod rather than from Python",
+    )
     parser.add_argument(
         '-D', '--interrupter-duty-cycle',
         dest='interrupter_duty_cycle',
@@ -104,6 +261,13 @@ def parse_arguments() -> argparse.Namespace:
         default=100.0,
         help="frequency (Hz) of the interrupter (default: 100.0)",
     )
+    parser.add_argument(
+        '--script-interrupter',
+        dest='script_interrupter',
+        action="store_true",
+        help="time the interrupter with a script inside pigpiod rather "
+             "than from Python",
+    )
     parser.add_argument(
         '-d', '--pwm-duty-cycle',
         dest='pwm_duty_cycle',
@@ -136,54 +300,208 @@ def parse_arguments() -> argparse.Namespace:
         help="Enable verbose logging. "
              "Repeat up to three times for more logging"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.record is not None:
+        if not args.mock:
+            parser.error("--record requires --mock")
+        if not args.record.endswith(('.npy', '.csv')):
+            parser.error("--record FILE should end in .npy or .csv")
+    if args.asyncio:
+        # Only the OSC controller runs the event loop the PWM writes on
+        if args.controller_type != "OSC":
+            parser.error("--asyncio requires the OSC controller")
+        if args.write_behind_frequency:
+            parser.error("--write-behind-frequency can't be combined with "
+                         "--asyncio, which coalesces writes on the loop")
+        if sys.version_info < (3, 5, 2):
+            parser.error("--asyncio requires Python 3.5.2 or newer")
+        if args.osc_server != 'threading':
+            parser.error("--osc-server can't be combined with --asyncio, "
+                         "which receives on the event loop")
+        if args.osc_apply_frequency:
+            parser.error("--osc-apply-frequency can't be combined with "
+                         "--asyncio, which applies messages on the loop")
+    for option in ('script_interrupter', 'script_modulator'):
+        if getattr(args, option) and (args.mock or args.asyncio):
+            parser.error("--{} can't be combined with --mock or "
+                         "--asyncio".format(option.replace('_', '-')))
+    try:
+        get_table(args.waveform)
+    except ModulatorException as e:
+        parser.error(str(e))
+    if args.engine_process:
+        for option in ('record', 'asyncio', 'script_interrupter',
+                       'script_modulator'):
+            if getattr(args, option):
+                parser.error("--engine-process can't be combined with "
+                             "--{}".format(option.replace('_', '-')))
+    if args.osc_workers < 0:
+        parser.error("--osc-workers must be >= 0")
+    if (args.osc_late_tolerance is not None
+            and args.osc_server != 'batched'):
+        parser.error("--osc-late-tolerance requires --osc-server batched")
+    if args.osc_apply_frequency < 0:
+        parser.error("--osc-apply-frequency must be >= 0")
+    if args.script_interrupter and args.script_modulator:
+        # The PWM hands its state to one script at a time
+        parser.error("--script-interrupter and --script-modulator can't be "
+                     "combined")
+    return args
 
 
-def get_controller(args: argparse.Namespace) -> BaseController:
-    if args.mock:
+def get_controller(args: argparse.Namespace,
+                   timeline: PWMTimeline=None) -> BaseController:
+    if args.engine_process:
+        return _get_engine_controller(args)
+
+    loop = None
+    if timeline is not None:
+        pwm = RecordingMockPWM(timeline=timeline)
+    elif args.mock:
         pwm = MockPWM()
+    elif args.asyncio:
+        from plasma.pwm.async_pi_pwm import AsyncPiHardwarePWM
+        loop = asyncio.get_event_loop()
+        pwm = loop.run_until_complete(
+            AsyncPiHardwarePWM.connect(args.pin, args.host,
+                                       pwm_clock=args.pwm_clock))
     else:
-        pwm = PiHardwarePWM(args.pin, args.host)
+        pwm = PiHardwarePWM(
+            args.pin, args.host,
+            write_behind_frequency=args.write_behind_frequency,
+            pwm_clock=args.pwm_clock)
 
     pwm.frequency = args.pwm_frequency
     pwm.duty_cycle = args.pwm_duty_cycle
 
-    interrupter = SimpleInterrupter(pwm,
+    if args.script_interrupter:
+        from plasma.interrupter.script_interrupter import ScriptInterrupter
+        interrupter_class = ScriptInterrupter
+    else:
+        interrupter_class = SimpleInterrupter
+    interrupter = interrupter_class(pwm,
                                     args.interrupter_frequency,
                                     args.interrupter_duty_cycle)
 
     fine_spread = args.fine_spread
 
-    modulator = CallbackModulator(
-        lambda f: pwm.set_frequency(f),
-        frequency=args.modulator_frequency,
-        spread=args.modulator_spread,
-        center=pwm.frequency,
-        update_frequency=40,
-    )
+    if args.script_modulator:
+        from plasma.modulator.script_modulator import ScriptModulator
+        modulator = ScriptModulator(
+            pwm,
+            frequency=args.modulator_frequency,
+            spread=args.modulator_spread,
+            center=pwm.frequency,
+            waveform=table_function(get_table(args.waveform)),
+        )
+    else:
+        modulator = WavetableModulator(
+            pwm.set_frequency_deferred,
+            frequency=args.modulator_frequency,
+            spread=args.modulator_spread,
+            center=pwm.frequency,
+            update_frequency=40,
+            waveform=args.waveform,
+            dead_band=_modulator_dead_band(args),
+            keepalive=args.modulator_keepalive,
+            render_ahead=args.modulator_render_ahead,
+        )
 
     if args.controller_type == "keyboard":
         controller = KeyboardController(modulator, interrupter)
     elif args.controller_type == "OSC":
         host, port = parse_bind_host(args.osc_bind)
+        matrix = None
+        if loop is None:
+            # The matrix writes from the scheduler thread, which the
+            # event loop's PWM does not allow
+            matrix = ModulationMatrix(pwm, interrupter)
         controller = OSCController(host, port, modulator, interrupter,
                                    fine_spread=fine_spread,
-                                   address_roots=args.osc_roots.split(','))
+                                   address_roots=args.osc_roots.split(','),
+                                   loop=loop, modulation_matrix=matrix,
+                                   **_osc_server_kwargs(args))
     else:
         raise ValueError("Unknown controller type %s", args.controller_type)
 
     return controller
 
 
+def _osc_server_kwargs(args: argparse.Namespace) -> dict:
+    return {'server_type': args.osc_server,
+            'workers': args.osc_workers,
+            'receive_buffer_size': args.osc_receive_buffer,
+            'apply_frequency': args.osc_apply_frequency,
+            'late_tolerance': args.osc_late_tolerance,
+            'file_directory': args.osc_file_directory}
+
+
+def _modulator_dead_band(args: argparse.Namespace):
+    if args.modulator_dead_band is not None:
+        return args.modulator_dead_band
+    if args.pwm_clock:
+        return HardwarePWMQuantizer(args.pwm_clock).resolution
+    return 0.0
+
+
+def _get_engine_controller(args: argparse.Namespace) -> BaseController:
+    """The controller, with the PWM driven from a `ProcessEngine`"""
+    from plasma.engine.process_engine import ProcessEngine
+    if args.mock:
+        pwm_factory, pwm_args, pwm_kwargs = MockPWM, (), {}
+    else:
+        pwm_factory, pwm_args = PiHardwarePWM, (args.pin, args.host)
+        pwm_kwargs = {'write_behind_frequency': args.write_behind_frequency,
+                      'pwm_clock': args.pwm_clock}
+    # Closed when the process exits
+    engine = ProcessEngine(
+        pwm_factory, pwm_args, pwm_kwargs,
+        interrupter_frequency=args.interrupter_frequency,
+        interrupter_duty_cycle=args.interrupter_duty_cycle,
+        modulator_frequency=args.modulator_frequency,
+        modulator_spread=args.modulator_spread,
+        modulator_center=args.pwm_frequency,
+        modulator_waveform=args.waveform,
+        modulator_dead_band=_modulator_dead_band(args),
+        modulator_keepalive=args.modulator_keepalive,
+        modulator_render_ahead=args.modulator_render_ahead,
+        realtime_cpus=args.realtime_cpus,
+        realtime_policy=args.realtime_policy,
+        realtime_priority=args.realtime_priority)
+    engine.pwm.frequency = args.pwm_frequency
+    engine.pwm.duty_cycle = args.pwm_duty_cycle
+
+    if args.controller_type == "keyboard":
+        return KeyboardController(engine.modulator, engine.interrupter)
+    host, port = parse_bind_host(args.osc_bind)
+    return OSCController(host, port, engine.modulator, engine.interrupter,
+                         fine_spread=args.fine_spread,
+                         address_roots=args.osc_roots.split(','),
+                         **_osc_server_kwargs(args))
+
+
 def main():
     sys.setswitchinterval(5e-4)
     args = parse_arguments()
     set_up_logging(args.verbose)
     logger = logging.getLogger(__name__)
     logger.debug("Arguments: %s", args)
+    if not args.engine_process:
+        # Otherwise the engine sets up its own timing thread
+        set_up_timing_thread(args.realtime_cpus, args.realtime_policy,
+                             args.realtime_priority)
 
-    with get_controller(args) as c:
-        c.run()
+    timeline = None
+    if args.record is not None:
+        timeline = PWMTimeline()
+    try:
+        with get_controller(args, timeline) as c:
+            c.run()
+    finally:
+        if timeline is not None:
+            logger.info("Writing %s PWM commands to %s (%s dropped)",
+                        len(timeline), args.record, timeline.dropped)
+            timeline.save(args.record)
 
 
 if __name__ == '__main__':
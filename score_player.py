@@ -45,6 +45,7 @@ from plasma.player.score import Score
 from plasma.player.state_machine import (
     Action, ActionKind, PlayerStateMachine, State)
 from plasma.utils.runtime import cpu_serial, parse_bind_host, set_up_logging
+from plasma.utils.scheduler import PRIORITY_LOW, Scheduler
 
 
 _DEFAULT_CONFIG = os.path.join(_BASE_PATH, 'config', 'irobot.conf')
@@ -89,7 +90,8 @@ class Player:
     def __init__(self,
                  score: Score,
                  osc: PlayerOSCClient,
-                 tick_hz: float = _TICK_HZ):
+                 tick_hz: float = _TICK_HZ,
+                 scheduler: Scheduler = None):
         self._score = score
         self._osc = osc
         self._tick_period = 1.0 / tick_hz
@@ -99,6 +101,7 @@ class Player:
         # or idle. Set when transitioning to PLAYING.
         self._origin_wallclock = None
         self._stop_event = threading.Event()
+        self._scheduler = scheduler or Scheduler.shared()
 
     @property
     def state(self) -> State:
@@ -145,19 +148,21 @@ class Player:
     def request_stop(self) -> None:
         self._stop_event.set()
 
+    def _tick(self) -> None:
+        with self._lock:
+            if self._state_machine.state is State.PLAYING:
+                t = self._playback_t()
+                value = self._score.sample(t)
+                self._osc.fine_value(value)
+
     def run(self) -> None:
-        """Block on the periodic tick until request_stop()."""
-        while not self._stop_event.is_set():
-            tick_start = time.time()
-            with self._lock:
-                if self._state_machine.state is State.PLAYING:
-                    t = self._playback_t()
-                    value = self._score.sample(t)
-                    self._osc.fine_value(value)
-            elapsed = time.time() - tick_start
-            sleep_for = max(0.0, self._tick_period - elapsed)
-            if self._stop_event.wait(timeout=sleep_for):
-                break
+        """Run the periodic tick on the scheduler until request_stop()."""
+        task = self._scheduler.schedule_periodic(
+            self._tick, self._tick_period, priority=PRIORITY_LOW)
+        try:
+            self._stop_event.wait()
+        finally:
+            task.cancel()
         # Final tidy-up: if we exit while playing, send /stop so we don't
         # leave the tube modulating without a driver.
         if self._state_machine.state is not State.IDLE:
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+r"""Report the output fidelity of a recorded PWM timeline.
+
+Record a mock run, then analyse it with the settings it was run with:
+
+    python3 plasma_controller.py --mock --record run.npy -f 30000 ...
+    python3 scripts/analyze_timeline.py run.npy --interrupter-frequency 100
+    python3 scripts/analyze_timeline.py run.npy --modulator-frequency 2 \
+        --modulator-spread 500 --center 30000
+
+Needs NumPy. Errors are absolute; times are in microseconds.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plasma.pwm.timeline_analysis import (  # noqa: E402
+    analyze_interrupter, analyze_spectrum, analyze_steps, load_timeline)
+
+
+def print_percentiles(name, percentiles, scale=1.0):
+    print("{:>28} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+        name, *[value * scale for value in percentiles]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('timeline', help=".npy or .csv timeline")
+    parser.add_argument('--interrupter-frequency', type=float)
+    parser.add_argument('--interrupter-duty-cycle', type=float, default=0.5)
+    parser.add_argument('--modulator-frequency', type=float)
+    parser.add_argument('--modulator-spread', type=float, default=1.0)
+    parser.add_argument('--center', type=float,
+                        help="center frequency of the modulator")
+    parser.add_argument('--update-frequency', type=float, default=40.0,
+                        help="modulator update rate (default: 40)")
+    parser.add_argument('--sample-rate', type=float, default=1000.0,
+                        help="FFT sample rate (default: 1000)")
+    args = parser.parse_args()
+
+    timeline = load_timeline(args.timeline)
+    print("{} rows over {:.3f} s".format(
+        len(timeline),
+        (timeline['time_ns'][-1] - timeline['time_ns'][0]) * 1e-9))
+    print("{:>28} {:>10} {:>10} {:>10} {:>10}".format(
+        "", "p50", "p90", "p99", "max"))
+
+    if args.interrupter_frequency:
+        report = analyze_interrupter(timeline, args.interrupter_frequency,
+                                     args.interrupter_duty_cycle)
+        print("interrupter: {} cycles".format(report.cycles))
+        print_percentiles("period error (us)", report.period_error, 1e6)
+        print_percentiles("duty cycle error (%)",
+                          report.duty_cycle_error, 100)
+
+    if args.modulator_frequency:
+        steps = analyze_steps(timeline, args.update_frequency)
+        print("modulator: {} steps".format(steps.steps))
+        print_percentiles("step interval error (us)",
+                          steps.interval_error, 1e6)
+        center = args.center
+        if center is None:
+            center = float(timeline['frequency'].mean())
+        spectrum = analyze_spectrum(
+            timeline, args.modulator_frequency, args.modulator_spread,
+            center, args.sample_rate)
+        print("FM peak at {:.3f} Hz".format(spectrum.peak_frequency))
+        print("{:>28} {:>10} {:>10}".format("", "measured", "ideal"))
+        print("{:>28} {:>10.1f} {:>10.1f}".format(
+            "amplitude (Hz)", spectrum.amplitude, spectrum.ideal_amplitude))
+        print("{:>28} {:>10.4f} {:>10.4f}".format(
+            "spurious/fundamental power", spectrum.spurious_ratio,
+            spectrum.ideal_spurious_ratio))
+        print("{:>28} {:>10.1f}".format("RMS error (Hz)",
+                                        spectrum.rms_error))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Time OSC address dispatch, pythonosc's Dispatcher vs. CompiledDispatcher.
+
+Maps the addresses of an OSCController with three address roots on each
+dispatcher, then looks up a mix of them:
+
+    python3 scripts/bench_osc_dispatch.py
+
+Reports the lookups per second of each, and the ratio.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythonosc.dispatcher import Dispatcher  # noqa: E402
+
+from plasma.controller.osc_controller import OSCController  # noqa: E402
+from plasma.controller.osc_dispatcher import CompiledDispatcher  # noqa: E402
+from plasma.interrupter.simple_interrupter import (  # noqa: E402
+    SimpleInterrupter)
+from plasma.modulator.callback_modulator import (  # noqa: E402
+    CallbackModulator)
+from plasma.pwm.mock_pwm import MockPWM  # noqa: E402
+
+ROOTS = ['pwm', 'pwm/channel-01', 'pwm/channel-02']
+ADDRESSES = ['/pwm/channel-02/fm/frequency', '/pwm/duty-cycle',
+             '/pwm/channel-01/interrupter/frequency']
+
+
+def controller_map():
+    """The controller's {address: [handler]}"""
+    pwm = MockPWM()
+    controller = OSCController(
+        '127.0.0.1', 0,
+        CallbackModulator(pwm.set_frequency_deferred, 0, 1, 1000),
+        SimpleInterrupter(pwm, 100, 1.0), address_roots=ROOTS)
+    return controller._get_dispatcher()._map
+
+
+def lookups_per_second(dispatcher, count):
+    start = time.perf_counter()
+    for _ in range(count // len(ADDRESSES)):
+        for address in ADDRESSES:
+            list(dispatcher.handlers_for_address(address))
+    return count // len(ADDRESSES) * len(ADDRESSES) / (
+        time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=3000,
+                        help="lookups per measurement (default: 3000)")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help="measurements per dispatcher; the median is "
+                             "shown (default: 7)")
+    args = parser.parse_args()
+
+    mapped = controller_map()
+    rates = []
+    print("{:>20} {:>12}".format("dispatcher", "lookups/s"))
+    for dispatcher_class in (Dispatcher, CompiledDispatcher):
+        dispatcher = dispatcher_class()
+        for address, handlers in mapped.items():
+            for handler in handlers:
+                dispatcher.map(address, handler.callback, *handler.args)
+        rates.append(statistics.median(
+            lookups_per_second(dispatcher, args.count)
+            for _ in range(args.repeat)))
+        print("{:>20} {:>12.0f}".format(dispatcher_class.__name__,
+                                        rates[-1]))
+    print("{:>20} {:>12.1f}x".format("speedup", rates[1] / rates[0]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
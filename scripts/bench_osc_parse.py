@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Time OSC message parsing, pythonosc's OscMessage vs. parse_message.
+
+Parses a mix of the messages the controller handles with each:
+
+    python3 scripts/bench_osc_parse.py
+
+Reports the messages per second of each, and the ratio.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythonosc.osc_message import OscMessage  # noqa: E402
+from pythonosc.osc_message_builder import OscMessageBuilder  # noqa: E402
+
+from plasma.controller.osc_parser import parse_message  # noqa: E402
+
+MESSAGES = [('/pwm/duty-cycle', 0.25),
+            ('/pwm/channel-01/fm/frequency', 440.0),
+            ('/pwm/interrupter/frequency', 100),
+            ('/pwm/fm/waveform', 'sine'),
+            ('/pwm/root/matrix/route', 'lfo', 'duty', 0.5)]
+
+
+def datagrams():
+    built = []
+    for address, *args in MESSAGES:
+        builder = OscMessageBuilder(address)
+        for arg in args:
+            builder.add_arg(arg)
+        built.append(builder.build().dgram)
+    return built
+
+
+def messages_per_second(parse, data, count):
+    start = time.perf_counter()
+    for _ in range(count // len(data)):
+        for datagram in data:
+            parse(datagram)
+    return count // len(data) * len(data) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000,
+                        help="messages per measurement (default: 20000)")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help="measurements per parser; the median is shown "
+                             "(default: 7)")
+    args = parser.parse_args()
+
+    data = datagrams()
+    rates = []
+    print("{:>20} {:>12}".format("parser", "messages/s"))
+    for parse in (OscMessage, parse_message):
+        rates.append(statistics.median(
+            messages_per_second(parse, data, args.count)
+            for _ in range(args.repeat)))
+        print("{:>20} {:>12.0f}".format(parse.__name__, rates[-1]))
+    print("{:>20} {:>12.1f}x".format("speedup", rates[1] / rates[0]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Client-side cost of a pigpio command, old vs. current vendored module.
+
+Compares pigpio/pigpio.py in the working tree against the same file at a
+git revision, e.g. on a Pi before and after a change to the command path:
+
+    python3 scripts/bench_pigpio_command.py 697789e
+
+Replies for each chunk of commands are queued in a socket pair before the
+clock starts, so the figures are the Python overhead of packing, sending,
+receiving and unpacking, without the daemon round trip or thread wakeups.
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = 'pigpio/pigpio.py'
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_revision(revision, directory):
+    source = subprocess.check_output(
+        ['git', 'show', '{}:{}'.format(revision, MODULE)], cwd=ROOT)
+    path = os.path.join(directory, 'pigpio_{}.py'.format(revision))
+    with open(path, 'wb') as fp:
+        fp.write(source)
+    return load_module('pigpio_' + revision, path)
+
+
+def commands(pigpio):
+    """The commands timed, as {name: function(sl)}"""
+    hardware_pwm = getattr(pigpio, '_pigpio_command_u32', None)
+    if hardware_pwm is None:
+        def hardware_pwm(sl, cmd, p1, p2, value):
+            return pigpio._pigpio_command_ext(
+                sl, cmd, p1, p2, 4, [struct.pack('I', value)])
+    return {
+        'write': lambda sl: pigpio._pigpio_command(
+            sl, pigpio._PI_CMD_WRITE, 18, 1),
+        'hardware_PWM': lambda sl: hardware_pwm(
+            sl, pigpio._PI_CMD_HP, 18, 30000, 500000),
+        'wave_add_serial': lambda sl: pigpio._pigpio_command_ext(
+            sl, pigpio._PI_CMD_WVAS, 4, 9600, 12,
+            [struct.pack('III', 8, 2, 0), b'plasma']),
+    }
+
+
+def discard(sock):
+    sock.setblocking(False)
+    try:
+        while sock.recv(1 << 16):
+            pass
+    except BlockingIOError:
+        pass
+    finally:
+        sock.setblocking(True)
+
+
+def time_command(pigpio, run, count, chunk):
+    """Mean microseconds per command"""
+    replies = struct.pack('IIII', 0, 0, 0, 0) * chunk
+    ours, theirs = socket.socketpair()
+    sl = pigpio._socklock()
+    sl.s = ours
+    elapsed = 0.0
+    try:
+        for _ in range(count // chunk):
+            theirs.sendall(replies)
+            start = time.perf_counter()
+            for _ in range(chunk):
+                run(sl)
+            elapsed += time.perf_counter() - start
+            discard(theirs)
+    finally:
+        ours.close()
+        theirs.close()
+    return elapsed / (count // chunk * chunk) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('revision',
+                        help="git revision holding the old pigpio.py")
+    parser.add_argument('--count', type=int, default=20000,
+                        help="commands per measurement")
+    parser.add_argument('--chunk', type=int, default=100,
+                        help="commands per queued batch of replies")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help="measurements per command; the median is shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        modules = [
+            (args.revision, load_revision(args.revision, directory)),
+            ('current', load_module('pigpio_current',
+                                    os.path.join(ROOT, MODULE))),
+        ]
+        print("{:>16} {:>12} {:>12}".format(
+            "us/command", modules[0][0], modules[1][0]))
+        for name in commands(modules[0][1]):
+            medians = []
+            for _, pigpio in modules:
+                run = commands(pigpio)[name]
+                medians.append(statistics.median(
+                    time_command(pigpio, run, args.count, args.chunk)
+                    for _ in range(args.repeat)))
+            print("{:>16} {:>12.2f} {:>12.2f}".format(name, *medians))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+"""Time PiHardwarePWM frequency writes through the pigpio socket protocol.
+
+Runs against the in-process fake pigpiod, so it works on any Linux box;
+use --latency/--jitter to model the network to a Pi:
+
+    python3 scripts/bench_pwm_io.py --latency 0.0005 --jitter 0.0002
+
+Each mode reports the time the setter blocks the caller, in microseconds.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plasma.pwm.pi_pwm import PiHardwarePWM  # noqa: E402
+from plasma.utils.fake_pigpiod import FakePigpiod  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def time_writes(pwm, count, deferred):
+    durations = []
+    for i in range(count):
+        start = time.perf_counter()
+        if deferred:
+            pwm.set_frequency_deferred(30000 + i % 100)
+        else:
+            pwm.frequency = 30000 + i % 100
+        durations.append((time.perf_counter() - start) * 1e6)
+    return sorted(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000,
+                        help="writes per mode (default: 2000)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="daemon reply latency in seconds (default: 0)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="spread of the latency in seconds (default: 0)")
+    args = parser.parse_args()
+
+    modes = [
+        ("synchronous", {}, False),
+        ("deferred", {}, True),
+        ("write-behind 100 Hz", {'write_behind_frequency': 100}, False),
+    ]
+    print("{:>20} {:>8} {:>8} {:>8} {:>8}".format(
+        "us/write", "p50", "p90", "p99", "max"))
+    with FakePigpiod(latency=args.latency, jitter=args.jitter,
+                     seed=0) as daemon:
+        for name, kwargs, deferred in modes:
+            pwm = PiHardwarePWM(18, daemon.host, daemon.port, **kwargs)
+            pwm.frequency = 30000
+            pwm.start()
+            durations = time_writes(pwm, args.count, deferred)
+            pwm.close()
+            print("{:>20} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+                name, percentile(durations, 0.5),
+                percentile(durations, 0.9), percentile(durations, 0.99),
+                durations[-1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
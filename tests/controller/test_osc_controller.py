@@ -0,0 +1,106 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from plasma.controller.osc_controller import OSCController
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.modulator.modulation_matrix import ModulationMatrix, ScoreLane
+from plasma.modulator.wavetable_modulator import WavetableModulator
+from plasma.pwm.mock_pwm import MockPWM
+
+
+class TestOSCFiles(unittest.TestCase):
+    """OSC messages may only name files in the file directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.realpath(directory.name)
+        with open(os.path.join(self.directory, 'ramp.txt'), 'w') as fp:
+            fp.write("-1\n0\n1\n")
+        with open(os.path.join(self.directory, 'song.txt'), 'w') as fp:
+            fp.write("0, 0\n1, 1\n")
+        pwm = MockPWM()
+        self.modulator = WavetableModulator(
+            pwm.set_frequency_deferred, 1, 100, 1000)
+        self.interrupter = SimpleInterrupter(pwm, 100, 1.0)
+        self.matrix = ModulationMatrix(pwm, self.interrupter)
+
+    def controller(self, file_directory=None):
+        return OSCController('127.0.0.1', 0, self.modulator,
+                             self.interrupter, file_directory=file_directory,
+                             modulation_matrix=self.matrix)
+
+    def set_waveforms(self, controller, *waveforms):
+        with mock.patch.object(self.modulator, 'set_waveform') as set_waveform:
+            for waveform in waveforms:
+                controller.set_pwm_fm_waveform('/pwm/fm/waveform', waveform)
+        return [args[0] for args, _ in set_waveform.call_args_list]
+
+    def test_waveform_files_in_the_file_directory(self):
+        controller = self.controller(self.directory)
+        self.assertEqual(
+            self.set_waveforms(controller, 'saw', 'ramp.txt'),
+            ['saw', os.path.join(self.directory, 'ramp.txt')])
+        controller.set_pwm_fm_waveform('/pwm/fm/waveform', 'ramp.txt')
+        self.assertEqual(list(self.modulator.table), [-1, 0, 1])
+
+    def test_waveform_files_outside_it_are_refused(self):
+        outside = os.path.join(os.path.dirname(self.directory), 'table.txt')
+        with self.assertLogs('plasma.controller.osc_controller', 'WARNING'):
+            self.assertEqual(self.set_waveforms(
+                self.controller(self.directory),
+                outside, '../table.txt', '.', 'sine'), ['sine'])
+
+    def test_no_waveform_files_without_a_file_directory(self):
+        with self.assertLogs('plasma.controller.osc_controller', 'WARNING'):
+            self.assertEqual(self.set_waveforms(
+                self.controller(), 'ramp.txt',
+                os.path.join(self.directory, 'ramp.txt'), 'square'),
+                ['square'])
+
+    def test_matrix_files(self):
+        controller = self.controller(self.directory)
+        controller.set_matrix_lfo('/pwm/matrix/lfo', 'lfo', 1.0, 'ramp.txt')
+        controller.set_matrix_score('/pwm/matrix/score', 'lane', 'song.txt')
+        self.assertEqual(sorted(self.matrix.sources), ['lane', 'lfo'])
+        self.assertIsInstance(self.matrix.sources['lane'], ScoreLane)
+
+    def test_matrix_files_outside_it_are_refused(self):
+        outside = os.path.join(os.path.dirname(self.directory), 'song.txt')
+        for file_directory in (self.directory, None):
+            controller = self.controller(file_directory)
+            with self.assertLogs('plasma.controller.osc_controller',
+                                 'WARNING'):
+                controller.set_matrix_lfo('/pwm/matrix/lfo', 'lfo', 1.0,
+                                          '../ramp.txt')
+                controller.set_matrix_score('/pwm/matrix/score', 'lane',
+                                            outside)
+            self.assertEqual(self.matrix.sources, {})
+        self.controller().set_matrix_score('/pwm/matrix/score', 'lane',
+                                           'song.txt')
+        self.assertEqual(self.matrix.sources, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import unittest
+
+from pythonosc import osc_server
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from plasma.controller.osc_controller import OSCController
+from plasma.controller.osc_dispatcher import (
+    CompiledDispatcher, pattern_to_regex)
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.pwm.mock_pwm import MockPWM
+
+
+def callbacks(dispatcher, address_pattern):
+    return [handler.callback
+            for handler in dispatcher.handlers_for_address(address_pattern)]
+
+
+def controller_dispatchers(dispatcher_classes, roots):
+    pwm = MockPWM()
+    interrupter = SimpleInterrupter(pwm, 100, 1.0)
+    controller = OSCController(
+        '127.0.0.1', 0,
+        CallbackModulator(pwm.set_frequency_deferred, 0, 1, 1000),
+        interrupter, address_roots=roots)
+    dispatchers = [dispatcher_class() for dispatcher_class in
+                   dispatcher_classes]
+    # Map the controller's addresses on each of the given dispatchers
+    for address, handlers in controller._get_dispatcher()._map.items():
+        for handler in handlers:
+            for dispatcher in dispatchers:
+                dispatcher.map(address, handler.callback, *handler.args)
+    return dispatchers
+
+
+class TestCompiledDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = CompiledDispatcher()
+        for address in ('/pwm/start', '/pwm/stop', '/pwm/fm/start',
+                        '/pwm/fm/stop', '/pwm/fm/frequency',
+                        '/pwm/duty-cycle', '/other/start'):
+            self.dispatcher.map(address, address)
+
+    def test_literal_addresses(self):
+        self.dispatcher.map('/pwm/start', 'again', 1, 2)
+        handlers = self.dispatcher.handlers_for_address('/pwm/start')
+        self.assertEqual([(h.callback, h.args) for h in handlers],
+                         [('/pwm/start', []), ('again', [1, 2])])
+        self.assertEqual(callbacks(self.dispatcher, '/pwm/fm'), [])
+
+    def test_patterns(self):
+        for pattern, expected in [
+                ('/pwm/fm/*', ['/pwm/fm/start', '/pwm/fm/stop',
+                               '/pwm/fm/frequency']),
+                ('/pwm/*', ['/pwm/start', '/pwm/stop', '/pwm/duty-cycle']),
+                ('/*/start', ['/pwm/start', '/other/start']),
+                ('/pwm/st??', ['/pwm/stop']),
+                ('/pwm/fm/[fs]t*', ['/pwm/fm/start', '/pwm/fm/stop']),
+                ('/pwm/[!f]*', ['/pwm/start', '/pwm/stop',
+                                '/pwm/duty-cycle']),
+                ('/pwm/fm/[a-f]*', ['/pwm/fm/frequency']),
+                ('/{pwm,other}/start', ['/pwm/start', '/other/start']),
+                ('/pwm/*/*', ['/pwm/fm/start', '/pwm/fm/stop',
+                              '/pwm/fm/frequency']),
+                ('/pwm/?', [])]:
+            self.assertEqual(callbacks(self.dispatcher, pattern), expected,
+                             msg=pattern)
+
+    def test_mapped_patterns(self):
+        self.dispatcher.map('/pwm/fm/*', 'any fm')
+        self.assertEqual(callbacks(self.dispatcher, '/pwm/fm/spread'),
+                         ['any fm'])
+        self.assertEqual(callbacks(self.dispatcher, '/pwm/fm/stop'),
+                         ['/pwm/fm/stop', 'any fm'])
+
+    def test_default_handler(self):
+        self.dispatcher.set_default_handler('default')
+        self.assertEqual(callbacks(self.dispatcher, '/nothing'), ['default'])
+        self.assertEqual(callbacks(self.dispatcher, '/pwm/start'),
+                         ['/pwm/start'])
+
+    def test_unclosed_brackets_are_literal(self):
+        self.assertEqual(pattern_to_regex('a[b'), r'a\[b')
+        self.assertEqual(pattern_to_regex('{a'), r'\{a')
+        self.assertEqual(pattern_to_regex('[]x]'), r'[\]x]')
+
+    def test_dispatches_packets(self):
+        received = []
+        dispatcher = CompiledDispatcher()
+        dispatcher.map('/a/b', lambda *args: received.append(args))
+        builder = OscMessageBuilder('/a/?')
+        builder.add_arg(1.5)
+        osc_server._call_handlers_for_packet(builder.build().dgram,
+                                             dispatcher)
+        self.assertEqual(received, [('/a/?', 1.5)])
+
+    def test_controller_addresses_as_pythonosc(self):
+        # The timing comparison is scripts/bench_osc_dispatch.py
+        roots = ['pwm', 'pwm/channel-01', 'pwm/channel-02']
+        pythonosc, compiled = controller_dispatchers(
+            (Dispatcher, CompiledDispatcher), roots)
+        for address in list(pythonosc._map) + ['/pwm/nothing']:
+            self.assertEqual(
+                sorted(map(id, callbacks(compiled, address))),
+                sorted(map(id, callbacks(pythonosc, address))),
+                msg=address)
+
+if __name__ == '__main__':
+    unittest.main()
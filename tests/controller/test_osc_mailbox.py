@@ -0,0 +1,182 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+from plasma.controller.osc_controller import OSCController
+from plasma.controller.osc_mailbox import Mailbox
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.modulator.modulation_matrix import ModulationMatrix
+from plasma.pwm.mock_pwm import MockPWM
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestMailbox(unittest.TestCase):
+
+    def setUp(self):
+        self.applied = []
+        self.mailbox = Mailbox(apply_frequency=20)
+        self.addCleanup(self.mailbox.close)
+        self.fader = self.mailbox.latest(self.record)
+        self.command = self.mailbox.ordered(self.record)
+
+    def record(self, osc_path, *args):
+        self.applied.append((osc_path,) + args)
+
+    def test_newest_value_in_its_place(self):
+        self.fader('/fader', 1)
+        self.command('/start')
+        self.fader('/fader', 2)
+        self.command('/stop')
+        self.command('/stop')
+        self.fader('/fader', 3)
+        self.mailbox.apply_waiting()
+        self.assertEqual(self.applied,
+                         [('/start',), ('/stop',), ('/stop',), ('/fader', 3)])
+        self.assertEqual(self.mailbox.counters, {
+            'received': 6, 'replaced': 2, 'applied': 4, 'applies': 1})
+
+    def test_applies_are_rate_limited(self):
+        self.mailbox.start()
+        start = time.monotonic()
+        while time.monotonic() - start < 0.2:
+            self.fader('/fader', time.monotonic())
+            time.sleep(0.001)
+        self.command('/stop')
+        self.mailbox.close()
+        # 20 Hz for 0.2 s, and the last apply on close
+        self.assertLessEqual(self.mailbox.counters['applies'], 7)
+        self.assertEqual(self.applied[-1], ('/stop',))
+        values = [args[1] for args in self.applied[:-1]]
+        self.assertEqual(values, sorted(values))
+
+    def test_failing_handler_is_logged(self):
+        self.mailbox.ordered(lambda osc_path: 1 / 0)('/fail')
+        self.command('/ok')
+        with self.assertLogs('plasma.controller.osc_mailbox', 'ERROR'):
+            self.mailbox.apply_waiting()
+        self.assertEqual(self.applied, [('/ok',)])
+
+    def test_invalid_apply_frequency(self):
+        with self.assertRaises(ValueError):
+            Mailbox(apply_frequency=0)
+
+
+class TestControllerMailbox(unittest.TestCase):
+
+    def controller(self, pwm):
+        interrupter = SimpleInterrupter(pwm, 100, 1.0)
+        return OSCController(
+            '127.0.0.1', 0,
+            CallbackModulator(pwm.set_frequency_deferred, 0, 1, 1000),
+            interrupter, fine_spread=100, apply_frequency=50,
+            address_roots=['pwm', 'pwm/channel-01'])
+
+    def test_continuous_controls_coalesce(self):
+        pwm = MockPWM()
+        pwm.frequency = 1000
+        pwm.stop()
+        controller = self.controller(pwm)
+        dispatcher = controller._get_dispatcher()
+
+        def send(address, *args):
+            for handler in dispatcher.handlers_for_address(address):
+                handler.callback(address, *args)
+
+        send('/pwm/start')
+        for value in (0.1, 0.2, 0.3):
+            send('/pwm/fine/value', value)
+        send('/pwm/channel-01/fine/value', 0.5)
+        send('/pwm/duty-cycle', 0.25)
+        self.assertTrue(pwm.is_stopped)
+        controller._mailbox.apply_waiting()
+        self.assertFalse(pwm.is_stopped)
+        self.assertEqual(pwm.frequency, 1050)
+        self.assertEqual(pwm.duty_cycle, 0.25)
+        self.assertEqual(controller._mailbox.counters['replaced'], 3)
+
+    def test_one_hardware_write_per_apply(self):
+        daemon = FakePigpiod().start()
+        self.addCleanup(daemon.close)
+        pwm = PiHardwarePWM(18, daemon.host, daemon.port)
+        self.addCleanup(pwm.pi.stop)
+        self.addCleanup(pwm.close)
+        pwm.frequency = 30000
+        pwm.start()
+        controller = self.controller(pwm)
+        dispatcher = controller._get_dispatcher()
+        handler, = dispatcher.handlers_for_address('/pwm/fine/value')
+        daemon.clear()
+        for i in range(50):
+            handler.callback('/pwm/fine/value', i / 100)
+        controller._mailbox.apply_waiting()
+        pwm.pi.check_deferred()  # wait for the replies
+        self.assertEqual(len(daemon.hardware_pwm_writes()), 1)
+        self.assertEqual(daemon.hardware_pwm(18)[0], 30049)
+
+    def test_stop_turns_off_a_running_matrix(self):
+        daemon = FakePigpiod().start()
+        self.addCleanup(daemon.close)
+        pwm = PiHardwarePWM(18, daemon.host, daemon.port)
+        self.addCleanup(pwm.pi.stop)
+        self.addCleanup(pwm.close)
+        pwm.frequency = 30000
+        interrupter = SimpleInterrupter(pwm, 100, 1.0)
+        matrix = ModulationMatrix(pwm, interrupter, update_frequency=200)
+        self.addCleanup(matrix.stop)
+        controller = OSCController(
+            '127.0.0.1', 0,
+            CallbackModulator(pwm.set_frequency_deferred, 0, 1, 1000),
+            interrupter, apply_frequency=50, modulation_matrix=matrix)
+        dispatcher = controller._get_dispatcher()
+
+        def send(address, *args):
+            for handler in dispatcher.handlers_for_address(address):
+                handler.callback(address, *args)
+            # No handler fails
+            with self.assertRaises(AssertionError), \
+                    self.assertLogs('plasma.controller.osc_mailbox', 'ERROR'):
+                controller._mailbox.apply_waiting()
+
+        send('/pwm/matrix/lfo', 'lfo', 20.0, 'square')
+        send('/pwm/matrix/route', 'lfo', 'pwm-frequency', 1000.0)
+        send('/pwm/matrix/start')
+        send('/pwm/start')
+        time.sleep(0.05)
+        pwm.pi.check_deferred()
+        self.assertIn(daemon.hardware_pwm(18)[0], (29000, 31000))
+
+        send('/pwm/matrix/clear')
+        pwm.pi.check_deferred()
+        self.assertEqual(daemon.hardware_pwm(18)[0], 30000)
+        send('/pwm/matrix/lfo', 'lfo', 20.0, 'square')
+        send('/pwm/matrix/route', 'lfo', 'pwm-frequency', 1000.0)
+        time.sleep(0.05)
+        send('/pwm/stop')
+        pwm.pi.check_deferred()
+        self.assertTrue(pwm.is_stopped)
+        self.assertTrue(matrix.is_stopped)
+        self.assertEqual(daemon.hardware_pwm(18)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import struct
+import unittest
+
+from pythonosc.osc_message import OscMessage, ParseError
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from plasma.controller.osc_parser import Message, parse_message
+from plasma.controller.osc_timetags import ntp_time
+
+
+def message(address, *args, **kwargs):
+    builder = OscMessageBuilder(address)
+    for arg in args:
+        builder.add_arg(arg, kwargs.get('arg_type'))
+    return builder.build().dgram
+
+
+def raw_message(address, type_tags, arguments=b''):
+    def padded(string):
+        string += b'\0'
+        return string + b'\0' * (-len(string) % 4)
+    return padded(address) + padded(type_tags) + arguments
+
+
+class TestParseMessage(unittest.TestCase):
+
+    def assertParsedAsPythonOSC(self, data):
+        parsed = parse_message(data)
+        expected = OscMessage(data)
+        self.assertEqual((parsed.address, parsed.params),
+                         (expected.address, expected.params))
+
+    def test_matches_pythonosc(self):
+        # The timing comparison is scripts/bench_osc_parse.py
+        for data in (
+                message('/pwm/start'),
+                message('/pwm/duty-cycle', 0.25),
+                message('/pwm/frequency', 30000),
+                message('/pwm/fm/waveform', 'sine'),
+                message('/a', 1, 2.5, 'three', b'four', True, False),
+                message('/a', 1.5, arg_type='d'),
+                message('/a', 0x11223344, arg_type='r'),
+                raw_message(b'/a', b',m', bytes([1, 0x90, 60, 127])),
+                raw_message(b'/a', b',i[fs[i]]T',
+                            struct.pack('>if', 1, 2.0) + b'x\0\0\0'
+                            + struct.pack('>i', 3)),
+                raw_message(b'/a', b',ix', struct.pack('>i', 7))):
+            with self.subTest(data=data):
+                self.assertParsedAsPythonOSC(data)
+
+    def test_message(self):
+        parsed = parse_message(message('/a', 1, 'b'))
+        self.assertEqual(parsed, Message('/a', [1, 'b']))
+        self.assertEqual(list(parsed), [1, 'b'])
+        with self.assertRaises(AttributeError):
+            parsed.extra = 1
+
+    def test_time_tags_are_ntp_integers(self):
+        timetag = ntp_time(1500000000.75)
+        parsed = parse_message(
+            raw_message(b'/a', b',t', struct.pack('>Q', timetag)))
+        self.assertEqual(parsed.params, [timetag])
+
+    def test_part_of_a_datagram(self):
+        data = message('/a', 1) + message('/b', 2.5, 'c')
+        start = len(message('/a', 1))
+        self.assertEqual(parse_message(data, 0, start), Message('/a', [1]))
+        self.assertEqual(parse_message(data, start),
+                         Message('/b', [2.5, 'c']))
+
+    def test_unpadded_final_float(self):
+        data = message('/a', 1, 0.5)[:-2]
+        self.assertEqual(parse_message(data).params, [1, 0.5])
+
+    def test_bad_messages(self):
+        data = message('/a', 1, 'bc', b'de')
+        for bad in (b'', b'\0\0\0\0', b'/a', message('/a', 1)[:-1],
+                    data[:-4], data[:-8], data[:-12],
+                    raw_message(b'/a', b',[i', struct.pack('>i', 1)),
+                    raw_message(b'/a', b',i]', struct.pack('>i', 1)),
+                    raw_message(b'/a', b',s', b'\xff\0\0\0'),
+                    raw_message(b'/a', b',b', struct.pack('>i', -1))):
+            with self.subTest(data=bad):
+                with self.assertRaises(ParseError):
+                    parse_message(bad)
+        # Within a part of a datagram, reading stops at its end
+        with self.assertRaises(ParseError):
+            parse_message(data + data, 0, len(data) - 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
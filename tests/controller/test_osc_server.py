@@ -0,0 +1,122 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import socket
+import threading
+import time
+import unittest
+
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from plasma.controller.osc_server import BatchedOSCUDPServer
+
+
+def message(address, *args):
+    builder = OscMessageBuilder(address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build().dgram
+
+
+class TestBatchedOSCUDPServer(unittest.TestCase):
+
+    def serve(self, dispatcher, **kwargs):
+        server = BatchedOSCUDPServer(('127.0.0.1', 0), dispatcher, **kwargs)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        sender.connect(server.server_address)
+        return server, sender
+
+    def wait_for(self, server, handled):
+        deadline = time.monotonic() + 5
+        while server.counters['handled'] < handled:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def check_order(self, workers):
+        received = {'/a': [], '/b': [], '/c': []}
+        dispatcher = Dispatcher()
+        for address, values in received.items():
+            dispatcher.map(address,
+                           lambda path, value: received[path].append(value))
+        server, sender = self.serve(dispatcher, workers=workers,
+                                    receive_buffer_size=1 << 20)
+        for i in range(300):
+            sender.send(message(sorted(received)[i % 3], i))
+        self.wait_for(server, 300)
+        for offset, address in enumerate(sorted(received)):
+            self.assertEqual(received[address], list(range(offset, 300, 3)))
+        counters = server.counters
+        self.assertEqual(counters['datagrams'], 300)
+        self.assertEqual(counters['bytes'], 300 * len(message('/a', 1)))
+        self.assertLessEqual(counters['batches'], 300)
+        self.assertEqual(counters['errors'], 0)
+        self.assertEqual(counters['queued'], 0)
+
+    def test_handles_in_order_on_the_receive_thread(self):
+        self.check_order(workers=0)
+
+    def test_handles_each_address_in_order_on_workers(self):
+        self.check_order(workers=3)
+
+    def test_bad_datagrams_and_handlers_are_counted(self):
+        dispatcher = Dispatcher()
+        dispatcher.map('/fail', lambda path: 1 / 0)
+        dispatcher.map('/ok', lambda path: None)
+        server, sender = self.serve(dispatcher, workers=2)
+        sender.send(b'not osc')
+        with self.assertLogs('plasma.controller.osc_server', 'ERROR'):
+            sender.send(message('/fail'))
+            sender.send(message('/ok'))
+            self.wait_for(server, 2)
+        counters = server.counters
+        self.assertEqual(counters['invalid'], 1)
+        self.assertEqual(counters['errors'], 1)
+        self.assertEqual(counters['datagrams'], 3)
+
+    def test_shutdown_stops_the_workers(self):
+        server, _ = self.serve(Dispatcher(), workers=2)
+        time.sleep(0.1)
+        self.assertEqual(len([t for t in threading.enumerate()
+                              if t.name.startswith('osc-worker')]), 2)
+        server.shutdown()
+        self.assertEqual([t for t in threading.enumerate()
+                          if t.name.startswith('osc-worker')], [])
+
+    def test_receive_buffer_size(self):
+        server = BatchedOSCUDPServer(('127.0.0.1', 0), Dispatcher(),
+                                     receive_buffer_size=32768)
+        self.addCleanup(server.server_close)
+        # Linux doubles the request
+        self.assertGreaterEqual(server.receive_buffer_size, 32768)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            BatchedOSCUDPServer(('127.0.0.1', 0), Dispatcher(), workers=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import socket
+import struct
+import threading
+import time
+import unittest
+
+import pytest
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from plasma.controller.osc_server import BatchedOSCUDPServer
+from plasma.controller.osc_timetags import (
+    IMMEDIATELY, TimetagScheduler, ntp_time, ntp_to_time, parse_bundle)
+
+
+def message(address, *args):
+    builder = OscMessageBuilder(address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build().dgram
+
+
+def bundle(timetag, *elements):
+    return b'#bundle\0' + struct.pack('>Q', timetag) + b''.join(
+        struct.pack('>i', len(element)) + element for element in elements)
+
+
+class TestTimetags(unittest.TestCase):
+
+    def test_ntp_time(self):
+        self.assertEqual(ntp_time(0.5), (2208988800 << 32) + (1 << 31))
+        now = time.time()
+        self.assertAlmostEqual(ntp_to_time(ntp_time(now)), now, places=6)
+        # After the NTP era rolls over into the sign bit
+        self.assertEqual(ntp_to_time(0xfffffffe80000000), 2085978494.5)
+
+    def test_parse_nested_bundles(self):
+        data = bundle(ntp_time(100.25), message('/a', 1),
+                      bundle(ntp_time(101.75), message('/b', 2.5)))
+        messages = [(ntp_to_time(t), m.address, m.params)
+                    for t, m in parse_bundle(data)]
+        self.assertEqual(messages, [(100.25, '/a', [1]),
+                                    (101.75, '/b', [2.5])])
+        with self.assertRaises(Exception):
+            parse_bundle(bundle(1, message('/a'))[:-2])
+
+
+class TestTimetagScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.dispatcher = Dispatcher()
+        self.dispatcher.map('/a', self.record)
+        self.dispatcher.map('/b', self.record, 'extra')
+        self.scheduler = TimetagScheduler(self.dispatcher, late_tolerance=0.5)
+        self.addCleanup(self.scheduler.close)
+        self.scheduler.start()
+
+    def record(self, address, *args):
+        self.received.append((time.time(), address) + args)
+
+    def wait_for(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.received) < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def test_immediate_messages_are_dispatched_inline(self):
+        self.scheduler.handle(message('/a', 1))
+        self.scheduler.handle(bundle(IMMEDIATELY, message('/b', 2)))
+        self.assertEqual([r[1:] for r in self.received],
+                         [('/a', 1), ('/b', ['extra'], 2)])
+        self.assertEqual(self.scheduler.stats['immediate'], 2)
+
+    @pytest.mark.flaky(reruns=3)
+    def test_future_messages_run_at_their_time_tags(self):
+        now = time.time()
+        start = time.perf_counter()
+        self.scheduler.handle(bundle(ntp_time(now + 0.2), message('/a', 2)))
+        self.scheduler.handle(bundle(ntp_time(now + 0.1), message('/a', 1)))
+        self.assertLess(time.perf_counter() - start, 0.05,
+                        msg="handle should not wait")
+        self.wait_for(2)
+        self.assertEqual([r[2] for r in self.received], [1, 2])
+        for (when, _, value), target in zip(self.received, (0.1, 0.2)):
+            self.assertAlmostEqual(when - now, target, delta=0.005)
+        stats = self.scheduler.stats
+        self.assertEqual(stats['scheduled'], 2)
+        self.assertEqual(stats['dispatched'], 2)
+        self.assertEqual(stats['pending'], 0)
+        self.assertLess(stats['max_lateness'], 0.005)
+
+    def test_late_messages(self):
+        now = time.time()
+        self.scheduler.handle(bundle(ntp_time(now - 0.1), message('/a', 1)))
+        self.scheduler.handle(bundle(ntp_time(now - 1), message('/a', 2)))
+        self.assertEqual([r[2] for r in self.received], [1])
+        stats = self.scheduler.stats
+        self.assertEqual((stats['late'], stats['dropped']), (2, 1))
+
+        scheduler = TimetagScheduler(self.dispatcher)
+        scheduler.handle(bundle(ntp_time(now - 10), message('/a', 3)))
+        self.assertEqual([r[2] for r in self.received], [1, 3])
+
+    def test_close_drops_waiting_messages(self):
+        self.scheduler.handle(
+            bundle(ntp_time(time.time() + 10), message('/a', 1)))
+        self.scheduler.close()
+        self.assertEqual(self.scheduler.stats['pending'], 0)
+        self.assertEqual(self.received, [])
+
+    def test_failing_handler_is_logged(self):
+        self.dispatcher.map('/fail', lambda address: 1 / 0)
+        timetag = ntp_time(time.time() + 0.05)
+        with self.assertLogs('plasma.controller.osc_timetags', 'ERROR'):
+            self.scheduler.handle(bundle(timetag, message('/fail')))
+            self.scheduler.handle(bundle(timetag, message('/a', 1)))
+            self.wait_for(1)
+        self.assertEqual(self.scheduler.stats['errors'], 1)
+
+
+class TestServerTimetags(unittest.TestCase):
+
+    @pytest.mark.flaky(reruns=3)
+    def test_server_threads_do_not_wait(self):
+        received = []
+        dispatcher = Dispatcher()
+        dispatcher.map('/a', lambda address, value: received.append(
+            (time.time(), value)))
+        server = BatchedOSCUDPServer(('127.0.0.1', 0), dispatcher)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+
+        due = time.time() + 0.2
+        sender.sendto(bundle(ntp_time(due), message('/a', 1)),
+                      server.server_address)
+        sender.sendto(message('/a', 2), server.server_address)
+        time.sleep(0.1)
+        self.assertEqual([value for _, value in received], [2])
+        time.sleep(0.2)
+        self.assertEqual([value for _, value in received], [2, 1])
+        self.assertAlmostEqual(received[1][0], due, delta=0.005)
+        self.assertEqual(server.timetag_stats['dispatched'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
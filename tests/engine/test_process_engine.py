@@ -0,0 +1,109 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+import pytest
+
+from plasma.engine.process_engine import EngineException, ProcessEngine
+from plasma.interrupter.base_interrupter import InterrupterException
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestProcessEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpiod().start()
+        self.addCleanup(self.daemon.close)
+        self.engine = ProcessEngine(
+            PiHardwarePWM, (18, self.daemon.host, self.daemon.port))
+        self.addCleanup(self.engine.close)
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.01)
+
+    def test_pwm_settings_reach_the_child(self):
+        pwm = self.engine.pwm
+        pwm.frequency = 30000
+        pwm.duty_cycle = 0.25
+        pwm.start()
+        self.assertFalse(pwm.is_stopped)
+        self.assertEqual(pwm.frequency, 30000)
+        self.wait_for(lambda: self.daemon.hardware_pwm(18) == (30000, 250000))
+        pwm.stop()
+        self.wait_for(lambda: self.daemon.hardware_pwm(18)[0] == 0)
+
+    @pytest.mark.flaky(reruns=3)
+    def test_interrupter_and_modulator_run_in_the_child(self):
+        self.engine.pwm.frequency = 30000
+        self.engine.pwm.start()
+        interrupter = self.engine.interrupter
+        interrupter.frequency = 50
+        interrupter.duty_cycle = 0.5
+        interrupter.start()
+        time.sleep(0.3)
+        interrupter.stop()
+        frequencies = [f for _, f, _ in self.daemon.hardware_pwm_history(18)]
+        self.assertGreater(frequencies.count(0), 10)
+
+        modulator = self.engine.modulator
+        modulator.center = 30000
+        modulator.spread = 1000
+        modulator.frequency = 5
+        self.engine.pwm.start()
+        modulator.start()
+        time.sleep(0.3)
+        modulator.stop()
+        frequencies = {f for _, f, _ in self.daemon.hardware_pwm_history(18)}
+        self.assertGreater(len(frequencies), 5)
+        self.assertLessEqual(max(frequencies), 31000)
+
+    def test_invalid_settings_raise_in_the_parent(self):
+        with self.assertRaises(InterrupterException):
+            self.engine.interrupter.duty_cycle = 1.5
+        with self.assertRaises(InterrupterException):
+            self.engine.interrupter.frequency = -1
+
+    def test_waveform(self):
+        self.engine.modulator.set_waveform('square')
+        with self.assertRaises(ModulatorException):
+            self.engine.modulator.set_waveform('/tmp/table.txt')
+
+    def test_close_stops_the_pwm(self):
+        self.engine.pwm.frequency = 30000
+        self.engine.pwm.start()
+        self.wait_for(lambda: self.daemon.hardware_pwm(18)[0] == 30000)
+        self.engine.close()
+        self.assertFalse(self.engine.is_alive)
+        self.assertEqual(self.daemon.hardware_pwm(18)[0], 0)
+
+    def test_failed_start(self):
+        with self.assertRaises(EngineException):
+            # Nothing listens on port 1
+            ProcessEngine(PiHardwarePWM, (18, self.daemon.host, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
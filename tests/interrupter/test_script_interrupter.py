@@ -0,0 +1,147 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+import pigpio
+import pytest
+
+from plasma.interrupter.base_interrupter import InterrupterException
+from plasma.interrupter.script_interrupter import ScriptInterrupter
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestScriptInterrupter(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpiod().start()
+        self.addCleanup(self.daemon.close)
+        self.pwm = PiHardwarePWM(18, self.daemon.host, self.daemon.port)
+        # pigpio's notify thread spins once the daemon hangs up
+        self.addCleanup(self.pwm.pi.stop)
+        self.addCleanup(self.pwm.close)
+        self.pwm.frequency = 30000
+        self.pwm.start()
+
+    def interrupter(self, frequency, duty_cycle=0.5) -> ScriptInterrupter:
+        interrupter = ScriptInterrupter(self.pwm, frequency, duty_cycle)
+        self.addCleanup(interrupter.close)
+        return interrupter
+
+    def frequencies_since(self, start):
+        return [f for t, f, d in self.daemon.hardware_pwm_history(18)
+                if t >= start]
+
+    def test_invalid_settings(self):
+        with self.assertRaises(InterrupterException):
+            self.interrupter(-1)
+        with self.assertRaises(InterrupterException):
+            self.interrupter(10, 1.5)
+
+    def test_phases_of_one_period(self):
+        interrupter = self.interrupter(100, 0.25)
+        self.assertEqual(interrupter._phase_microseconds(), [2500, 7500])
+        interrupter.duty_cycle = 0.0
+        self.assertEqual(interrupter._phase_microseconds(), [0, 10000])
+        interrupter.frequency = 0.1
+        interrupter.duty_cycle = 0.5
+        self.assertEqual(interrupter._phase_microseconds(),
+                         [1000000, 1000000])
+
+    @pytest.mark.flaky(reruns=3)
+    def test_script_toggles_the_pwm(self):
+        interrupter = self.interrupter(50)
+        start = time.monotonic()
+        interrupter.start()
+        self.assertFalse(interrupter.is_stopped)
+        time.sleep(0.2)
+        frequencies = self.frequencies_since(start)
+        # Ten periods, one on and one off edge each
+        self.assertGreaterEqual(len(frequencies), 12)
+        self.assertIn(30000, frequencies)
+        self.assertIn(0, frequencies)
+
+        interrupter.stop()
+        self.assertTrue(interrupter.is_stopped)
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+
+    @pytest.mark.flaky(reruns=3)
+    def test_pwm_changes_reach_the_script(self):
+        interrupter = self.interrupter(100)
+        interrupter.start()
+        self.pwm.frequency = 40000
+        self.pwm.duty_cycle = 0.25
+        start = time.monotonic()
+        time.sleep(0.05)
+        history = [(f, d) for t, f, d
+                   in self.daemon.hardware_pwm_history(18) if t >= start]
+        self.assertIn((40000, 250000), history)
+        self.assertIn((0, 250000), history)
+
+        # Stopping the PWM keeps the script from driving the output
+        self.pwm.stop()
+        start = time.monotonic()
+        time.sleep(0.05)
+        self.assertEqual(set(self.frequencies_since(start)), {0})
+
+    def test_steady_pwm_at_full_duty_cycle(self):
+        interrupter = self.interrupter(100)
+        interrupter.start()
+        interrupter.duty_cycle = 1.0
+        start = time.monotonic()
+        time.sleep(0.05)
+        self.assertEqual(self.frequencies_since(start), [])
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+
+    def test_script_is_stored_once_and_deleted_on_close(self):
+        interrupter = self.interrupter(100)
+        interrupter.start()
+        interrupter.stop()
+        interrupter.start()
+        interrupter.frequency = 200
+        interrupter.close()
+        commands = [c.cmd for c in self.daemon.commands]
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROC), 1)
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROCR), 2)
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROCD), 1)
+
+    def test_starts_within_a_batch(self):
+        interrupter = self.interrupter(100)
+        # As under the OSC mailbox, which batches each drain
+        with self.pwm.deferred():
+            interrupter.start()
+        self.pwm.pi.check_deferred()
+        self.assertFalse(interrupter.is_stopped)
+        commands = [c.cmd for c in self.daemon.commands]
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROCR), 1)
+
+    def test_failed_start_leaves_it_stopped(self):
+        interrupter = self.interrupter(100)
+        interrupter.close()
+        # Storing the script again returns data, so fails within a batch
+        with self.assertRaises(pigpio.error):
+            with self.pwm.deferred():
+                interrupter.start()
+        self.assertTrue(interrupter.is_stopped)
+
+
+if __name__ == '__main__':
+    unittest.main()
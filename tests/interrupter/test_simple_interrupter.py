@@ -0,0 +1,98 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+import pytest
+
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.pwm.mock_pwm import RecordingMockPWM
+from plasma.pwm.timeline import PWMTimeline
+
+
+class TestSimpleInterrupter(unittest.TestCase):
+
+    def setUp(self):
+        self.pwm = RecordingMockPWM(timeline=PWMTimeline(capacity=4096))
+        self.pwm.stop()
+        self.pwm.timeline.clear()
+
+    def interrupter(self, frequency, duty_cycle) -> SimpleInterrupter:
+        interrupter = SimpleInterrupter(self.pwm, frequency, duty_cycle)
+        self.addCleanup(interrupter.stop)
+        return interrupter
+
+    def on_edges(self):
+        rows = self.pwm.timeline.rows()
+        return [t * 1e-9 for (t, _, _, running), (_, _, _, was_running)
+                in zip(rows[1:], rows) if running and not was_running]
+
+    @pytest.mark.flaky(reruns=3)
+    def test_edges_follow_absolute_deadlines(self):
+        interrupter = self.interrupter(200, 0.25)
+        interrupter.start()
+        time.sleep(0.5)
+        interrupter.stop()
+        edges = self.on_edges()
+        self.assertGreater(len(edges), 90)
+        # Edges are never early, and lateness does not accumulate: the
+        # last edges are as close to the schedule as the first ones.
+        errors = [edge - edges[0] - n * 0.005 for n, edge in enumerate(edges)]
+        self.assertGreaterEqual(min(errors), -1e-4)
+        last_errors = sorted(errors[-20:])
+        self.assertLess(last_errors[len(last_errors) // 2], 1e-3)
+
+    @pytest.mark.flaky(reruns=3)
+    def test_steady_duty_cycle_parks_the_thread(self):
+        interrupter = self.interrupter(200, 1.0)
+        start_cpu = time.process_time()
+        interrupter.start()
+        time.sleep(0.3)
+        self.assertLess(time.process_time() - start_cpu, 0.05)
+        self.assertFalse(self.pwm.is_stopped)
+        self.assertEqual(len(self.pwm.timeline), 1)
+
+        interrupter.duty_cycle = 0.0
+        time.sleep(0.05)
+        self.assertTrue(self.pwm.is_stopped)
+        interrupter.duty_cycle = 0.5
+        time.sleep(0.05)
+        self.assertGreater(len(self.on_edges()), 3)
+        interrupter.stop()
+        self.assertTrue(interrupter.is_stopped)
+
+    def test_zero_frequency_leaves_pwm_on(self):
+        interrupter = self.interrupter(0, 0.5)
+        interrupter.start()
+        time.sleep(0.05)
+        self.assertFalse(self.pwm.is_stopped)
+        self.assertEqual(len(self.pwm.timeline), 1)
+
+    def test_stop_is_prompt_during_a_long_phase(self):
+        interrupter = self.interrupter(0.1, 0.5)
+        interrupter.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        interrupter.stop()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,13 +18,19 @@
 # along with the Cdf Plasma Controller.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import math
 import time
 import unittest
 from numbers import Real
 
 import pytest
 
-from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.callback_modulator import (
+    RENDER_CHUNK, CallbackModulator)
+
+
+_2PI = 2 * math.pi
 
 
 class TestCallbackModulator(unittest.TestCase):
@@ -108,6 +114,171 @@ class TestCallbackModulator(unittest.TestCase):
         self.assertGreater(max(callback_args_list), 0)
         self.assertGreaterEqual(min(callback_args_list), 0.0)
 
+    def test_repeats_are_suppressed_until_the_keepalive(self):
+        callback_args_list = []
+        modulator = CallbackModulator(
+            callback_args_list.append, center=10, frequency=0, spread=5,
+            keepalive=1.0)
+        for t in (0.0, 0.1, 0.5, 0.9, 1.0, 1.5):
+            modulator._do_callback(t)
+        self.assertEqual(callback_args_list, [10, 10])
+        self.assertEqual(modulator.emitted_count, 2)
+        self.assertEqual(modulator.suppressed_count, 4)
+
+    def test_dead_band(self):
+        callback_args_list = []
+        values = iter([100.0, 100.5, 101.0, 101.5, 99.0])
+        modulator = CallbackModulator(
+            callback_args_list.append, center=0, frequency=0, spread=0,
+            dead_band=1.0)
+        modulator._compute_callback_arg = lambda t: next(values)
+        for t in range(5):
+            modulator._do_callback(t * 0.01)
+        # Changes are measured from the last value passed on
+        self.assertEqual(callback_args_list, [100.0, 101.5, 99.0])
+
+        modulator = CallbackModulator(
+            callback_args_list.append, center=0, frequency=0, spread=0,
+            dead_band=lambda value: value / 100)
+        values = iter([100.0, 100.5, 101.0, 101.5])
+        modulator._compute_callback_arg = lambda t: next(values)
+        del callback_args_list[:]
+        for t in range(4):
+            modulator._do_callback(t * 0.01)
+        self.assertEqual(callback_args_list, [100.0, 101.5])
+
+    def test_start_sends_the_first_value(self):
+        callback_args_list = []
+        modulator = CallbackModulator(
+            callback_args_list.append, center=10, frequency=0, spread=5,
+            update_frequency=100)
+        for _ in range(2):
+            modulator.start()
+            time.sleep(0.05)
+            modulator.stop()
+        self.assertEqual(callback_args_list, [10, 10])
+        self.assertGreater(modulator.suppressed_count, 4)
+
+    def test_phase_is_precise_after_30_days(self):
+        callback_args_list = []
+        frequency = 37.3
+        modulator = CallbackModulator(
+            callback_args_list.append, center=0, frequency=frequency,
+            spread=1, waveform=lambda phase: phase, update_frequency=1000)
+        # 1 kHz updates on a monotonic clock that has run for 30 days
+        start = 30 * 24 * 3600.0
+        ticks = 5000
+        for tick in range(ticks + 1):
+            modulator._do_callback(start + tick / 1000)
+        expected = [_2PI * (tick * frequency / 1000 % 1.0)
+                    for tick in range(ticks + 1)]
+        self.assertEqual(len(callback_args_list), ticks + 1)
+        for value, phase in zip(callback_args_list, expected):
+            # Within a microradian, allowing for either side of the wrap
+            error = abs(value - phase) % _2PI
+            self.assertLess(min(error, _2PI - error), 1e-6)
+
+    def test_frequency_change_is_continuous(self):
+        callback_args_list = []
+        modulator = CallbackModulator(
+            callback_args_list.append, center=0, frequency=1, spread=1,
+            waveform=lambda phase: phase / _2PI)
+        modulator._do_callback(100.0)
+        modulator._do_callback(100.25)
+        modulator.frequency = 4
+        modulator._do_callback(100.3125)
+        # 0.25 cycles at 1 Hz, then 0.25 cycles at 4 Hz
+        self.assertEqual(callback_args_list, [0, 0.25, 0.5])
+
+
+class TestRenderAhead(unittest.TestCase):
+
+    def modulator(self, values):
+        # One cycle per second, sampled 100 times a second; the values are
+        # the phase in cycles
+        modulator = CallbackModulator(
+            values.append, center=0, frequency=1, spread=1,
+            waveform=lambda phase: phase / _2PI, update_frequency=100,
+            render_ahead=0.1, keepalive=0)
+        with modulator._lock:
+            modulator._render(modulator._render_slots)
+        return modulator
+
+    def test_late_updates_send_the_value_due(self):
+        values = []
+        modulator = self.modulator(values)
+        for deadline in (0.0, 0.01, 0.024, 0.03):
+            modulator._emit_rendered(deadline)
+        self.assertEqual([round(v, 9) for v in values],
+                         [0, 0.01, 0.02, 0.03])
+        self.assertEqual(modulator.underrun_count, 0)
+
+    def test_changes_re_render_from_the_next_update(self):
+        values = []
+        modulator = self.modulator(values)
+        modulator._emit_rendered(0.0)
+        modulator._emit_rendered(0.01)
+        modulator.frequency = 2
+        modulator._emit_rendered(0.02)
+        modulator.center = 1
+        modulator._emit_rendered(0.03)
+        self.assertEqual([round(v, 9) for v in values],
+                         [0, 0.01, 0.03, 1.05])
+
+    def test_underrun_renders_when_due(self):
+        values = []
+        modulator = self.modulator(values)
+        modulator._emit_rendered(0.0)
+        modulator._emit_rendered(0.5)
+        self.assertEqual([round(v, 9) for v in values], [0, 0.5])
+        self.assertEqual(modulator.underrun_count, 1)
+
+    def test_render_task_yields_between_chunks(self):
+        modulator = CallbackModulator(
+            lambda value: None, center=0, frequency=1, spread=1,
+            update_frequency=1000, render_ahead=0.1)
+        calls = 0
+        deadline = 0.0
+        while True:
+            before = time.perf_counter()
+            calls += 1
+            next_call = modulator._render_ahead_task(deadline)
+            if modulator._rendered_to == 100:
+                break
+            self.assertEqual(modulator._rendered_to, calls * RENDER_CHUNK)
+            self.assertGreaterEqual(next_call, before)
+            deadline = next_call
+        self.assertEqual(calls, math.ceil(100 / RENDER_CHUNK))
+        self.assertAlmostEqual(next_call, deadline + 0.05, delta=1e-9)
+
+    def test_negative_render_ahead_is_rejected(self):
+        with self.assertRaises(ModulatorException):
+            CallbackModulator(lambda value: None, frequency=1, spread=1,
+                              center=1, render_ahead=-1)
+
+    @pytest.mark.flaky(reruns=5)
+    def test_runs_on_the_scheduler(self):
+        values = []
+        modulator = CallbackModulator(
+            values.append, center=0, frequency=1, spread=1,
+            waveform=lambda phase: phase / _2PI, update_frequency=200,
+            render_ahead=0.05, keepalive=0)
+        modulator.start()
+        time.sleep(0.25)
+        modulator.stop()
+        count = len(values)
+        self.assertGreater(count, 30)
+        self.assertEqual(modulator.underrun_count, 0)
+        # The values are on the update grid, and a restart carries on from
+        # the last one
+        modulator.start()
+        time.sleep(0.05)
+        modulator.stop()
+        steps = [round(b - a, 9) for a, b in zip(values, values[1:])]
+        self.assertEqual(steps[count - 1], 0)
+        del steps[count - 1]
+        self.assertEqual(set(steps), {0.005})
+
 
 if __name__ == '__main__':
     unittest.main()
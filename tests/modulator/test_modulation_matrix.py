@@ -0,0 +1,191 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+from plasma.controller.osc_controller import OSCController
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.modulator.modulation_matrix import (
+    Envelope, LFO, ModulationMatrix, ScoreLane)
+from plasma.player.score import Score
+from plasma.pwm.mock_pwm import MockPWM
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestSources(unittest.TestCase):
+
+    def test_lfo(self):
+        lfo = LFO(1.0, waveform=[0, 1, 0, -1])
+        self.assertEqual([lfo.step(0.25) for _ in range(4)], [1, 0, -1, 0])
+        lfo.frequency = 0.5
+        self.assertEqual(lfo.step(0.25), 0.5)
+
+    def test_envelope(self):
+        envelope = Envelope(attack=0.2, decay=0.2, sustain=0.5, release=0.5)
+        self.assertEqual(envelope.step(0.1), 0)
+        envelope.gate(True)
+        levels = [envelope.step(0.1) for _ in range(5)]
+        for level, expected in zip(levels, [0.5, 1, 0.75, 0.5, 0.5]):
+            self.assertAlmostEqual(level, expected)
+        envelope.gate(False)
+        self.assertAlmostEqual(envelope.step(0.25), 0.0)
+        with self.assertRaises(ModulatorException):
+            Envelope(0.1, 0.1, 2, 0.1)
+
+    def test_score_lane(self):
+        lane = ScoreLane(Score([(0.0, 0.0), (1.0, 1.0)], loop=False))
+        self.assertEqual(lane.step(0.5), 0.5)
+        self.assertEqual(lane.step(1.0), 1.0)
+
+
+class TestModulationMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.pwm = MockPWM()
+        self.pwm.frequency = 1000
+        self.pwm.duty_cycle = 0.5
+        self.interrupter = SimpleInterrupter(self.pwm, 100, 0.5)
+        self.matrix = ModulationMatrix(self.pwm, self.interrupter,
+                                       update_frequency=4)
+        self.addCleanup(self.matrix.stop)
+        self.matrix.add_source('lfo', LFO(1.0, waveform=[0, 1, 0, -1]))
+        self.deadline = 0.0
+
+    def tick(self, count=1):
+        for _ in range(count):
+            self.deadline += 1.0 / self.matrix.update_frequency
+            self.matrix._tick(self.deadline)
+
+    def test_add_and_multiply(self):
+        self.matrix.route('lfo', 'pwm-frequency', 100)
+        self.matrix.route('lfo', 'interrupter-frequency', 0.5,
+                          mode='multiply')
+        self.tick()
+        self.assertEqual(self.pwm.frequency, 1100)
+        self.assertEqual(self.interrupter.frequency, 150)
+        self.tick(2)
+        self.assertEqual(self.pwm.frequency, 900)
+        self.assertEqual(self.interrupter.frequency, 50)
+
+    def test_targets_are_clamped(self):
+        self.matrix.route('lfo', 'pwm-duty-cycle', 2)
+        self.tick()
+        self.assertEqual(self.pwm.duty_cycle, 1)
+        self.tick(2)
+        self.assertEqual(self.pwm.duty_cycle, 0)
+
+    def test_settings_from_elsewhere_become_the_base(self):
+        self.matrix.route('lfo', 'pwm-frequency', 100)
+        self.tick()
+        self.assertEqual(self.pwm.frequency, 1100)
+        self.pwm.frequency = 2000
+        self.tick()
+        self.assertEqual(self.pwm.frequency, 2000)
+        self.tick()
+        self.assertEqual(self.pwm.frequency, 1900)
+
+    def test_bases_are_restored(self):
+        self.matrix.route('lfo', 'pwm-frequency', 100)
+        self.matrix.route('lfo', 'interrupter-duty-cycle', 0.25)
+        self.tick()
+        self.matrix.unroute('lfo', 'pwm-frequency')
+        self.assertEqual(self.pwm.frequency, 1000)
+        self.assertEqual(self.interrupter.duty_cycle, 0.75)
+        self.matrix.remove_source('lfo')
+        self.assertEqual(self.interrupter.duty_cycle, 0.5)
+        self.assertEqual(self.matrix.routes, {})
+
+    def test_invalid_routes(self):
+        with self.assertRaises(ModulatorException):
+            self.matrix.route('lfo', 'pwm-phase', 1)
+        with self.assertRaises(ModulatorException):
+            self.matrix.route('lfo', 'pwm-frequency', 1, mode='divide')
+        with self.assertRaises(ModulatorException):
+            self.matrix.route('nothing', 'pwm-frequency', 1)
+        with self.assertRaises(ModulatorException):
+            self.matrix.gate('lfo', True)
+        matrix = ModulationMatrix(self.pwm)
+        matrix.add_source('lfo', LFO(1.0))
+        with self.assertRaises(ModulatorException):
+            matrix.route('lfo', 'interrupter-frequency', 1)
+
+    def test_runs_on_the_scheduler(self):
+        self.matrix.route('lfo', 'pwm-frequency', 100)
+        self.matrix.start()
+        time.sleep(0.6)
+        self.assertNotEqual(self.pwm.frequency, 1000)
+        self.matrix.stop()
+        self.assertTrue(self.matrix.is_stopped)
+        self.assertEqual(self.pwm.frequency, 1000)
+
+
+class TestBatchedWrites(unittest.TestCase):
+
+    def test_one_hardware_write_per_tick(self):
+        daemon = FakePigpiod().start()
+        self.addCleanup(daemon.close)
+        pwm = PiHardwarePWM(18, daemon.host, daemon.port)
+        self.addCleanup(pwm.pi.stop)
+        self.addCleanup(pwm.close)
+        pwm.frequency = 30000
+        pwm.start()
+        matrix = ModulationMatrix(pwm, update_frequency=4)
+        matrix.add_source('a', LFO(1.0, waveform=[0, 1, 0, -1]))
+        matrix.add_source('b', LFO(1.0, waveform=[1, 0, -1, 0]))
+        matrix.route('a', 'pwm-frequency', 1000)
+        matrix.route('b', 'pwm-duty-cycle', 0.25)
+        daemon.clear()
+        matrix._tick(0.0)
+        pwm.pi.check_deferred()  # wait for the replies
+        self.assertEqual(daemon.hardware_pwm(18), (31000, 500000))
+        self.assertEqual(len(daemon.hardware_pwm_writes()), 1)
+
+
+class TestMatrixOverOSC(unittest.TestCase):
+
+    def test_commands(self):
+        pwm = MockPWM()
+        interrupter = SimpleInterrupter(pwm, 100, 1.0)
+        matrix = ModulationMatrix(pwm, interrupter)
+        controller = OSCController(
+            '127.0.0.1', 0,
+            CallbackModulator(pwm.set_frequency_deferred, 0, 1, 1000),
+            interrupter, modulation_matrix=matrix)
+        controller.set_matrix_lfo('/pwm/matrix/lfo', 'wobble', 2.0, 'saw')
+        controller.set_matrix_envelope(
+            '/pwm/matrix/envelope', 'swell', 1, 1, 0.5, 1)
+        controller.set_matrix_route(
+            '/pwm/matrix/route', 'wobble', 'pwm-frequency', 50.0)
+        self.assertEqual(matrix.routes,
+                         {('wobble', 'pwm-frequency'): (50.0, 'add')})
+        with self.assertLogs('plasma.controller.osc_controller', 'WARNING'):
+            controller.set_matrix_route(
+                '/pwm/matrix/route', 'wobble', 'pwm-phase', 50.0)
+        with self.assertLogs('plasma.controller.osc_controller', 'WARNING'):
+            controller.set_matrix_lfo('/pwm/matrix/lfo', 'missing-args')
+        controller.set_matrix_clear('/pwm/matrix/clear')
+        self.assertEqual(matrix.sources, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import math
+import time
+import unittest
+
+import pigpio
+import pytest
+
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.script_modulator import ScriptModulator
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestScriptModulator(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpiod().start()
+        self.addCleanup(self.daemon.close)
+        self.pwm = PiHardwarePWM(18, self.daemon.host, self.daemon.port)
+        # pigpio's notify thread spins once the daemon hangs up
+        self.addCleanup(self.pwm.pi.stop)
+        self.addCleanup(self.pwm.close)
+        self.pwm.frequency = 30000
+        self.pwm.start()
+
+    def modulator(self, **kwargs) -> ScriptModulator:
+        settings = dict(frequency=50, spread=1000, center=30000, steps=4)
+        settings.update(kwargs)
+        modulator = ScriptModulator(self.pwm, **settings)
+        self.addCleanup(modulator.close)
+        return modulator
+
+    def frequencies_during(self, seconds):
+        start = time.monotonic()
+        time.sleep(seconds)
+        return [f for t, f, d in self.daemon.hardware_pwm_history(18)
+                if t >= start]
+
+    def test_table_and_parameters(self):
+        modulator = self.modulator(frequency=10)
+        self.assertEqual(modulator._table, [0, 1000, 0, -1000])
+        self.assertEqual(modulator._script_params(), [25000, 30000, 1000])
+        self.assertEqual(modulator.update_frequency, 40)
+        modulator = self.modulator(waveform=math.cos)
+        self.assertEqual(modulator._table, [1000, 0, -1000, 0])
+        with self.assertRaises(ModulatorException):
+            self.modulator(steps=0)
+
+    @pytest.mark.flaky(reruns=3)
+    def test_script_steps_through_the_table(self):
+        modulator = self.modulator()
+        modulator.start()
+        frequencies = self.frequencies_during(0.1)
+        self.assertGreaterEqual(len(frequencies), 10)
+        self.assertEqual(set(frequencies), {29000, 30000, 31000})
+
+        modulator.stop()
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+        self.assertEqual(self.frequencies_during(0.02), [])
+
+    @pytest.mark.flaky(reruns=3)
+    def test_changes_only_update_parameters(self):
+        modulator = self.modulator()
+        modulator.start()
+        modulator.center = 40000
+        modulator.spread = 2000
+        modulator.frequency = 100
+        self.assertEqual(set(self.frequencies_during(0.05)),
+                         {38000, 40000, 42000})
+        commands = [c.cmd for c in self.daemon.commands]
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROC), 1)
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROCR), 1)
+
+    @pytest.mark.flaky(reruns=3)
+    def test_output_is_off_while_pwm_is_stopped(self):
+        modulator = self.modulator(center=500)
+        modulator.start()
+        # The negative half of the waveform is clipped to off
+        self.assertEqual(set(self.frequencies_during(0.1)), {0, 500, 1500})
+        self.pwm.stop()
+        self.assertEqual(set(self.frequencies_during(0.05)), {0})
+
+    def test_zero_frequency_leaves_steady_pwm(self):
+        modulator = self.modulator(frequency=0)
+        modulator.start()
+        self.assertFalse(modulator.is_stopped)
+        self.assertEqual(self.frequencies_during(0.02), [])
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+
+    def test_starts_within_a_batch(self):
+        modulator = self.modulator()
+        # As under the OSC mailbox, which batches each drain
+        with self.pwm.deferred():
+            modulator.start()
+        self.pwm.pi.check_deferred()
+        self.assertFalse(modulator.is_stopped)
+        commands = [c.cmd for c in self.daemon.commands]
+        self.assertEqual(commands.count(pigpio._PI_CMD_PROCR), 1)
+
+    def test_failed_start_leaves_it_stopped(self):
+        modulator = self.modulator()
+        modulator.close()
+        # Storing the script again returns data, so fails within a batch
+        with self.assertRaises(pigpio.error):
+            with self.pwm.deferred():
+                modulator.start()
+        self.assertTrue(modulator.is_stopped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import math
+import os
+import tempfile
+import time
+import unittest
+
+from plasma.modulator.base_modulator import ModulatorException
+from plasma.modulator.callback_modulator import CallbackModulator
+from plasma.modulator.wavetable_modulator import (
+    WAVEFORMS, WavetableModulator, get_table, load_table,
+    smoothed_random_table, table_function)
+
+
+class TestTables(unittest.TestCase):
+
+    def test_builtin_tables(self):
+        for name, make_table in WAVEFORMS.items():
+            table = make_table(64)
+            self.assertEqual(len(table), 64, name)
+            self.assertLessEqual(max(table), 1, name)
+            self.assertGreaterEqual(min(table), -1, name)
+        self.assertEqual(list(WAVEFORMS['triangle'](8)),
+                         [0, 0.5, 1, 0.5, 0, -0.5, -1, -0.5])
+        self.assertEqual(list(WAVEFORMS['saw'](4)), [-1, -0.5, 0, 0.5])
+        self.assertEqual(list(WAVEFORMS['square'](4)), [1, 1, -1, -1])
+
+    def test_smoothed_random_table_is_smooth(self):
+        table = smoothed_random_table(1024, points=8, seed=1)
+        self.assertEqual(table, smoothed_random_table(1024, points=8, seed=1))
+        steps = [abs(b - a) for a, b in zip(table, table[1:] + table[:1])]
+        self.assertLess(max(steps), 0.02)
+
+    def test_load_table(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt',
+                                         delete=False) as fp:
+            fp.write("# ramp\n0, 0.5\n1 -1\n")
+        self.addCleanup(os.remove, fp.name)
+        self.assertEqual(list(load_table(fp.name)), [0, 0.5, 1, -1])
+        self.assertEqual(list(get_table(fp.name)), [0, 0.5, 1, -1])
+
+    def test_invalid_tables(self):
+        with self.assertRaises(ModulatorException):
+            get_table([0.5])
+        with self.assertRaises(ModulatorException):
+            get_table([0, 2])
+        with self.assertRaises(ModulatorException):
+            get_table('no-such-waveform')
+
+    def test_table_function(self):
+        waveform = table_function([0, 1, 0, -1])
+        self.assertEqual(waveform(0), 0)
+        self.assertEqual(waveform(math.pi / 4), 0.5)
+        self.assertEqual(waveform(-math.pi / 2), -1)
+
+
+class TestWavetableModulator(unittest.TestCase):
+
+    def modulator(self, waveform=(0, 1, 0, -1), frequency=1.0):
+        return WavetableModulator(
+            lambda value: None, frequency=frequency, spread=10, center=100,
+            waveform=waveform)
+
+    def test_interpolates_the_table(self):
+        modulator = self.modulator()
+        values = [modulator._compute_callback_arg(t)
+                  for t in (0.0, 0.125, 0.25, 0.5, 0.875, 1.0)]
+        self.assertEqual(values, [100, 105, 110, 100, 95, 100])
+
+    def test_frequency_change_is_continuous(self):
+        modulator = self.modulator(frequency=1.0)
+        self.assertEqual(modulator._compute_callback_arg(10.0), 100)
+        self.assertEqual(modulator._compute_callback_arg(10.125), 105)
+        modulator.frequency = 2.0
+        # Only the time since the last update runs at the new frequency
+        self.assertEqual(modulator._compute_callback_arg(10.1875), 110)
+
+    def test_waveform_can_be_changed(self):
+        modulator = self.modulator(waveform='sine')
+        self.assertEqual(modulator.waveform, 'sine')
+        modulator.set_waveform('square')
+        self.assertEqual(modulator.waveform, 'square')
+        self.assertEqual(modulator._compute_callback_arg(0.0), 110)
+        modulator.waveform = [0, 0.5]
+        self.assertIsNone(modulator.waveform)
+        with self.assertRaises(ModulatorException):
+            modulator.set_waveform('bogus')
+        self.assertEqual(list(modulator.table), [0, 0.5])
+
+    def test_callback_modulator_has_a_fixed_waveform(self):
+        modulator = CallbackModulator(
+            lambda value: None, frequency=1, spread=1, center=1)
+        with self.assertRaises(ModulatorException):
+            modulator.set_waveform('square')
+
+    def test_runs_on_the_scheduler(self):
+        values = []
+        modulator = WavetableModulator(
+            values.append, frequency=10, spread=5, center=100,
+            update_frequency=200, waveform='triangle')
+        modulator.start()
+        time.sleep(0.2)
+        modulator.stop()
+        self.assertGreater(len(values), 20)
+        self.assertLessEqual(max(values), 105)
+        self.assertGreaterEqual(min(values), 95)
+        self.assertGreater(max(values) - min(values), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import socket
+
+import pytest
+
+import pigpio
+
+
+@pytest.fixture
+def link():
+    """A pigpio `_socklock` connected to the other end of a socket pair"""
+    ours, theirs = socket.socketpair()
+    sl = pigpio._socklock()
+    sl.s = ours
+    yield sl, theirs
+    ours.close()
+    theirs.close()
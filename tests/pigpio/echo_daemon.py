@@ -0,0 +1,59 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import struct
+import threading
+
+
+class EchoDaemon(threading.Thread):
+    """Answers pigpio commands on one end of a socket pair.
+
+    Each reply echoes the command, with the status taken from `statuses`
+    (keyed on p1) or 0.
+    """
+
+    def __init__(self, sock, statuses=None):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.statuses = statuses or {}
+        self.commands = []
+        self.extensions = []
+        self.start()
+
+    def run(self):
+        buf = b''
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data
+            while len(buf) >= 16:
+                cmd, p1, p2, p3 = struct.unpack('IIII', buf[:16])
+                if len(buf) < 16 + p3:
+                    break
+                self.extensions.append(bytes(buf[16:16 + p3]))
+                buf = buf[16 + p3:]
+                self.commands.append((cmd, p1, p2))
+                status = self.statuses.get(p1, 0)
+                self.sock.sendall(
+                    struct.pack('IIIi', cmd, p1, p2, status))
@@ -0,0 +1,126 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import struct
+import threading
+import unittest
+
+import pytest
+
+import pigpio
+
+from .echo_daemon import EchoDaemon
+
+
+class TestBatch(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def _link(self, link):
+        self.sl, self.theirs = link
+
+    def test_batch_sends_once_and_collects_results(self):
+        daemon = EchoDaemon(self.theirs, statuses={13: pigpio.PI_BAD_GPIO})
+        b = pigpio._batch(self.sl)
+        with self.assertRaises(pigpio.error):
+            with b:
+                for gpio in (12, 13, 18):
+                    self.assertEqual(pigpio._pigpio_command(
+                        self.sl, pigpio._PI_CMD_WRITE, gpio, 1), 0)
+        self.assertEqual(daemon.commands,
+                         [(pigpio._PI_CMD_WRITE, gpio, 1)
+                          for gpio in (12, 13, 18)])
+        self.assertEqual(b.results, [0, pigpio.PI_BAD_GPIO, 0])
+        self.assertEqual(
+            b.errors, [(pigpio._PI_CMD_WRITE, 13, 1, pigpio.PI_BAD_GPIO)])
+
+    def test_batch_includes_extended_commands(self):
+        daemon = EchoDaemon(self.theirs)
+        with pigpio._batch(self.sl) as b:
+            pigpio._pigpio_command_ext(
+                self.sl, pigpio._PI_CMD_HP, 18, 30000, 4,
+                [struct.pack('I', 500000)])
+            pigpio._pigpio_command(
+                self.sl, pigpio._PI_CMD_MODES, 4, pigpio.INPUT)
+        self.assertEqual(b.results, [0, 0])
+        self.assertEqual([c[0] for c in daemon.commands],
+                         [pigpio._PI_CMD_HP, pigpio._PI_CMD_MODES])
+
+    def test_batch_is_per_thread(self):
+        EchoDaemon(self.theirs)
+        results = []
+        with pigpio._batch(self.sl) as b:
+            pigpio._pigpio_command(self.sl, pigpio._PI_CMD_WRITE, 4, 1)
+            other = threading.Thread(target=lambda: results.append(
+                pigpio._pigpio_command(self.sl, pigpio._PI_CMD_READ, 5, 0)))
+            other.start()
+            other.join()
+        self.assertEqual(results, [0])
+        self.assertEqual(len(b.results), 1)
+
+    def test_data_commands_cannot_be_batched(self):
+        EchoDaemon(self.theirs)
+        with self.assertRaises(pigpio.error):
+            with pigpio._batch(self.sl):
+                pigpio._pigpio_command_nolock(
+                    self.sl, pigpio._PI_CMD_PROCP, 0, 0)
+
+    def test_data_commands_are_refused_by_the_batch(self):
+        daemon = EchoDaemon(self.theirs)
+        with self.assertRaises(pigpio.error):
+            with pigpio._batch(self.sl):
+                pigpio._pigpio_command(self.sl, pigpio._PI_CMD_READ, 4, 0)
+        with self.assertRaises(pigpio.error):
+            with pigpio._batch(self.sl):
+                pigpio._pigpio_command(self.sl, pigpio._PI_CMD_TICK, 0, 0)
+        self.assertEqual(daemon.commands, [])
+
+    def test_queued_commands_are_sent_if_the_body_raises(self):
+        daemon = EchoDaemon(self.theirs, statuses={13: pigpio.PI_BAD_GPIO})
+        with self.assertRaises(KeyError):
+            with pigpio._batch(self.sl) as b:
+                pigpio._pigpio_command(self.sl, pigpio._PI_CMD_WRITE, 13, 1)
+                raise KeyError
+        self.assertEqual(daemon.commands, [(pigpio._PI_CMD_WRITE, 13, 1)])
+        self.assertEqual(b.results, [pigpio.PI_BAD_GPIO])
+
+    def test_deferred_errors_are_reported_later(self):
+        sl = self.sl
+        EchoDaemon(self.theirs, statuses={99: pigpio.PI_BAD_GPIO})
+        for gpio in (18, 99, 18):
+            with pigpio._batch(sl, wait=False):
+                pigpio._pigpio_command(sl, pigpio._PI_CMD_WRITE, gpio, 0)
+        self.assertEqual(len(sl.pending), 3)
+        # A synchronous command reads the outstanding replies first
+        self.assertEqual(
+            pigpio._pigpio_command(sl, pigpio._PI_CMD_READ, 4, 0), 0)
+        self.assertEqual(sl.pending, [])
+        self.assertEqual(
+            sl.deferred, [(pigpio._PI_CMD_WRITE, 99, 0, pigpio.PI_BAD_GPIO)])
+
+    def test_deferred_replies_are_bounded(self):
+        EchoDaemon(self.theirs)
+        for _ in range(3 * pigpio._MAX_DEFERRED):
+            with pigpio._batch(self.sl, wait=False):
+                pigpio._pigpio_command(self.sl, pigpio._PI_CMD_WRITE, 18, 0)
+            self.assertLess(len(self.sl.pending), pigpio._MAX_DEFERRED)
+
+
+if __name__ == '__main__':
+    unittest.main()
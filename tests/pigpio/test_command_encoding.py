@@ -0,0 +1,67 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import struct
+import unittest
+
+import pytest
+
+import pigpio
+
+from .echo_daemon import EchoDaemon
+
+
+class TestCommandEncoding(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def _link(self, link):
+        self.sl, self.theirs = link
+
+    def test_u32_command_matches_extended_command(self):
+        daemon = EchoDaemon(self.theirs)
+        pigpio._pigpio_command_u32(
+            self.sl, pigpio._PI_CMD_HP, 18, 30000, 500000)
+        pigpio._pigpio_command_ext(
+            self.sl, pigpio._PI_CMD_HP, 18, 30000, 4,
+            [struct.pack('I', 500000)])
+        self.assertEqual(daemon.commands,
+                         [(pigpio._PI_CMD_HP, 18, 30000)] * 2)
+        self.assertEqual(daemon.extensions,
+                         [struct.pack('I', 500000)] * 2)
+
+    def test_extended_command_buffer_grows(self):
+        daemon = EchoDaemon(self.theirs)
+        script = 'tag 0 ' + 'w 18 1 mics 10 w 18 0 mics 10 ' * 40 + 'jmp 0'
+        self.assertGreater(len(script), len(self.sl.ext))
+        for extents in ([script], [b'ab', 'cd']):
+            pigpio._pigpio_command_ext(
+                self.sl, pigpio._PI_CMD_PROC, 0, 0,
+                sum(len(x) for x in extents), extents)
+        self.assertEqual(daemon.extensions,
+                         [script.encode('latin-1'), b'abcd'])
+
+    def test_replies_are_unsigned(self):
+        EchoDaemon(self.theirs, statuses={4: pigpio.PI_BAD_GPIO})
+        res = pigpio._pigpio_command(self.sl, pigpio._PI_CMD_READ, 4, 0)
+        self.assertEqual(pigpio.u2i(res), pigpio.PI_BAD_GPIO)
+
+
+if __name__ == '__main__':
+    unittest.main()
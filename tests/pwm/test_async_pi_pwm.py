@@ -0,0 +1,191 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+import struct
+import unittest
+
+import pigpio
+
+from plasma.pwm.async_pi_pwm import AsyncPiHardwarePWM
+from plasma.utils.async_pigpio import AsyncPi
+
+
+class FakeDaemon:
+    """Minimal asyncio pigpiod: replies 0 to everything and records it.
+
+    The second connection to send NOIB becomes the notification stream.
+    """
+
+    def __init__(self, write_delay=0.0):
+        self.commands = []
+        self.command_writer = None
+        self.notify_writer = None
+        self.write_delay = write_delay
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self._handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        if self.command_writer is None:
+            self.command_writer = writer
+        try:
+            while True:
+                cmd, p1, p2, p3 = struct.unpack(
+                    'IIII', await reader.readexactly(16))
+                ext = await reader.readexactly(p3) if p3 else b''
+                self.commands.append((cmd, p1, p2, ext))
+                if cmd == pigpio._PI_CMD_HP and self.write_delay:
+                    await asyncio.sleep(self.write_delay)
+                res = 0
+                if cmd == pigpio._PI_CMD_NOIB:
+                    self.notify_writer = writer
+                    res = 7
+                writer.write(struct.pack('IIII', cmd, p1, p2, res))
+        except asyncio.IncompleteReadError:
+            pass
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        # Let the handlers see their clients hang up
+        await asyncio.sleep(0.01)
+
+    def report(self, level, tick=0, seq=0):
+        self.notify_writer.write(struct.pack('HHII', seq, 0, tick, level))
+
+    def stray_reply(self):
+        self.command_writer.write(struct.pack('IIII', 0, 0, 0, 0))
+
+    def hardware_writes(self):
+        return [(p1, p2, struct.unpack('I', ext)[0])
+                for cmd, p1, p2, ext in self.commands
+                if cmd == pigpio._PI_CMD_HP]
+
+
+class TestAsyncPiHardwarePWM(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.daemon = FakeDaemon()
+        self.port = self.loop.run_until_complete(self.daemon.start())
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.daemon.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def connect(self) -> AsyncPiHardwarePWM:
+        return self.loop.run_until_complete(
+            AsyncPiHardwarePWM.connect(18, '127.0.0.1', self.port))
+
+    def test_setters_write_through_when_loop_is_idle(self):
+        pwm = self.connect()
+        pwm.frequency = 30000
+        pwm.start()
+        self.assertEqual(self.daemon.hardware_writes(),
+                         [(18, 0, 500000), (18, 30000, 500000)])
+        pwm.close()
+
+    def test_writes_in_flight_coalesce(self):
+        self.daemon.write_delay = 0.01
+        pwm = self.connect()
+        pwm.frequency = 1000
+        pwm.start()
+
+        async def burst():
+            for i in range(100):
+                pwm.frequency = 2000 + i
+                await asyncio.sleep(0)
+            pwm.duty_cycle = 0.25
+            await pwm.flush()
+
+        self.loop.run_until_complete(burst())
+        writes = self.daemon.hardware_writes()
+        self.assertLess(len(writes), 20)
+        self.assertEqual(writes[-1], (18, 2099, 250000))
+        self.loop.run_until_complete(pwm.aclose())
+
+    def test_start_and_stop_are_never_merged(self):
+        self.daemon.write_delay = 0.01
+        pwm = self.connect()
+        pwm.frequency = 1000
+
+        async def toggles():
+            for i in range(10):
+                pwm.frequency = 1000 + i
+                pwm.start()
+                pwm.stop()
+            await pwm.flush()
+
+        self.loop.run_until_complete(toggles())
+        on_off = [frequency for _, frequency, _ in
+                  self.daemon.hardware_writes()[1:]]
+        self.assertEqual(on_off, [1000 + i // 2 if i % 2 == 0 else 0
+                                  for i in range(20)])
+        self.loop.run_until_complete(pwm.aclose())
+
+    def test_edge_callbacks(self):
+        pi = self.loop.run_until_complete(
+            AsyncPi('127.0.0.1', self.port).connect())
+        edges = []
+
+        async def scenario():
+            await pi.set_mode(4, pigpio.INPUT)
+            await pi.set_glitch_filter(4, 5000)
+            cb = await pi.callback(4, pigpio.EITHER_EDGE,
+                                   lambda *args: edges.append(args))
+            self.daemon.report(0, tick=10)
+            self.daemon.report(1 << 4, tick=20)
+            self.daemon.report(1 << 4 | 1 << 5, tick=30)
+            self.daemon.report(0, tick=40)
+            await asyncio.sleep(0.05)
+            await cb.cancel()
+            await pi.close()
+
+        self.loop.run_until_complete(scenario())
+        self.assertEqual(edges, [(4, 1, 20), (4, 0, 40)])
+        monitors = [c[2] for c in self.daemon.commands
+                    if c[0] == pigpio._PI_CMD_NB]
+        self.assertEqual(monitors, [1 << 4, 0])
+
+    def test_stray_reply_fails_the_connection(self):
+        pi = self.loop.run_until_complete(
+            AsyncPi('127.0.0.1', self.port).connect())
+
+        async def scenario():
+            await pi.set_mode(4, pigpio.INPUT)
+            with self.assertLogs('plasma.utils.async_pigpio', 'ERROR'):
+                self.daemon.stray_reply()
+                await asyncio.sleep(0.05)
+            self.assertFalse(pi.connected)
+            with self.assertRaises(pigpio.error):
+                await asyncio.wait_for(pi.set_mode(4, pigpio.OUTPUT), 1)
+            await pi.close()
+
+        self.loop.run_until_complete(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import unittest
+
+import pigpio
+
+from plasma.pwm.multi_channel_pwm import MultiChannelPWM
+from plasma.pwm.pi_pwm import PiPWMException
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class CountingSocket:
+    """Counts the writes made through a pigpio command socket"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.sends = 0
+
+    def sendall(self, data):
+        self.sends += 1
+        return self._sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TestMultiChannelPWM(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpiod().start()
+        self.addCleanup(self.daemon.close)
+
+    def pwm(self, gpio_pins=(18, 13)) -> MultiChannelPWM:
+        pwm = MultiChannelPWM(gpio_pins, self.daemon.host, self.daemon.port)
+        self.addCleanup(pwm.close)
+        return pwm
+
+    def hardware_writes(self):
+        return [w[1:] for w in self.daemon.hardware_pwm_writes()]
+
+    def test_channels_share_one_connection(self):
+        pwm = self.pwm()
+        self.assertEqual(len(pwm), 2)
+        pwm[0].frequency = 30000
+        pwm[0].start()
+        pwm[1].duty_cycle = 0.25
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+        self.assertEqual(self.daemon.hardware_pwm(13), (0, 250000))
+        self.assertEqual([c.gpio_pin for c in pwm], [18, 13])
+        self.assertFalse(pwm[0].is_stopped)
+        self.assertTrue(pwm[1].is_stopped)
+
+        pwm.close()
+        self.assertEqual(self.daemon.hardware_pwm(18), (0, 500000))
+        self.assertIsNone(pwm.pi)
+
+    def test_update_sends_one_batch(self):
+        pwm = self.pwm()
+        self.daemon.clear()
+        socket = CountingSocket(pwm.pi.sl.s)
+        pwm.pi.sl.s = socket
+        with pwm.update():
+            pwm[0].frequency = 29000
+            pwm[0].frequency = 30000
+            pwm[0].start()
+            pwm[1].frequency = 31000
+            pwm[1].start()
+        self.assertEqual(socket.sends, 1)
+        self.assertEqual(self.hardware_writes(), [
+            (18, 30000, 500000), (13, 31000, 500000)])
+
+    def test_update_raises_daemon_errors(self):
+        pwm = self.pwm()
+        with self.assertRaises(pigpio.error):
+            with pwm.update():
+                pwm[0].frequency = 30000
+                pwm[0].start()
+                pwm[1].duty_cycle = 0.25
+                # Not a valid hardware PWM frequency
+                pwm[1].frequency = 200000000
+                pwm[1].start()
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 500000))
+
+    def test_invalid_pins(self):
+        with self.assertRaises(PiPWMException):
+            self.pwm((18, 12))
+        with self.assertRaises(PiPWMException):
+            self.pwm((4,))
+
+
+if __name__ == '__main__':
+    unittest.main()
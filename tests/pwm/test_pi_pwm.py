@@ -0,0 +1,159 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+from contextlib import ExitStack
+from unittest import mock
+
+from plasma.interrupter.simple_interrupter import SimpleInterrupter
+from plasma.pwm import pi_pwm
+from plasma.pwm.pi_pwm import PiHardwarePWM, PiPWMException
+
+
+class FakePi:
+    """Records hardware_PWM calls in place of a pigpio.pi connection."""
+
+    def __init__(self, *_, **__):
+        self.connected = True
+        self.calls = []
+        self.threads = set()
+        self.write_seconds = 0.0
+
+    def hardware_PWM(self, gpio, frequency, duty):
+        self.threads.add(threading.current_thread().name)
+        if self.write_seconds:
+            time.sleep(self.write_seconds)
+        self.calls.append((gpio, frequency, duty))
+        return 0
+
+    def batch(self, wait=True):
+        return ExitStack()
+
+    def in_batch(self):
+        return False
+
+    def check_deferred(self, drain=True):
+        return []
+
+
+class TestPiHardwarePWM(unittest.TestCase):
+
+    def setUp(self):
+        self.pi = FakePi()
+        patcher = mock.patch.object(pi_pwm.pigpio, 'pi', return_value=self.pi)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_synchronous_writes_every_change(self):
+        pwm = PiHardwarePWM(18)
+        pwm.frequency = 1000
+        pwm.start()
+        pwm.frequency = 1000
+        pwm.duty_cycle = 0.25
+        self.assertEqual(self.pi.calls, [
+            (18, 0, 500000),
+            (18, 1000, 500000),
+            (18, 1000, 500000),
+            (18, 1000, 250000),
+        ])
+        self.assertEqual(self.pi.threads, {threading.current_thread().name})
+
+    def test_pwm_clock_skips_writes_that_change_nothing(self):
+        pwm = PiHardwarePWM(18, pwm_clock=250000000)
+        pwm.frequency = 30000
+        pwm.start()
+        # 250 MHz / 8333 steps for all of these
+        for frequency in (30000.4, 30001, 29999.7, 30002):
+            pwm.frequency = frequency
+        pwm.duty_cycle = 0.50001
+        self.assertEqual(self.pi.calls, [
+            (18, 0, 500000),
+            (18, 30001, 500061),
+        ])
+        self.assertAlmostEqual(pwm.hardware_output.frequency, 250e6 / 8333)
+        self.assertAlmostEqual(pwm.frequency_error, 250e6 / 8333 - 30002)
+        self.assertAlmostEqual(pwm.duty_cycle_error,
+                               4167 / 8333 - 0.50001)
+        pwm.stop()
+        self.assertEqual(self.pi.calls[-1][:2], (18, 0))
+
+    def test_negative_write_behind_frequency_is_rejected(self):
+        with self.assertRaises(PiPWMException):
+            PiHardwarePWM(18, write_behind_frequency=-50)
+
+    def test_write_behind_coalesces_to_latest_state(self):
+        self.pi.write_seconds = 0.01
+        pwm = PiHardwarePWM(18, write_behind_frequency=50)
+        pwm.frequency = 30000
+        pwm.start()
+        for i in range(200):
+            pwm.frequency = 30000 + i
+        pwm.duty_cycle = 0.4
+        pwm.close()
+
+        self.assertLess(len(self.pi.calls), 20)
+        self.assertEqual(self.pi.calls[-1], (18, 0, 400000))
+        self.assertIn((18, 30199, 400000), self.pi.calls)
+        self.assertIn("PiHardwarePWM-18", self.pi.threads)
+
+    def test_write_behind_skips_repeated_values(self):
+        pwm = PiHardwarePWM(18, write_behind_frequency=1000)
+        pwm.frequency = 500
+        pwm.start()
+        time.sleep(0.05)
+        written = len(self.pi.calls)
+        for _ in range(20):
+            pwm.frequency = 500
+            time.sleep(0.002)
+        self.assertEqual(len(self.pi.calls), written)
+        pwm.close()
+
+    def test_write_behind_setters_do_not_block(self):
+        pwm = PiHardwarePWM(18, write_behind_frequency=100)
+        pwm.frequency = 1000
+        pwm.start()
+        self.pi.write_seconds = 0.05
+        start = time.monotonic()
+        for i in range(100):
+            pwm.frequency = 1000 + i
+        self.assertLess(time.monotonic() - start, 0.05)
+        pwm.close()
+
+    def test_write_behind_never_merges_interrupter_edges(self):
+        pwm = PiHardwarePWM(18, write_behind_frequency=50)
+        pwm.frequency = 30000
+        interrupter = SimpleInterrupter(pwm, 200, 0.5)
+        interrupter.start()
+        for i in range(50):
+            pwm.frequency = 30000 + i
+            time.sleep(0.005)
+        interrupter.stop()
+        pwm.close()
+
+        is_on = [frequency > 0 for _, frequency, _ in self.pi.calls]
+        edges = sum(a != b for a, b in zip(is_on, is_on[1:]))
+        # About 100 edges in 0.25 s; the owner alone writes at most 13
+        self.assertGreater(edges, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import unittest
+
+from plasma.pwm.quantization import (
+    BCM2711_PWM_CLOCK, BCM2835_PWM_CLOCK, HardwareOutput,
+    HardwarePWMQuantizer)
+
+
+class TestHardwarePWMQuantizer(unittest.TestCase):
+
+    def setUp(self):
+        self.quantizer = HardwarePWMQuantizer(BCM2835_PWM_CLOCK)
+
+    def test_snaps_to_nearest_output(self):
+        # 250 MHz / 8333 steps, rather than 250 MHz / 8334
+        output = self.quantizer.quantize(30000, 0.5)
+        self.assertEqual(output.frequency_request, 30001)
+        self.assertAlmostEqual(output.frequency, 250e6 / 8333)
+        self.assertEqual(output.duty_cycle_request * 8333 // 1000000, 4167)
+        self.assertAlmostEqual(output.duty_cycle, 4167 / 8333)
+
+    def test_requests_with_the_same_output_are_equal(self):
+        outputs = {self.quantizer.quantize(f, 0.5)
+                   for f in (29999.7, 30000, 30000.4, 30001, 30002)}
+        self.assertEqual(len(outputs), 1)
+        output = outputs.pop()
+        self.assertEqual(
+            self.quantizer.quantize(output.frequency, output.duty_cycle),
+            output)
+
+    def test_request_is_what_pigpiod_would_produce(self):
+        for clock in (BCM2835_PWM_CLOCK, BCM2711_PWM_CLOCK):
+            quantizer = HardwarePWMQuantizer(clock)
+            for frequency in (1.4, 249.6, 1234.5, 83333333, 29351.2):
+                output = quantizer.quantize(frequency, 0.38)
+                steps_range = clock // output.frequency_request
+                self.assertAlmostEqual(output.frequency,
+                                       clock / steps_range)
+                self.assertEqual(
+                    output.duty_cycle_request * steps_range // 1000000,
+                    round(output.duty_cycle * steps_range))
+                self.assertAlmostEqual(output.duty_cycle, 0.38, delta=0.5)
+
+    def test_off(self):
+        self.assertEqual(self.quantizer.quantize(0, 0.25),
+                         HardwareOutput(0, 250000, 0.0, 0.25))
+
+    def test_achievable_frequencies(self):
+        table = self.quantizer.achievable_frequencies(29995, 30005)
+        self.assertEqual(table, [250e6 / 8334, 250e6 / 8333, 250e6 / 8332])
+        # Below ~16 kHz integer requests are coarser than the ranges
+        table = self.quantizer.achievable_frequencies(99.9, 101.1)
+        self.assertEqual(table, [100.0, 250e6 / (250e6 // 101)])
+        self.assertEqual(self.quantizer.achievable_frequencies(10, 5), [])
+
+    def test_resolution(self):
+        # 30 kHz is a range of 8333 steps
+        self.assertAlmostEqual(self.quantizer.resolution(30000),
+                               250e6 / 8333 - 250e6 / 8334)
+        self.assertLess(self.quantizer.resolution(1000),
+                        self.quantizer.resolution(30000))
+        self.assertEqual(self.quantizer.resolution(0), 0)
+
+    def test_invalid_clock(self):
+        with self.assertRaises(ValueError):
+            HardwarePWMQuantizer(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
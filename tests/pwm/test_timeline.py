@@ -0,0 +1,99 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import ast
+import csv
+import io
+import struct
+import unittest
+
+from plasma.pwm.mock_pwm import RecordingMockPWM
+from plasma.pwm.timeline import PWMTimeline
+
+
+class TestPWMTimeline(unittest.TestCase):
+
+    def test_ring_buffer_keeps_the_newest_rows(self):
+        timeline = PWMTimeline(capacity=3)
+        for frequency in range(5):
+            timeline.append(frequency, 0.5, frequency % 2 == 0)
+        self.assertEqual(len(timeline), 3)
+        self.assertEqual(timeline.dropped, 2)
+        rows = timeline.rows()
+        self.assertEqual([r[1:] for r in rows],
+                         [(2.0, 0.5, True), (3.0, 0.5, False),
+                          (4.0, 0.5, True)])
+        times = [r[0] for r in rows]
+        self.assertEqual(times, sorted(times))
+        timeline.clear()
+        self.assertEqual(timeline.rows(), [])
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(ValueError):
+            PWMTimeline(capacity=0)
+
+    def test_csv_export(self):
+        timeline = PWMTimeline(capacity=4)
+        timeline.append(30000.5, 0.25, True)
+        fp = io.StringIO()
+        timeline.write_csv(fp)
+        fp.seek(0)
+        header, row = list(csv.reader(fp))
+        self.assertEqual(tuple(header), PWMTimeline.FIELDS)
+        self.assertEqual(row[1:], ['30000.5', '0.25', '1'])
+
+    def test_npy_export(self):
+        timeline = PWMTimeline(capacity=4)
+        timeline.append(30000.5, 0.25, True)
+        timeline.append(0.0, 1.0, False)
+        fp = io.BytesIO()
+        timeline.write_npy(fp)
+        data = fp.getvalue()
+        self.assertEqual(data[:8], b'\x93NUMPY\x01\x00')
+        header_length, = struct.unpack('<H', data[8:10])
+        self.assertEqual((10 + header_length) % 64, 0)
+        header = ast.literal_eval(data[10:10 + header_length].decode())
+        self.assertEqual(header['shape'], (2,))
+        self.assertEqual([name for name, _ in header['descr']],
+                         list(PWMTimeline.FIELDS))
+        rows = list(struct.iter_unpack('<qdd?', data[10 + header_length:]))
+        self.assertEqual([r[1:] for r in rows],
+                         [(30000.5, 0.25, True), (0.0, 1.0, False)])
+
+
+class TestRecordingMockPWM(unittest.TestCase):
+
+    def test_commands_are_recorded(self):
+        pwm = RecordingMockPWM(18, timeline=PWMTimeline(capacity=8))
+        pwm.stop()
+        pwm.frequency = 30000
+        pwm.duty_cycle = 0.25
+        pwm.start()
+        pwm.set_frequency_deferred(31000)
+        self.assertEqual([r[1:] for r in pwm.timeline.rows()], [
+            (1.0, 0.5, False),
+            (30000.0, 0.5, False),
+            (30000.0, 0.25, False),
+            (30000.0, 0.25, True),
+            (31000.0, 0.25, True),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from plasma.pwm.timeline import PWMTimeline  # noqa: E402
+from plasma.pwm.timeline_analysis import (  # noqa: E402
+    analyze_interrupter, analyze_spectrum, analyze_steps, from_timeline,
+    load_timeline)
+
+
+def make_timeline(seconds, frequency, running):
+    timeline = np.zeros(len(seconds), dtype=[
+        ('time_ns', '<i8'), ('frequency', '<f8'), ('duty_cycle', '<f8'),
+        ('running', '?')])
+    timeline['time_ns'] = np.round(np.asarray(seconds) * 1e9)
+    timeline['frequency'] = frequency
+    timeline['duty_cycle'] = 0.5
+    timeline['running'] = running
+    return timeline
+
+
+class TestTimelineAnalysis(unittest.TestCase):
+
+    def test_interrupter_errors(self):
+        # 100 Hz, 25% duty cycle, every on edge 100 us late on odd cycles
+        on = np.arange(20) * 0.01 + np.tile([0.0, 1e-4], 10)
+        off = np.arange(20) * 0.01 + 0.0025
+        seconds = np.sort(np.concatenate([on, off]))
+        running = np.isin(seconds, on)
+        report = analyze_interrupter(
+            make_timeline(seconds, 30000, running), 100, 0.25)
+        # The first row has no edge before it
+        self.assertEqual(report.cycles, 18)
+        self.assertAlmostEqual(report.period_error.max, 1e-4)
+        self.assertAlmostEqual(report.period_error.p50, 1e-4)
+        self.assertAlmostEqual(report.duty_cycle_error.max,
+                               0.25 - 0.0024 / 0.0099)
+
+    def test_too_few_edges(self):
+        report = analyze_interrupter(
+            make_timeline([0.0, 1.0], 30000, [False, True]), 100, 0.5)
+        self.assertEqual(report.cycles, 0)
+
+    def test_step_jitter(self):
+        seconds = np.arange(41) / 40.0
+        seconds[10] += 0.002
+        frequency = np.arange(41) * 10.0
+        report = analyze_steps(make_timeline(seconds, frequency, True), 40)
+        self.assertEqual(report.steps, 40)
+        self.assertAlmostEqual(report.interval_error.max, 0.002)
+        self.assertAlmostEqual(report.interval_error.p50, 0.0)
+
+    def test_spectrum_of_stepped_sine(self):
+        # A 2 Hz, 500 Hz spread FM sampled at the default 40 updates/s
+        seconds = np.arange(400) / 40.0
+        frequency = 30000 + 500 * np.sin(2 * np.pi * 2 * seconds + 1.0)
+        report = analyze_spectrum(
+            make_timeline(seconds, frequency, True), 2, 500, 30000)
+        self.assertAlmostEqual(report.peak_frequency, 2.0, places=1)
+        self.assertAlmostEqual(report.amplitude, 500, delta=25)
+        self.assertAlmostEqual(report.ideal_amplitude, 500, delta=1)
+        self.assertLess(report.ideal_spurious_ratio, 1e-3)
+        # Holding each step adds images and a lag of half a step
+        self.assertGreater(report.spurious_ratio,
+                           report.ideal_spurious_ratio)
+        self.assertLess(report.rms_error, 100)
+
+    def test_spectrum_of_too_short_timelines(self):
+        for seconds in ([], [0.0], [0.0, 0.0005]):
+            with self.subTest(seconds=seconds):
+                report = analyze_spectrum(
+                    make_timeline(seconds, 30000, True), 2, 500, 30000)
+                self.assertTrue(all(np.isnan(report)))
+
+    def test_recorded_timeline_round_trip(self):
+        timeline = PWMTimeline(capacity=4)
+        timeline.append(30000, 0.5, True)
+        timeline.append(31000, 0.25, False)
+        array = from_timeline(timeline)
+        self.assertEqual(array['frequency'].tolist(), [30000, 31000])
+        self.assertEqual(array['running'].tolist(), [True, False])
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('timeline.npy', 'timeline.csv'):
+                path = os.path.join(directory, name)
+                timeline.save(path)
+                loaded = load_timeline(path)
+                self.assertEqual(loaded.tolist(), array.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
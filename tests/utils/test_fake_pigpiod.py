@@ -0,0 +1,137 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+
+import pigpio
+
+from plasma.player.button import ButtonWatcher
+from plasma.pwm.pi_pwm import PiHardwarePWM
+from plasma.utils.fake_pigpiod import FakePigpiod
+
+
+class TestFakePigpiod(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpiod().start()
+        self.addCleanup(self.daemon.close)
+
+    def pi(self) -> pigpio.pi:
+        pi = pigpio.pi(self.daemon.host, self.daemon.port)
+        self.assertTrue(pi.connected)
+        self.addCleanup(pi.stop)
+        return pi
+
+    def pwm(self, **kwargs) -> PiHardwarePWM:
+        pwm = PiHardwarePWM(18, self.daemon.host, self.daemon.port, **kwargs)
+        # pigpio's notify thread spins once the daemon hangs up
+        self.addCleanup(pwm.pi.stop)
+        self.addCleanup(pwm.close)
+        return pwm
+
+    def test_hardware_pwm_over_the_socket(self):
+        pwm = self.pwm()
+        pwm.frequency = 30000
+        pwm.duty_cycle = 0.25
+        pwm.start()
+        self.assertEqual(self.daemon.hardware_pwm(18), (30000, 250000))
+        pwm.stop()
+        self.assertEqual(self.daemon.hardware_pwm(18), (0, 250000))
+        writes = [w[1:] for w in self.daemon.hardware_pwm_writes()]
+        self.assertEqual(writes, [(18, 0, 500000), (18, 0, 250000),
+                                  (18, 30000, 250000), (18, 0, 250000)])
+
+    def test_errors_are_reported(self):
+        pi = self.pi()
+        with self.assertRaises(pigpio.error):
+            pi.hardware_PWM(5, 1000, 500000)
+        with pi.batch(wait=False):
+            pi.hardware_PWM(5, 1000, 500000)
+        self.assertEqual(pi.check_deferred(),
+                         [(pigpio._PI_CMD_HP, 5, 1000,
+                           pigpio.PI_NOT_HPWM_GPIO)])
+
+    def test_deferred_writes_join_an_open_batch(self):
+        pwm = self.pwm()
+        pwm.frequency = 30000
+        with pwm.deferred():
+            pwm.start()
+            with pwm.deferred():
+                pwm.frequency = 31000
+            self.assertTrue(pwm.pi.in_batch())
+            self.assertEqual(self.daemon.hardware_pwm(18), (0, 500000))
+        self.assertFalse(pwm.pi.in_batch())
+        pwm.pi.check_deferred()
+        self.assertEqual(self.daemon.hardware_pwm(18), (31000, 500000))
+
+    def test_write_behind_pwm_follows_latest_state(self):
+        pwm = self.pwm(write_behind_frequency=100)
+        pwm.frequency = 29000
+        pwm.start()
+        for frequency in range(30000, 30100):
+            pwm.frequency = frequency
+        pwm.close()
+        self.assertEqual(self.daemon.hardware_pwm(18), (0, 500000))
+        frequencies = [w[2] for w in self.daemon.hardware_pwm_writes()]
+        self.assertIn(30099, frequencies)
+        self.assertLess(len(frequencies), 50)
+
+    def test_latency_and_jitter_are_injected(self):
+        self.daemon.latency = 0.01
+        self.daemon.jitter = 0.005
+        pwm = self.pwm()
+        start = time.monotonic()
+        for frequency in range(1000, 1010):
+            pwm.frequency = frequency
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 10 * 0.005)
+        times = [w[0] for w in self.daemon.hardware_pwm_writes()]
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        self.assertGreaterEqual(min(gaps), 0.005)
+        self.assertGreater(max(gaps) - min(gaps), 0.0)
+
+    def test_button_edges_reach_the_watcher(self):
+        # Idle high, as left by the pull-up on a running Pi. pigpio.pi
+        # reads the levels once on connect and diffs reports against them.
+        self.daemon.set_level(4, 1)
+        events = []
+        long_pressed = threading.Event()
+        watcher = ButtonWatcher(
+            self.pi(), 4,
+            on_short_press=lambda: events.append('short'),
+            on_long_press=lambda: (events.append('long'),
+                                   long_pressed.set()),
+            on_press=lambda: events.append('press'),
+            hold_threshold_s=0.2)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        self.assertEqual(self.daemon.level(4), 1)
+
+        self.daemon.press(4, hold_seconds=0.02)
+        self.daemon.press(4, hold_seconds=0.3)
+        self.assertTrue(long_pressed.wait(1))
+        time.sleep(0.05)
+        self.assertEqual(events, ['press', 'short', 'press', 'long'])
+
+
+if __name__ == '__main__':
+    unittest.main()
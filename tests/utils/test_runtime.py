@@ -0,0 +1,87 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import os
+import unittest
+from unittest import mock
+
+from plasma.utils.runtime import (
+    REALTIME_MAX_SPIN, parse_cpu_list, set_thread_scheduling,
+    set_up_timing_thread)
+from plasma.utils.scheduler import Scheduler
+
+
+@unittest.skipUnless(hasattr(os, 'sched_getaffinity'),
+                     "needs Linux sched_* calls")
+class TestThreadScheduling(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.addCleanup(self.scheduler.close)
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("3"), {3})
+        self.assertEqual(parse_cpu_list("0, 2-4"), {0, 2, 3, 4})
+        self.assertIsNone(parse_cpu_list(""))
+
+    def test_pins_only_the_scheduler_thread(self):
+        main_cpus = os.sched_getaffinity(0)
+        cpu = min(main_cpus)
+        description = set_up_timing_thread(
+            {cpu}, scheduler=self.scheduler)
+        self.assertTrue(description.endswith("on CPUs {}".format(cpu)))
+        self.assertEqual(
+            self.scheduler.run_in_thread(lambda: os.sched_getaffinity(0)),
+            {cpu})
+        self.assertEqual(os.sched_getaffinity(0), main_cpus)
+
+    def test_denied_policy_degrades(self):
+        def denied(*args):
+            raise PermissionError("Operation not permitted")
+
+        with mock.patch('os.sched_setscheduler', denied), \
+                self.assertLogs('plasma.utils.runtime', 'WARNING'):
+            description = set_up_timing_thread(
+                policy='fifo', priority=50, scheduler=self.scheduler)
+        self.assertTrue(description.startswith("SCHED_OTHER priority 0"))
+
+    def spin_limit(self):
+        return self.scheduler.run_in_thread(
+            lambda: self.scheduler._clock.max_margin)
+
+    def test_realtime_policy_limits_spinning(self):
+        default = self.spin_limit()
+        set_up_timing_thread(scheduler=self.scheduler)
+        self.assertEqual(self.spin_limit(), default)
+
+        with mock.patch('os.sched_setscheduler'), \
+                mock.patch('os.sched_getscheduler',
+                           return_value=os.SCHED_FIFO):
+            set_up_timing_thread(
+                policy='fifo', priority=50, scheduler=self.scheduler)
+        self.assertEqual(self.spin_limit(), REALTIME_MAX_SPIN)
+        self.assertLess(REALTIME_MAX_SPIN, default)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            set_thread_scheduling(policy='deadline')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import threading
+import time
+import unittest
+
+import pytest
+
+from plasma.utils.scheduler import (
+    PRIORITY_HIGH, PRIORITY_LOW, Scheduler, next_deadline)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.addCleanup(self.scheduler.close)
+
+    def test_shared_is_one_instance(self):
+        self.assertIs(Scheduler.shared(), Scheduler.shared())
+
+    def test_thread_starts_with_the_first_task(self):
+        self.assertFalse(self.scheduler.is_running)
+        done = threading.Event()
+        self.scheduler.schedule(lambda deadline: done.set())
+        self.assertTrue(done.wait(1))
+        self.assertTrue(self.scheduler.is_running)
+
+    def test_callback_gets_its_deadline(self):
+        deadlines = []
+        done = threading.Event()
+
+        def callback(deadline):
+            deadlines.append((deadline, time.perf_counter()))
+            done.set()
+
+        deadline = time.perf_counter() + 0.02
+        self.scheduler.schedule(callback, deadline)
+        self.assertTrue(done.wait(1))
+        self.assertEqual(deadlines[0][0], deadline)
+        self.assertGreaterEqual(deadlines[0][1], deadline)
+
+    def test_due_tasks_run_in_priority_order(self):
+        order = []
+        done = threading.Event()
+        deadline = time.perf_counter() + 0.05
+        self.scheduler.schedule(
+            lambda _: order.append('low') or done.set(), deadline,
+            priority=PRIORITY_LOW)
+        self.scheduler.schedule(
+            lambda _: order.append('high'), deadline,
+            priority=PRIORITY_HIGH)
+        self.assertTrue(done.wait(1))
+        self.assertEqual(order, ['high', 'low'])
+
+    @pytest.mark.flaky(reruns=3)
+    def test_periodic_task_does_not_drift(self):
+        calls = []
+
+        def callback(deadline):
+            calls.append((deadline, time.perf_counter()))
+            return next_deadline(deadline, 0.01)
+
+        self.scheduler.schedule(callback)
+        time.sleep(0.5)
+        self.assertGreater(len(calls), 45)
+        deadlines = [deadline for deadline, _ in calls]
+        for n, deadline in enumerate(deadlines):
+            self.assertAlmostEqual(deadline, deadlines[0] + n * 0.01)
+        errors = sorted(t - deadline for deadline, t in calls)
+        self.assertGreaterEqual(errors[0], 0)
+        self.assertLess(errors[len(errors) // 2], 1e-3)
+
+    def test_periodic_callback(self):
+        calls = []
+        task = self.scheduler.schedule_periodic(
+            lambda: calls.append(time.perf_counter()), 0.01)
+        time.sleep(0.1)
+        task.cancel()
+        self.assertGreater(len(calls), 5)
+
+    def test_cancel_waits_for_a_running_callback(self):
+        calls = []
+        entered = threading.Event()
+
+        def callback(deadline):
+            entered.set()
+            time.sleep(0.05)
+            calls.append(deadline)
+            return deadline
+
+        task = self.scheduler.schedule(callback)
+        self.assertTrue(entered.wait(1))
+        task.cancel()
+        count = len(calls)
+        self.assertEqual(count, 1)
+        time.sleep(0.05)
+        self.assertEqual(len(calls), count)
+        self.assertFalse(task.is_active)
+
+    def test_reschedule_revives_a_finished_task(self):
+        calls = []
+        task = self.scheduler.schedule(calls.append)
+        time.sleep(0.02)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(task.is_active)
+        task.reschedule(time.perf_counter())
+        time.sleep(0.02)
+        self.assertEqual(len(calls), 2)
+
+    def test_reschedule_moves_a_pending_call(self):
+        calls = []
+        task = self.scheduler.schedule(
+            calls.append, time.perf_counter() + 10)
+        task.reschedule(time.perf_counter())
+        time.sleep(0.02)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(task.is_active)
+
+    def test_failing_task_is_dropped(self):
+        calls = []
+
+        def fail(deadline):
+            raise RuntimeError("boom")
+
+        with self.assertLogs('plasma.utils.scheduler', 'ERROR'):
+            failing = self.scheduler.schedule(fail)
+            self.scheduler.schedule(calls.append, time.perf_counter() + 0.01)
+            time.sleep(0.05)
+        self.assertFalse(failing.is_active)
+        self.assertEqual(len(calls), 1)
+
+    def test_next_deadline_resyncs_after_a_stall(self):
+        now = time.perf_counter()
+        self.assertEqual(next_deadline(now, 1.0), now + 1.0)
+        stalled = next_deadline(now - 10, 1.0)
+        self.assertGreaterEqual(stalled, now)
+        self.assertLess(stalled, now + 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
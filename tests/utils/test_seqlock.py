@@ -0,0 +1,70 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import multiprocessing
+import threading
+import unittest
+
+from plasma.utils.seqlock import SeqlockBlock
+
+
+class TestSeqlockBlock(unittest.TestCase):
+
+    def block(self, fields=('a', 'b')) -> SeqlockBlock:
+        buffer = multiprocessing.RawArray('B', SeqlockBlock.size(len(fields)))
+        return SeqlockBlock(fields, buffer)
+
+    def test_write_and_read(self):
+        block = self.block()
+        sequence, values, counters = block.read()
+        self.assertEqual((sequence, values, counters), (0, (0, 0), (0, 0)))
+        block.write('b', 2.5)
+        block.write('b', 2.5)
+        sequence, values, counters = block.read()
+        self.assertEqual(sequence, 4)
+        self.assertEqual(values, (0, 2.5))
+        self.assertEqual(counters, (0, 2))
+        self.assertEqual(block.sequence, sequence)
+
+    def test_buffer_too_small(self):
+        with self.assertRaises(ValueError):
+            SeqlockBlock(('a', 'b'), bytearray(SeqlockBlock.size(1)))
+
+    def test_reads_are_consistent(self):
+        block = self.block()
+        done = threading.Event()
+
+        def write():
+            for i in range(20000):
+                block.write('a', i)
+                block.write('b', i)
+            done.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not done.is_set():
+            _, (a, b), (count_a, count_b) = block.read()
+            # Field a is always written first
+            self.assertIn(a - b, (0, 1))
+            self.assertEqual(count_a - count_b, a - b)
+        writer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
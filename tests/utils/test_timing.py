@@ -0,0 +1,70 @@
+#
+# Copyright 2018, Michael McCoy <michael.b.mccoy@gmail.com>
+#
+#
+# This file is part of the CdF Plasma Controller.
+#
+# The CdF Plasma Controller is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# CdF Plasma Controller is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with the Cdf Plasma Controller.  If not, see
+# <http://www.gnu.org/licenses/>.
+import threading
+import time
+import unittest
+
+from plasma.utils.timing import DeadlineClock
+
+
+class TestDeadlineClock(unittest.TestCase):
+
+    def test_never_returns_before_the_deadline(self):
+        clock = DeadlineClock()
+        for delay in (0.0, 0.0005, 0.003, 0.01):
+            deadline = time.perf_counter() + delay
+            self.assertTrue(clock.wait_until(deadline))
+            self.assertGreaterEqual(time.perf_counter(), deadline)
+
+    def test_interrupt(self):
+        clock = DeadlineClock()
+        interrupt = threading.Event()
+        threading.Timer(0.02, interrupt.set).start()
+        start = time.perf_counter()
+        self.assertFalse(clock.wait_until(start + 5, interrupt))
+        self.assertLess(time.perf_counter() - start, 1)
+        # Already interrupted: returns during the spin, too
+        self.assertFalse(
+            clock.wait_until(time.perf_counter() + 1e-4, interrupt))
+
+    def test_margin_tracks_wakeup_latency(self):
+        clock = DeadlineClock(min_margin=1e-4, max_margin=1e-3)
+        self.assertEqual(clock.margin, 1e-3)
+        for latency in [0.0] * 200:
+            clock._update_margin(latency)
+        self.assertEqual(clock.margin, 1e-4)
+        clock._update_margin(3e-4)
+        self.assertEqual(clock.margin, 6e-4)
+        clock._update_margin(1.0)
+        self.assertEqual(clock.margin, 1e-3)
+
+    def test_max_margin(self):
+        clock = DeadlineClock(min_margin=1e-4, max_margin=1e-3)
+        clock.max_margin = 5e-5
+        self.assertEqual(clock.margin, 5e-5)
+        clock._update_margin(1.0)
+        self.assertEqual(clock.margin, 5e-5)
+        for latency in [0.0] * 200:
+            clock._update_margin(latency)
+        self.assertEqual(clock.margin, 5e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()